@@ -0,0 +1,53 @@
+"""Latencia de /tracker/nearest sobre la grilla en memoria.
+
+Uso (desde backend/):  python -m benchmarks.bench_cercanos [vehiculos] [consultas]
+"""
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+from core.espacial import GrillaEspacial, haversine_km
+
+TIPOS = ("camion", "utilitario", "semi")
+
+def _grilla(n: int) -> GrillaEspacial:
+    random.seed(42)
+    grilla = GrillaEspacial(14)
+    ahora = datetime.now(timezone.utc)
+    for i in range(n):
+        # Flota concentrada en la región centro de Argentina
+        lat = random.gauss(-32.5, 2.0)
+        lng = random.gauss(-61.5, 2.5)
+        grilla.actualizar(i, lat, lng, {
+            "vehiculo_id": i,
+            "vehiculo_activo": True,
+            "tipo_vehiculo": TIPOS[i % len(TIPOS)],
+            "last_seen": ahora,
+        })
+    return grilla
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    consultas = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    grilla = _grilla(n)
+    filtro = lambda d: d.get("tipo_vehiculo") == "camion"
+    puntos = [(random.gauss(-32.5, 2.5), random.gauss(-61.5, 3.0)) for _ in range(consultas)]
+
+    inicio = time.perf_counter()
+    for lat, lng in puntos:
+        grilla.cercanos(lat, lng, 5, filtro)
+    indice = (time.perf_counter() - inicio) / consultas
+
+    posiciones = [(i, grilla.posicion(i)) for i in range(n) if filtro(grilla.datos[i])]
+    inicio = time.perf_counter()
+    for lat, lng in puntos[:50]:
+        sorted(haversine_km(lat, lng, p[0], p[1]) for _, p in posiciones)[:5]
+    lineal = (time.perf_counter() - inicio) / 50
+
+    print(f"vehiculos={n} consultas={consultas} k=5")
+    print(f"grilla:  {indice * 1000:.3f} ms/consulta")
+    print(f"lineal:  {lineal * 1000:.3f} ms/consulta  (x{lineal / indice:.0f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Costo de CPU por fila: ORM -> pydantic -> JSON vs. tupla -> mapeo por nombres -> orjson.
+
+Uso (desde backend/):  python -m benchmarks.bench_serializacion [filas]
+"""
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+from core.serializacion import compilar_mapeo, serializar_filas
+from schemas.ubicacion_schema import UbicacionResponse
+
+CAMPOS = (
+    "id", "dispositivo_id", "latitud", "longitud", "velocidad",
+    "rumbo", "altitud", "precision", "timestamp",
+)
+
+def _filas(n: int):
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return [
+        (i, 1 + i % 50, -32.9 + i * 1e-5, -60.6 + i * 1e-5, 42.0, 180.0, 25.0, 5.0, base + timedelta(seconds=10 * i))
+        for i in range(n)
+    ]
+
+def ruta_anterior(filas):
+    objetos = [SimpleNamespace(**dict(zip(CAMPOS, f))) for f in filas]
+    inicio = time.perf_counter()
+    datos = [UbicacionResponse.model_validate(o).model_dump() for o in objetos]
+    # FastAPI vuelve a validar contra response_model y usa jsonable_encoder + json
+    validados = [UbicacionResponse.model_validate(d) for d in datos]
+    json.dumps(jsonable_encoder(validados)).encode("utf-8")
+    return time.perf_counter() - inicio
+
+def ruta_rapida(filas):
+    mapeo = compilar_mapeo(CAMPOS)
+    inicio = time.perf_counter()
+    orjson.dumps(serializar_filas(filas, mapeo))
+    return time.perf_counter() - inicio
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    filas = _filas(n)
+    anterior = min(ruta_anterior(filas) for _ in range(5))
+    rapida = min(ruta_rapida(filas) for _ in range(5))
+    print(f"filas={n}")
+    print(f"anterior: {anterior / n * 1e6:.2f} us/fila")
+    print(f"rapida:   {rapida / n * 1e6:.2f} us/fila  (x{anterior / rapida:.1f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import logging
+import math
+import time
+from typing import Any, Dict, Optional
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class ControlAdmision:
+    """Control de admisión de la ingesta sobre el pool primario.
+
+    La ingesta puede ocupar a lo sumo `limite` conexiones a la vez; el resto
+    del pool queda reservado para las lecturas de los dashboards. Además se
+    sigue la espera media para obtener conexión: si el pool ya está lento se
+    rechaza la ingesta antes de que se acumule. Un rechazo lleva el tiempo
+    sugerido para reintentar (Retry-After).
+    """
+
+    def __init__(self, limite: int, max_espera_seg: float, ventana_seg: float = 10.0, alfa: float = 0.2):
+        self.limite = limite
+        self.max_espera_seg = max_espera_seg
+        self.ventana_seg = ventana_seg
+        self.alfa = alfa
+        self.en_curso = 0
+        self.espera_media = 0.0
+        self._ultima_muestra = 0.0
+        self.admitidos = 0
+        self.rechazados = 0
+
+    def _espera_vigente(self) -> float:
+        # Sin muestras recientes la espera medida ya no describe el pool
+        if time.monotonic() - self._ultima_muestra > self.ventana_seg:
+            return 0.0
+        return self.espera_media
+
+    def admitir(self) -> Optional[int]:
+        """None si se admite (y ocupa un lugar); si no, segundos sugeridos para reintentar"""
+        espera = self._espera_vigente()
+        saturado = self.en_curso >= self.limite
+        # Con nada en curso siempre pasa uno, para volver a medir el pool
+        lento = espera > self.max_espera_seg and self.en_curso > 0
+        if saturado or lento:
+            self.rechazados += 1
+            sugerido = math.ceil(max(espera * 2, 1.0) * (1 + self.en_curso / self.limite))
+            return min(sugerido, settings.INGESTA_RETRY_AFTER_MAX_SEG)
+        self.en_curso += 1
+        self.admitidos += 1
+        return None
+
+    def liberar(self) -> None:
+        self.en_curso = max(self.en_curso - 1, 0)
+
+    def registrar_espera(self, segundos: float) -> None:
+        """Tiempo que tardó la ingesta en obtener una conexión del pool"""
+        if self._espera_vigente() == 0.0:
+            self.espera_media = segundos
+        else:
+            self.espera_media += self.alfa * (segundos - self.espera_media)
+        self._ultima_muestra = time.monotonic()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "limite": self.limite,
+            "en_curso": self.en_curso,
+            "espera_media_ms": round(self._espera_vigente() * 1000, 1),
+            "admitidos": self.admitidos,
+            "rechazados": self.rechazados,
+        }
+
+def _limite_ingesta() -> int:
+    capacidad = settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+    return max(1, int(capacidad * (1 - settings.INGESTA_RESERVA_LECTURA)))
+
+control_ingesta = ControlAdmision(_limite_ingesta(), settings.INGESTA_MAX_ESPERA_POOL_SEG)
@@ -0,0 +1,277 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import shutil
+import time
+from collections import OrderedDict
+from datetime import date
+from itertools import islice
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class MicroCache:
+    """Single-flight + caché de vida corta para endpoints consultados por polling.
+
+    Peticiones concurrentes con la misma clave comparten una sola consulta en
+    curso; el resultado se reutiliza durante `ttl` segundos o hasta que la
+    ingesta lo invalida. La carga sobre la base escala con las consultas
+    distintas, no con la cantidad de dashboards abiertos.
+
+    La consulta compartida corre en su propia tarea: que se cancele quien la
+    inició no la corta para los demás. Por eso el productor no debe usar la
+    sesión de un request, sino abrir la suya.
+    """
+
+    def __init__(self, ttl: float = 1.0, max_entradas: int = 10000):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._valores: Dict[Hashable, Tuple[float, Any]] = {}
+        self._en_curso: Dict[Hashable, asyncio.Task] = {}
+        # Consultas en curso invalidadas: siguen sirviendo a sus esperas, pero no se guardan
+        self._descartar: Set[asyncio.Task] = set()
+        self.aciertos = 0
+        self.fallos = 0
+        self.coalescidos = 0
+        self.invalidaciones = 0
+
+    async def obtener(self, clave: Hashable, productor: Callable[[], Awaitable[Any]]) -> Any:
+        entrada = self._valores.get(clave)
+        if entrada is not None and entrada[0] > time.monotonic():
+            self.aciertos += 1
+            return entrada[1]
+
+        tarea = self._en_curso.get(clave)
+        if tarea is not None:
+            self.coalescidos += 1
+        else:
+            self.fallos += 1
+            tarea = asyncio.ensure_future(productor())
+            self._en_curso[clave] = tarea
+            tarea.add_done_callback(lambda t: self._terminar(clave, t))
+        return await asyncio.shield(tarea)
+
+    def _terminar(self, clave: Hashable, tarea: asyncio.Task) -> None:
+        if self._en_curso.get(clave) is tarea:
+            del self._en_curso[clave]
+        if tarea in self._descartar:
+            self._descartar.discard(tarea)
+            return
+        # exception() también evita el warning si nadie quedó esperando el error
+        if tarea.cancelled() or tarea.exception() is not None:
+            return
+        if len(self._valores) >= self.max_entradas:
+            self._purgar()
+        self._valores[clave] = (time.monotonic() + self.ttl, tarea.result())
+
+    def invalidar(self, clave: Hashable) -> None:
+        self.invalidaciones += 1
+        self._valores.pop(clave, None)
+        tarea = self._en_curso.get(clave)
+        if tarea is not None:
+            self._descartar.add(tarea)
+
+    def invalidar_prefijo(self, prefijo: Hashable) -> None:
+        """Invalida todas las claves tupla cuyo primer elemento es `prefijo`"""
+        self.invalidaciones += 1
+        for clave in [c for c in self._valores if isinstance(c, tuple) and c[0] == prefijo]:
+            del self._valores[clave]
+        for clave, tarea in self._en_curso.items():
+            if isinstance(clave, tuple) and clave[0] == prefijo:
+                self._descartar.add(tarea)
+
+    def _purgar(self) -> None:
+        ahora = time.monotonic()
+        for clave in [c for c, (expira, _) in self._valores.items() if expira <= ahora]:
+            del self._valores[clave]
+        # Si sigue llena, descartar las entradas más viejas (orden de inserción)
+        sobrantes = len(self._valores) - self.max_entradas * 3 // 4
+        if sobrantes > 0:
+            for clave in list(islice(self._valores, sobrantes)):
+                del self._valores[clave]
+
+    def estadisticas(self) -> Dict[str, Any]:
+        consultas = self.aciertos + self.fallos + self.coalescidos
+        return {
+            "ttl": self.ttl if math.isfinite(self.ttl) else None,
+            "entradas": len(self._valores),
+            "en_curso": len(self._en_curso),
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "coalescidos": self.coalescidos,
+            "invalidaciones": self.invalidaciones,
+            "ratio_aciertos": round((self.aciertos + self.coalescidos) / consultas, 4) if consultas else 0.0,
+        }
+
+class CacheDias:
+    """Respuestas ya codificadas de días cerrados: LRU en memoria (por bytes) + copia en disco.
+
+    La clave incluye una huella del contenido del día (cantidad de fixes e id
+    máximo), así un fix atrasado cambia la clave incluso en otros workers; la
+    ingesta además borra las entradas viejas del día con `invalidar`. El
+    digest de la clave sirve como ETag fuerte. Lo que queda en disco con
+    huellas viejas o días que nadie pide lo borra `barrer` por antigüedad de
+    uso y tamaño total.
+    """
+
+    def __init__(self, directorio: str, max_bytes: int, max_bytes_disco: int = 0, max_edad_disco_seg: float = 0.0):
+        self.directorio = Path(directorio)
+        self.max_bytes = max_bytes
+        self.max_bytes_disco = max_bytes_disco
+        self.max_edad_disco_seg = max_edad_disco_seg
+        self._memoria: "OrderedDict[Tuple[int, date, str], Tuple[bytes, str]]" = OrderedDict()
+        self._bytes = 0
+        self.aciertos_memoria = 0
+        self.aciertos_disco = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+        self.barridos = 0
+        self.borrados_disco = 0
+
+    @staticmethod
+    def digest(clave: Hashable) -> str:
+        return hashlib.sha256(repr(clave).encode()).hexdigest()[:32]
+
+    def _ruta(self, dispositivo_id: int, dia: date, digest: str) -> Path:
+        return self.directorio / str(dispositivo_id) / dia.isoformat() / digest
+
+    @staticmethod
+    def _leer(ruta: Path) -> Optional[Tuple[bytes, str]]:
+        try:
+            datos = ruta.read_bytes()
+        except OSError:
+            return None
+        try:
+            # La fecha de modificación marca el último uso para barrer
+            os.utime(ruta)
+        except OSError:
+            pass
+        media_type, _, contenido = datos.partition(b"\n")
+        return contenido, media_type.decode()
+
+    @staticmethod
+    def _escribir(ruta: Path, contenido: bytes, media_type: str) -> None:
+        try:
+            ruta.parent.mkdir(parents=True, exist_ok=True)
+            temporal = ruta.with_suffix(f".{os.getpid()}.tmp")
+            temporal.write_bytes(media_type.encode() + b"\n" + contenido)
+            os.replace(temporal, ruta)
+        except OSError as e:
+            logger.warning(f"No se pudo guardar en disco la caché de días: {e}")
+
+    def _guardar_memoria(self, clave: Tuple[int, date, str], entrada: Tuple[bytes, str]) -> None:
+        if len(entrada[0]) > self.max_bytes:
+            return
+        self._memoria[clave] = entrada
+        self._bytes += len(entrada[0])
+        while self._bytes > self.max_bytes:
+            _, (contenido, _) = self._memoria.popitem(last=False)
+            self._bytes -= len(contenido)
+
+    async def obtener(self, dispositivo_id: int, dia: date, digest: str,
+                      productor: Callable[[], Awaitable[Tuple[bytes, str]]]) -> Tuple[bytes, str]:
+        """(contenido, media_type) desde memoria, disco o el productor, en ese orden"""
+        clave = (dispositivo_id, dia, digest)
+        entrada = self._memoria.get(clave)
+        if entrada is not None:
+            self._memoria.move_to_end(clave)
+            self.aciertos_memoria += 1
+            return entrada
+
+        ruta = self._ruta(dispositivo_id, dia, digest)
+        entrada = await asyncio.to_thread(self._leer, ruta)
+        if entrada is not None:
+            self.aciertos_disco += 1
+        else:
+            self.fallos += 1
+            entrada = await productor()
+            await asyncio.to_thread(self._escribir, ruta, entrada[0], entrada[1])
+        self._guardar_memoria(clave, entrada)
+        return entrada
+
+    async def invalidar(self, dispositivo_id: int, dia: date) -> None:
+        """Descartar todo lo guardado del dispositivo en ese día (llegó un fix atrasado)"""
+        self.invalidaciones += 1
+        for clave in [c for c in self._memoria if c[0] == dispositivo_id and c[1] == dia]:
+            contenido, _ = self._memoria.pop(clave)
+            self._bytes -= len(contenido)
+        await asyncio.to_thread(
+            shutil.rmtree, self.directorio / str(dispositivo_id) / dia.isoformat(), ignore_errors=True
+        )
+
+    def barrer(self) -> Dict[str, int]:
+        """Borrar del disco lo no usado en max_edad_disco_seg y, si aún se supera
+        max_bytes_disco, lo usado hace más tiempo hasta quedar en 3/4. Bloqueante."""
+        archivos = []
+        for ruta in self.directorio.glob("*/*/*"):
+            try:
+                info = ruta.stat()
+            except OSError:
+                continue
+            archivos.append((info.st_mtime, info.st_size, ruta))
+
+        limite = time.time() - self.max_edad_disco_seg
+        borrar = [a for a in archivos if self.max_edad_disco_seg and a[0] < limite]
+        vigentes = sorted(a for a in archivos if not (self.max_edad_disco_seg and a[0] < limite))
+        total = sum(tamano for _, tamano, _ in vigentes)
+        if self.max_bytes_disco and total > self.max_bytes_disco:
+            objetivo = self.max_bytes_disco * 3 // 4
+            for archivo in vigentes:
+                if total <= objetivo:
+                    break
+                borrar.append(archivo)
+                total -= archivo[1]
+
+        for _, _, ruta in borrar:
+            try:
+                ruta.unlink()
+            except OSError:
+                pass
+        # Directorios de día y de dispositivo que quedaron vacíos (rmdir falla si no lo están)
+        for directorio in [*self.directorio.glob("*/*"), *self.directorio.glob("*")]:
+            try:
+                directorio.rmdir()
+            except OSError:
+                pass
+
+        self.barridos += 1
+        self.borrados_disco += len(borrar)
+        return {"archivos": len(archivos), "borrados": len(borrar), "bytes": total}
+
+    async def ejecutar_barrido(self, intervalo_seg: float) -> None:
+        """Tarea de fondo: barre el disco cada `intervalo_seg` en un hilo"""
+        while True:
+            try:
+                resultado = await asyncio.to_thread(self.barrer)
+                if resultado["borrados"]:
+                    logger.info(f"Caché de días en disco: {resultado['borrados']} archivo(s) borrado(s), {resultado['bytes']} bytes en uso")
+            except Exception as e:
+                logger.error(f"Error barriendo la caché de días: {e}")
+            await asyncio.sleep(intervalo_seg)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "entradas_memoria": len(self._memoria),
+            "bytes_memoria": self._bytes,
+            "aciertos_memoria": self.aciertos_memoria,
+            "aciertos_disco": self.aciertos_disco,
+            "fallos": self.fallos,
+            "invalidaciones": self.invalidaciones,
+            "barridos": self.barridos,
+            "borrados_disco": self.borrados_disco,
+        }
+
+# Caché compartida por /tiempo-real y /ultima-ubicacion; la ingesta invalida la última ubicación
+cache_polling = MicroCache(settings.MICROCACHE_TTL)
+
+# Recorridos e historiales de días cerrados
+cache_dias = CacheDias(
+    settings.CACHE_DIAS_DIR,
+    settings.CACHE_DIAS_MAX_MB_MEMORIA * 1024 * 1024,
+    settings.CACHE_DIAS_MAX_MB_DISCO * 1024 * 1024,
+    settings.CACHE_DIAS_MAX_DIAS_DISCO * 86400,
+)
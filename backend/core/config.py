@@ -1,6 +1,7 @@
 from pydantic_settings import BaseSettings
 from typing import Optional
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv("SistemaLogistico-tracking/.env")
@@ -9,6 +10,22 @@ class Settings(BaseSettings):
     # Database 
     URL_DATABASE: str = os.getenv("DATABASE_URL")
     TEST_DB_URL: Optional[str] = None
+    # Réplica de solo lectura opcional para los GET
+    URL_DATABASE_LECTURA: Optional[str] = os.getenv("READ_DATABASE_URL")
+    
+    # Pool de conexiones (por engine y por worker)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    # Caché de sentencias preparadas de asyncpg; 0 si hay PgBouncer en modo transacción
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    # Retraso de replicación tolerado antes de leer del primario
+    DB_LECTURA_MAX_RETRASO_SEG: float = 2.0
+    DB_LECTURA_VERIFICACION_SEG: float = 5.0
+    # Arranque rápido: solo se lee la versión del esquema y se migra si está atrasada;
+    # en False cada arranque corre alembic upgrade head
+    DB_INICIO_RAPIDO: bool = True
     
     # API
     API_V1_PREFIX: str = "/api/v1"
@@ -19,6 +36,99 @@ class Settings(BaseSettings):
     # Logging
     LOG_LEVEL: str = "INFO"
     
+    # WebSocket de posiciones en vivo
+    WS_MAX_PENDIENTES: int = 1000
+    # Canal LISTEN/NOTIFY con que cada worker reparte sus fixes a los hubs de los demás
+    # (vacío = reparto solo dentro del proceso, válido únicamente con un worker)
+    WS_CANAL_NOTIFY: str = "posiciones_en_vivo"
+    WS_MAX_EN_ESPERA: int = 10000
+    
+    # Segundos que se confía en la versión de flota en memoria antes de releerla
+    FLOTA_VERSION_TTL: float = 1.0
+    
+    # Micro-caché de endpoints de polling (segundos)
+    MICROCACHE_TTL: float = 1.0
+    
+    # Viewport: niveles de la grilla espacial y zoom desde el que se devuelven marcadores
+    VIEWPORT_ZOOM_MAX: int = 14
+    VIEWPORT_ZOOM_MARCADORES: int = 13
+    # Nivel de la grilla usado para buscar vehículos cercanos (~10 km por celda)
+    CERCANOS_ZOOM: int = 10
+    
+    # Geocercas
+    GEOCERCAS_CELDA_GRADOS: float = 0.05
+    GEOCERCAS_RECARGA_SEG: float = 60.0
+    GEOCERCAS_LOTE_REPRODUCCION: int = 5000
+    
+    # Reglas de streaming (exceso de velocidad, ralentí, detención, sin señal)
+    REGLAS_HISTERESIS_KMH: float = 5.0
+    REGLAS_UMBRAL_DETENIDO_KMH: float = 3.0
+    REGLAS_RALENTI_MIN: float = 10.0
+    REGLAS_SIN_REPORTE_MIN: float = 15.0
+    REGLAS_REVISION_SEG: float = 30.0
+    REGLAS_CONFIG_TTL: float = 300.0
+    
+    # Reproducción de historial
+    REPRODUCCION_MAX_FRAMES: int = 200000
+    REPRODUCCION_MAX_DIAS: int = 31
+    REPRODUCCION_MAX_PUNTOS_LECTURA: int = 1000000
+    REPRODUCCION_FRAMES_POR_BLOQUE: int = 300
+    REPRODUCCION_MAX_SESIONES: int = 32
+    REPRODUCCION_TTL_SEG: float = 1800.0
+    
+    # Resúmenes horarios / diarios por dispositivo
+    RESUMENES_ZONA_HORARIA: str = "America/Argentina/Buenos_Aires"
+    RESUMENES_MAX_HUECO_SEG: float = 600.0
+    RESUMENES_BACKFILL_LOTE: int = 200
+    RESUMENES_BACKFILL_PARALELO: int = 4
+    # Minutos tras el fin de un día local para considerarlo cerrado (margen para fixes atrasados)
+    DIA_CERRADO_GRACIA_MIN: float = 120.0
+    
+    # Mapa de calor por teselas
+    HEATMAP_TTL_SEG: float = 60.0
+    HEATMAP_MAX_DIAS: int = 31
+    HEATMAP_MAX_TESELAS_CERRADAS: int = 50000
+    
+    # Recorridos de varios vehículos en una sola consulta
+    RECORRIDOS_MAX_VEHICULOS: int = 500
+    RECORRIDOS_MAX_PUNTOS: int = 200000
+    RECORRIDOS_MAX_PUNTOS_LECTURA: int = 1000000
+    
+    # Caché de recorridos/historiales de días cerrados (memoria + disco)
+    CACHE_DIAS_DIR: str = os.path.join(tempfile.gettempdir(), "tracking-dias")
+    CACHE_DIAS_MAX_MB_MEMORIA: int = 64
+    CACHE_DIAS_MAX_AGE_SEG: int = 86400
+    # Disco: se borra lo no usado en N días y, si aún supera el tope, lo usado hace más tiempo
+    CACHE_DIAS_MAX_MB_DISCO: int = 1024
+    CACHE_DIAS_MAX_DIAS_DISCO: float = 30.0
+    CACHE_DIAS_BARRIDO_SEG: float = 3600.0
+    
+    # Ingesta por lotes (reenvíos del forwarder)
+    INGESTA_MAX_LOTE: int = 500
+    
+    # Ventana de reordenamiento por dispositivo (ráfagas de fixes desordenados)
+    REORDEN_ESPERA_SEG: float = 0.05
+    
+    # Filtro de plausibilidad y suavizado de fixes (ingesta y limpieza de historial)
+    FILTRO_MAX_VELOCIDAD_KMH: float = 250.0
+    FILTRO_MAX_ACELERACION_MS2: float = 4.0
+    FILTRO_RADIO_DETENIDO_M: float = 30.0
+    FILTRO_MAX_RECHAZOS: int = 3
+    
+    # Control de admisión de la ingesta (429 + Retry-After al saturarse)
+    INGESTA_RESERVA_LECTURA: float = 0.3     # fracción del pool primario reservada a lecturas
+    INGESTA_MAX_ESPERA_POOL_SEG: float = 0.5
+    INGESTA_RETRY_AFTER_MAX_SEG: int = 30
+    
+    # Importación masiva de flota (CSV / NDJSON): filas por sentencia y transacción
+    IMPORTACION_LOTE: int = 1000
+    
+    # Métricas por ruta (/metrics): requests más lentos que esto se loguean con su SQL (0 = apagado)
+    METRICAS_REQUEST_LENTO_MS: float = 0.0
+    METRICAS_MAX_SENTENCIAS: int = 50
+    # Tiempo máximo del SELECT 1 de /health
+    HEALTH_TIMEOUT_SEG: float = 2.0
+    
     def get_database_url(self) -> str:
         if os.getenv("TESTING") == "1" and self.TEST_DB_URL:
             return self.TEST_DB_URL
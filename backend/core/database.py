@@ -1,29 +1,52 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
+from sqlalchemy import text
+from fastapi import HTTPException
 from core.config import settings
+from core.admision import control_ingesta
+from core.metricas import MetricasDB, clase_pool
+import asyncio
 import logging
-from typing import AsyncGenerator
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Dict, Optional
 
 logger = logging.getLogger(__name__)
 
-original_url = settings.get_database_url()
+def _normalizar_url(original_url: str) -> str:
+    if original_url and original_url.startswith("postgres://"):
+        database_url = original_url.replace("postgres://", "postgresql+asyncpg://", 1)
+    elif original_url and original_url.startswith("postgresql://"):
+        database_url = original_url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    else:
+        database_url = original_url
 
-if original_url and original_url.startswith("postgres://"):
-    database_url = original_url.replace("postgres://", "postgresql+asyncpg://", 1)
-elif original_url and original_url.startswith("postgresql://"):
-    database_url = original_url.replace("postgresql://", "postgresql+asyncpg://", 1)
-else:
-    database_url = original_url
+    if "?" in database_url:
+        database_url = database_url.split("?")[0]
 
-if "?" in database_url:
-    database_url = database_url.split("?")[0]
+    # Caché de sentencias preparadas del dialecto (la de asyncpg va en connect_args)
+    return f"{database_url}?prepared_statement_cache_size={settings.DB_STATEMENT_CACHE_SIZE}"
 
-engine = create_async_engine(
-    database_url, 
-    echo=settings.DEBUG,
-    pool_pre_ping=True,
-    connect_args={"ssl": "require"}
-)
+# Consultas, tiempo de base y espera de pool por engine (ver /metrics)
+metricas_db: Dict[str, MetricasDB] = {}
+
+def _crear_engine(url: str, nombre: str):
+    metricas = metricas_db[nombre] = MetricasDB()
+    nuevo = create_async_engine(
+        _normalizar_url(url),
+        echo=settings.DEBUG,
+        pool_pre_ping=True,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        connect_args={"ssl": "require", "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE},
+        poolclass=clase_pool(metricas)
+    )
+    metricas.instrumentar(nuevo)
+    return nuevo
+
+engine = _crear_engine(settings.get_database_url(), "primario")
 
 AsyncSessionLocal = async_sessionmaker(
     engine, 
@@ -31,6 +54,60 @@ AsyncSessionLocal = async_sessionmaker(
     expire_on_commit=False
 )
 
+# Réplica de lectura opcional; sin READ_DATABASE_URL todo va al primario
+engine_lectura = _crear_engine(settings.URL_DATABASE_LECTURA, "lectura") if settings.URL_DATABASE_LECTURA else None
+
+AsyncSessionLecturaLocal = async_sessionmaker(
+    engine_lectura,
+    class_=AsyncSession,
+    expire_on_commit=False
+) if engine_lectura is not None else None
+
+class EstadoReplica:
+    """Retraso de replicación medido; se vuelve a medir cada DB_LECTURA_VERIFICACION_SEG"""
+
+    def __init__(self):
+        self.disponible = engine_lectura is not None
+        self.retraso_seg: Optional[float] = None
+        self.verificado_en: Optional[float] = None
+        self.lecturas_replica = 0
+        self.lecturas_primario = 0
+        self.errores = 0
+        self._lock = asyncio.Lock()
+
+estado_replica = EstadoReplica()
+
+SQL_RETRASO_REPLICA = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+async def _replica_vigente() -> bool:
+    """True si la réplica responde y su retraso está dentro de DB_LECTURA_MAX_RETRASO_SEG"""
+    if engine_lectura is None:
+        return False
+    if estado_replica.verificado_en is not None and time.monotonic() - estado_replica.verificado_en < settings.DB_LECTURA_VERIFICACION_SEG:
+        return estado_replica.disponible
+
+    async with estado_replica._lock:
+        if estado_replica.verificado_en is not None and time.monotonic() - estado_replica.verificado_en < settings.DB_LECTURA_VERIFICACION_SEG:
+            return estado_replica.disponible
+        try:
+            async with engine_lectura.connect() as conn:
+                retraso = float((await conn.execute(SQL_RETRASO_REPLICA)).scalar() or 0.0)
+            estado_replica.retraso_seg = retraso
+            disponible = retraso <= settings.DB_LECTURA_MAX_RETRASO_SEG
+            if disponible != estado_replica.disponible:
+                logger.warning(f"Réplica de lectura {'habilitada' if disponible else 'atrasada'}: retraso {retraso:.1f}s")
+            estado_replica.disponible = disponible
+        except Exception as e:
+            estado_replica.errores += 1
+            if estado_replica.disponible:
+                logger.error(f"Réplica de lectura no disponible, se lee del primario: {e}")
+            estado_replica.disponible = False
+        estado_replica.verificado_en = time.monotonic()
+        return estado_replica.disponible
+
 Base = declarative_base()
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
@@ -44,16 +121,103 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         finally:
             await session.close()
 
-async def init_db():
-    async with engine.begin() as conn:
+async def get_db_lectura() -> AsyncGenerator[AsyncSession, None]:
+    """Sesión para consultas de solo lectura: réplica si está al día, si no el primario"""
+    if await _replica_vigente():
+        estado_replica.lecturas_replica += 1
+        fabrica = AsyncSessionLecturaLocal
+    else:
+        estado_replica.lecturas_primario += 1
+        fabrica = AsyncSessionLocal
+
+    async with fabrica() as session:
         try:
-            from models import vehiculo, dispositivo, ubicacion
-        except ImportError:
-             pass
-             
-        await conn.run_sync(Base.metadata.create_all)
-        logger.info("Base de datos inicializada correctamente")
+            yield session
+        except Exception as e:
+            logger.error(f"Error en sesión de lectura: {e}")
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+# La misma sesión de lectura fuera de un endpoint, p. ej. para la consulta compartida de una MicroCache
+sesion_lectura = asynccontextmanager(get_db_lectura)
+
+async def get_db_ingesta() -> AsyncGenerator[AsyncSession, None]:
+    """Sesión para la ingesta con control de admisión: 429 si el pool está saturado o lento"""
+    reintentar = control_ingesta.admitir()
+    if reintentar is not None:
+        raise HTTPException(
+            status_code=429,
+            detail="Ingesta saturada, reintentar más tarde",
+            headers={"Retry-After": str(reintentar)},
+        )
+
+    try:
+        async with AsyncSessionLocal() as session:
+            inicio = time.monotonic()
+            await session.connection()
+            control_ingesta.registrar_espera(time.monotonic() - inicio)
+            try:
+                yield session
+            except Exception as e:
+                logger.error(f"Error en sesión de ingesta: {e}")
+                await session.rollback()
+                raise
+            finally:
+                await session.close()
+    finally:
+        control_ingesta.liberar()
+
+def _metricas_pool(pool) -> Dict[str, Any]:
+    capacidad = pool.size() + settings.DB_MAX_OVERFLOW
+    en_uso = pool.checkedout()
+    return {
+        "tamano": pool.size(),
+        "libres": pool.checkedin(),
+        "en_uso": en_uso,
+        "overflow": max(pool.overflow(), 0),
+        "capacidad": capacidad,
+        "utilizacion": round(en_uso / capacidad, 4) if capacidad else 0.0,
+    }
+
+def metricas_pools() -> Dict[str, Any]:
+    """Uso de cada pool de conexiones y estado de la réplica"""
+    metricas = {"primario": _metricas_pool(engine.pool)}
+    if engine_lectura is not None:
+        metricas["lectura"] = {
+            **_metricas_pool(engine_lectura.pool),
+            "disponible": estado_replica.disponible,
+            "retraso_seg": estado_replica.retraso_seg,
+            "errores": estado_replica.errores,
+        }
+    metricas["ingesta"] = control_ingesta.estadisticas()
+    metricas["lecturas"] = {
+        "replica": estado_replica.lecturas_replica,
+        "primario": estado_replica.lecturas_primario,
+    }
+    return metricas
+
+async def verificar_db() -> Dict[str, Any]:
+    """SELECT 1 contra el primario con HEALTH_TIMEOUT_SEG: alcanzable y latencia (incluye la espera del pool)"""
+    async def consultar():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    inicio = time.perf_counter()
+    try:
+        await asyncio.wait_for(consultar(), settings.HEALTH_TIMEOUT_SEG)
+        return {"alcanzable": True, "latencia_ms": round((time.perf_counter() - inicio) * 1000, 1)}
+    except Exception as e:
+        return {"alcanzable": False, "error": f"{type(e).__name__}: {e}".rstrip(": ")}
+
+async def init_db() -> str:
+    """Dejar el esquema al día al arrancar (migraciones Alembic, ver core.migraciones)"""
+    from core.migraciones import asegurar_esquema
+    return await asegurar_esquema(engine, settings.DB_INICIO_RAPIDO)
 
 async def close_db():
     await engine.dispose()
+    if engine_lectura is not None:
+        await engine_lectura.dispose()
     logger.info("Conexiones de base de datos cerradas")
\ No newline at end of file
@@ -0,0 +1,20 @@
+import importlib.util
+import sys
+from types import ModuleType
+
+def importar_diferido(nombre: str) -> ModuleType:
+    """Módulo que se carga recién al usar su primer atributo.
+
+    Para dependencias pesadas (numpy) que solo usan endpoints puntuales: no
+    suman al tiempo de arranque de cada worker. Las anotaciones de tipos que
+    las referencien deben quedar diferidas (from __future__ import annotations).
+    """
+    if nombre in sys.modules:
+        return sys.modules[nombre]
+    spec = importlib.util.find_spec(nombre)
+    cargador = importlib.util.LazyLoader(spec.loader)
+    spec.loader = cargador
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nombre] = modulo
+    cargador.exec_module(modulo)
+    return modulo
@@ -0,0 +1,249 @@
+import heapq
+import logging
+import math
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (min_lng, min_lat, max_lng, max_lat)
+BBox = Tuple[float, float, float, float]
+Clave = Tuple[int, int]
+
+RADIO_TIERRA_KM = 6371.0
+KM_POR_GRADO = math.pi * RADIO_TIERRA_KM / 180.0
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Distancia de gran círculo en km"""
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = (math.sin(dlat / 2) ** 2 +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2) ** 2)
+    return 2 * RADIO_TIERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+class Celda:
+    __slots__ = ("ids", "suma_lat", "suma_lng")
+
+    def __init__(self):
+        self.ids: Set[int] = set()
+        self.suma_lat = 0.0
+        self.suma_lng = 0.0
+
+class GrillaEspacial:
+    """Índice en memoria de últimas posiciones en grillas uniformes por nivel de zoom.
+
+    El nivel z usa celdas de 360 / 2^(z+2) grados (~64 px con tiles de 256 px),
+    así un cluster por celda queda legible en pantalla. Cada fix actualiza una
+    celda por nivel: O(niveles) por fix, sin depender del tamaño de la flota.
+    Una consulta recorre solo las celdas visibles (o las ocupadas, si son menos).
+    """
+
+    def __init__(self, zoom_max: int = 14):
+        self.zoom_max = zoom_max
+        self._niveles: List[Dict[Clave, Celda]] = [{} for _ in range(zoom_max + 1)]
+        self._posiciones: Dict[int, Tuple[float, float]] = {}
+        self.datos: Dict[int, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._posiciones)
+
+    @staticmethod
+    def tamano_celda(zoom: int) -> float:
+        return 360.0 / (1 << (zoom + 2))
+
+    def _clave(self, zoom: int, lat: float, lng: float) -> Clave:
+        tamano = self.tamano_celda(zoom)
+        return (math.floor((lng + 180.0) / tamano), math.floor((lat + 90.0) / tamano))
+
+    def actualizar(self, id: int, lat: float, lng: float, datos: Optional[Dict[str, Any]] = None) -> None:
+        anterior = self._posiciones.get(id)
+        for zoom, nivel in enumerate(self._niveles):
+            clave = self._clave(zoom, lat, lng)
+            if anterior is not None:
+                clave_anterior = self._clave(zoom, anterior[0], anterior[1])
+                celda = nivel[clave_anterior]
+                celda.suma_lat -= anterior[0]
+                celda.suma_lng -= anterior[1]
+                if clave_anterior != clave:
+                    celda.ids.discard(id)
+                    if not celda.ids:
+                        del nivel[clave_anterior]
+            celda = nivel.get(clave)
+            if celda is None:
+                celda = nivel[clave] = Celda()
+            celda.ids.add(id)
+            celda.suma_lat += lat
+            celda.suma_lng += lng
+
+        self._posiciones[id] = (lat, lng)
+        if datos is not None:
+            self.datos[id] = datos
+
+    def eliminar(self, id: int) -> None:
+        anterior = self._posiciones.pop(id, None)
+        self.datos.pop(id, None)
+        if anterior is None:
+            return
+        for zoom, nivel in enumerate(self._niveles):
+            clave = self._clave(zoom, anterior[0], anterior[1])
+            celda = nivel[clave]
+            celda.ids.discard(id)
+            celda.suma_lat -= anterior[0]
+            celda.suma_lng -= anterior[1]
+            if not celda.ids:
+                del nivel[clave]
+
+    def posicion(self, id: int) -> Optional[Tuple[float, float]]:
+        return self._posiciones.get(id)
+
+    def celdas(self, zoom: int, bbox: BBox):
+        """Celdas ocupadas del nivel que intersectan el bbox"""
+        zoom = max(0, min(zoom, self.zoom_max))
+        nivel = self._niveles[zoom]
+        min_lng, min_lat, max_lng, max_lat = bbox
+        x0, y0 = self._clave(zoom, min_lat, min_lng)
+        x1, y1 = self._clave(zoom, max_lat, max_lng)
+
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(nivel):
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    celda = nivel.get((x, y))
+                    if celda is not None:
+                        yield (x, y), celda
+        else:
+            for clave, celda in nivel.items():
+                if x0 <= clave[0] <= x1 and y0 <= clave[1] <= y1:
+                    yield clave, celda
+
+    def en_bbox(self, bbox: BBox, filtro: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[int]:
+        """IDs con posición dentro del bbox"""
+        min_lng, min_lat, max_lng, max_lat = bbox
+        resultado = []
+        for _, celda in self.celdas(self.zoom_max, bbox):
+            for id in celda.ids:
+                lat, lng = self._posiciones[id]
+                if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng:
+                    if filtro is None or filtro(self.datos.get(id, {})):
+                        resultado.append(id)
+        return resultado
+
+    def clusters(self, bbox: BBox, zoom: int, filtro: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[Dict[str, Any]]:
+        """Un cluster por celda visible; las celdas con un solo elemento devuelven su id.
+
+        Sin filtro se usan las sumas de cada celda; con filtro se recorren sus
+        ids, y las celdas sin ninguno que pase no aparecen.
+        """
+        resultado = []
+        for _, celda in self.celdas(zoom, bbox):
+            if filtro is None:
+                ids = celda.ids
+                cantidad, suma_lat, suma_lng = len(ids), celda.suma_lat, celda.suma_lng
+            else:
+                ids = [id for id in celda.ids if filtro(self.datos.get(id, {}))]
+                cantidad = len(ids)
+                suma_lat = sum(self._posiciones[id][0] for id in ids)
+                suma_lng = sum(self._posiciones[id][1] for id in ids)
+            if cantidad == 0:
+                continue
+            if cantidad == 1:
+                id = next(iter(ids))
+                lat, lng = self._posiciones[id]
+                resultado.append({"id": id, "lat": lat, "lng": lng, "cantidad": 1})
+            else:
+                resultado.append({
+                    "lat": round(suma_lat / cantidad, 6),
+                    "lng": round(suma_lng / cantidad, 6),
+                    "cantidad": cantidad,
+                })
+        return resultado
+
+    def cercanos(
+        self,
+        lat: float,
+        lng: float,
+        k: int,
+        filtro: Optional[Callable[[Dict[str, Any]], bool]] = None,
+        zoom: int = 10,
+        radio_max_km: Optional[float] = None
+    ) -> List[Tuple[float, int]]:
+        """Los k más cercanos como (distancia_km, id), ordenados por distancia exacta.
+
+        Expande anillo por anillo desde la celda del punto y corta cuando la
+        k-ésima distancia encontrada es menor que la mínima posible de
+        cualquier celda del anillo siguiente.
+        """
+        zoom = max(0, min(zoom, self.zoom_max))
+        nivel = self._niveles[zoom]
+        if not nivel or k <= 0:
+            return []
+
+        tamano = self.tamano_celda(zoom)
+        cx, cy = self._clave(zoom, lat, lng)
+        # Columnas por vuelta: los anillos cruzan el antimeridiano módulo columnas
+        columnas = 1 << (zoom + 2)
+        cx %= columnas
+
+        def distancia_x(x: int) -> int:
+            dx = abs(x - cx) % columnas
+            return min(dx, columnas - dx)
+        # max-heap de tamaño k con (-distancia, id)
+        mejores: List[Tuple[float, int]] = []
+
+        def evaluar(celda: Celda) -> None:
+            for id in celda.ids:
+                if filtro is not None and not filtro(self.datos.get(id, {})):
+                    continue
+                plat, plng = self._posiciones[id]
+                distancia = haversine_km(lat, lng, plat, plng)
+                if radio_max_km is not None and distancia > radio_max_km:
+                    continue
+                if len(mejores) < k:
+                    heapq.heappush(mejores, (-distancia, id))
+                elif distancia < -mejores[0][0]:
+                    heapq.heapreplace(mejores, (-distancia, id))
+
+        anillo = 0
+        visitadas = 0
+        while True:
+            if anillo == 0:
+                claves = {(cx, cy)}
+            else:
+                xs = range(cx - anillo, cx + anillo + 1)
+                claves = {(x % columnas, cy - anillo) for x in xs}
+                claves |= {(x % columnas, cy + anillo) for x in xs}
+                for y in range(cy - anillo + 1, cy + anillo):
+                    claves.add(((cx - anillo) % columnas, y))
+                    claves.add(((cx + anillo) % columnas, y))
+                # Un anillo que da toda la vuelta repite columnas ya recorridas
+                claves = {(x, y) for x, y in claves if max(distancia_x(x), abs(y - cy)) == anillo}
+
+            # Si el anillo tiene más celdas que las ocupadas restantes, terminar recorriendo las ocupadas
+            if len(claves) > len(nivel) - visitadas:
+                for (x, y), celda in nivel.items():
+                    if max(distancia_x(x), abs(y - cy)) >= anillo:
+                        evaluar(celda)
+                break
+
+            for clave in claves:
+                celda = nivel.get(clave)
+                if celda is not None:
+                    visitadas += 1
+                    evaluar(celda)
+
+            # Cota inferior de distancia a cualquier punto fuera del anillo actual
+            lat_extrema = min(90.0, abs(lat) + (anillo + 1) * tamano)
+            km_por_grado_min = KM_POR_GRADO * math.cos(math.radians(lat_extrema))
+            cota_km = anillo * tamano * km_por_grado_min
+            if len(mejores) == k and -mejores[0][0] <= cota_km:
+                break
+            if radio_max_km is not None and cota_km > radio_max_km:
+                break
+            anillo += 1
+
+        return sorted((-d, id) for d, id in mejores)
+
+def bbox_tesela(z: int, x: int, y: int) -> BBox:
+    """Bbox de una tesela web mercator (esquema z/x/y de los mapas)"""
+    n = 1 << z
+    def lat(fila: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * fila / n))))
+    return (x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y))
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from core.diferido import importar_diferido
+from core.espacial import RADIO_TIERRA_KM, haversine_km
+
+logger = logging.getLogger(__name__)
+
+np = importar_diferido("numpy")
+
+# Decisión del filtro sobre un fix
+ACEPTADO = "aceptado"
+SUAVIZADO = "suavizado"
+RECHAZADO = "rechazado"
+
+# (lat, lng, marca_tiempo, velocidad)
+Punto = Tuple[float, float, datetime, Optional[float]]
+
+class _EstadoFiltro:
+    __slots__ = ("lat", "lng", "ts", "vel", "ancla_lat", "ancla_lng", "ancla_n", "rechazos")
+
+    def __init__(self, lat: float, lng: float, ts: float, vel: float):
+        self.lat = lat
+        self.lng = lng
+        self.ts = ts
+        self.vel = vel
+        self.ancla_lat: Optional[float] = None
+        self.ancla_lng: Optional[float] = None
+        self.ancla_n = 0
+        self.rechazos = 0
+
+class FiltroGPS:
+    """Filtro de plausibilidad por dispositivo, antes de guardar cada fix.
+
+    - Salto imposible: si desde el último fix aceptado la velocidad implícita
+      supera max_velocidad_kmh, o la aceleración implícita supera
+      max_aceleracion_ms2, el fix se rechaza. Tras max_rechazos seguidos se
+      acepta igual (el equipo realmente está en otro lugar).
+    - Detenido: con velocidad bajo velocidad_detenido_kmh y dentro de
+      radio_detenido_m del ancla, la posición se reemplaza por el ancla
+      (promedio del estacionamiento); el dedup de la ingesta no escribe filas
+      que no se movieron.
+
+    El estado vive en memoria; si falta o es más viejo que el último fix
+    guardado (otro worker lo procesó), se siembra desde ese fix.
+    """
+
+    def __init__(self, max_velocidad_kmh: float, max_aceleracion_ms2: float,
+                 velocidad_detenido_kmh: float, radio_detenido_m: float, max_rechazos: int):
+        self.max_velocidad_kmh = max_velocidad_kmh
+        self.max_aceleracion_ms2 = max_aceleracion_ms2
+        self.velocidad_detenido_kmh = velocidad_detenido_kmh
+        self.radio_detenido_m = radio_detenido_m
+        self.max_rechazos = max_rechazos
+        self._estados: Dict[int, _EstadoFiltro] = {}
+        self.decisiones = {ACEPTADO: 0, SUAVIZADO: 0, RECHAZADO: 0}
+
+    def _contar(self, decision: str, lat: float, lng: float) -> Tuple[str, float, float]:
+        self.decisiones[decision] += 1
+        return decision, lat, lng
+
+    def evaluar(self, dispositivo_id: int, lat: float, lng: float, marca_tiempo: datetime,
+                velocidad: Optional[float], anterior: Optional[Punto] = None) -> Tuple[str, float, float]:
+        """(decisión, lat, lng a guardar)"""
+        ts = marca_tiempo.timestamp()
+        velocidad = velocidad or 0.0
+        estado = self._estados.get(dispositivo_id)
+        if anterior is not None and (estado is None or anterior[2].timestamp() > estado.ts):
+            estado = self._estados[dispositivo_id] = _EstadoFiltro(
+                anterior[0], anterior[1], anterior[2].timestamp(), anterior[3] or 0.0
+            )
+        if estado is None:
+            self._aceptar(dispositivo_id, lat, lng, ts, velocidad)
+            return self._contar(ACEPTADO, lat, lng)
+
+        dt = ts - estado.ts
+        if dt <= 0:
+            return self._contar(ACEPTADO, lat, lng)
+
+        detenido = velocidad < self.velocidad_detenido_kmh
+        if detenido and estado.ancla_lat is not None:
+            if haversine_km(estado.ancla_lat, estado.ancla_lng, lat, lng) * 1000 < self.radio_detenido_m:
+                # Promedio acumulado del estacionamiento, con peso acotado para seguir derivas lentas
+                estado.ancla_n = min(estado.ancla_n + 1, 20)
+                estado.ancla_lat += (lat - estado.ancla_lat) / estado.ancla_n
+                estado.ancla_lng += (lng - estado.ancla_lng) / estado.ancla_n
+                estado.ts = ts
+                estado.vel = velocidad
+                return self._contar(SUAVIZADO, estado.ancla_lat, estado.ancla_lng)
+
+        distancia_m = haversine_km(estado.lat, estado.lng, lat, lng) * 1000
+        velocidad_implicita = distancia_m / dt
+        aceleracion = (velocidad_implicita - estado.vel / 3.6) / dt
+        salto = distancia_m > self.radio_detenido_m and (
+            velocidad_implicita * 3.6 > self.max_velocidad_kmh or aceleracion > self.max_aceleracion_ms2
+        )
+        if salto and estado.rechazos < self.max_rechazos:
+            estado.rechazos += 1
+            logger.info(
+                f"🚫 Fix descartado (dispositivo {dispositivo_id}): {distancia_m:.0f} m en {dt:.0f} s "
+                f"({velocidad_implicita * 3.6:.0f} km/h)"
+            )
+            return self._contar(RECHAZADO, lat, lng)
+
+        self._aceptar(dispositivo_id, lat, lng, ts, velocidad)
+        return self._contar(ACEPTADO, lat, lng)
+
+    def _aceptar(self, dispositivo_id: int, lat: float, lng: float, ts: float, velocidad: float) -> None:
+        estado = self._estados[dispositivo_id] = _EstadoFiltro(lat, lng, ts, velocidad)
+        if velocidad < self.velocidad_detenido_kmh:
+            estado.ancla_lat, estado.ancla_lng, estado.ancla_n = lat, lng, 1
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {"dispositivos": len(self._estados), **self.decisiones}
+
+def _haversine_m(lat1: np.ndarray, lng1: np.ndarray, lat2: np.ndarray, lng2: np.ndarray) -> np.ndarray:
+    lat1, lng1, lat2, lng2 = (np.radians(v) for v in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * 1000 * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+def _salto(ts1: np.ndarray, lat1: np.ndarray, lng1: np.ndarray, vel1: np.ndarray,
+           ts2: np.ndarray, lat2: np.ndarray, lng2: np.ndarray, filtro: FiltroGPS) -> np.ndarray:
+    """True donde ir del punto 1 al 2 es imposible (mismo criterio que FiltroGPS.evaluar)"""
+    distancia = _haversine_m(lat1, lng1, lat2, lng2)
+    dt = np.maximum(ts2 - ts1, 1.0)
+    velocidad = distancia / dt
+    aceleracion = (velocidad - vel1 / 3.6) / dt
+    return (distancia > filtro.radio_detenido_m) & (
+        (velocidad * 3.6 > filtro.max_velocidad_kmh) | (aceleracion > filtro.max_aceleracion_ms2)
+    )
+
+def marcar_descartables(ts: np.ndarray, lat: np.ndarray, lng: np.ndarray, vel: np.ndarray,
+                        filtro: FiltroGPS, intervalo_detenido_seg: float = 300.0,
+                        max_grupo: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+    """Versión vectorizada del filtro para limpiar historial de un dispositivo (ordenado por tiempo).
+
+    Devuelve dos máscaras: saltos (grupos de hasta max_grupo puntos que se
+    van y vuelven con tramos imposibles, cuando el punto anterior y el
+    posterior al grupo sí son compatibles) y jitter (puntos detenidos dentro
+    del radio del primero del estacionamiento, dejando uno cada
+    intervalo_detenido_seg).
+    """
+    n = len(ts)
+    saltos = np.zeros(n, dtype=bool)
+    jitter = np.zeros(n, dtype=bool)
+    if n < 3:
+        return saltos, jitter
+
+    # Tramo k: del punto k al k+1
+    malos = np.flatnonzero(_salto(ts[:-1], lat[:-1], lng[:-1], vel[:-1], ts[1:], lat[1:], lng[1:], filtro))
+    if len(malos) >= 2:
+        salida, vuelta = malos[:-1], malos[1:]
+        corto = vuelta - salida <= max_grupo
+        salida, vuelta = salida[corto], vuelta[corto]
+        antes, despues = salida, vuelta + 1
+        compatible = ~_salto(ts[antes], lat[antes], lng[antes], vel[antes],
+                             ts[despues], lat[despues], lng[despues], filtro)
+        # Marcar los puntos salida+1 .. vuelta de cada grupo con una suma acumulada
+        marcas = np.zeros(n + 1, dtype=np.int64)
+        np.add.at(marcas, salida[compatible] + 1, 1)
+        np.add.at(marcas, vuelta[compatible] + 1, -1)
+        saltos = np.cumsum(marcas)[:n] > 0
+
+    vivos = np.flatnonzero(~saltos)
+    detenido = vel[vivos] < filtro.velocidad_detenido_kmh
+    # Inicio de cada estacionamiento: primer punto detenido tras uno en movimiento
+    inicio = detenido & ~np.concatenate(([False], detenido[:-1]))
+    posiciones = np.arange(len(vivos))
+    ancla = np.maximum.accumulate(np.where(inicio | ~detenido, posiciones, 0))
+    cerca = _haversine_m(lat[vivos[ancla]], lng[vivos[ancla]], lat[vivos], lng[vivos]) < filtro.radio_detenido_m
+    tramo_tiempo = np.floor((ts[vivos] - ts[vivos[ancla]]) / intervalo_detenido_seg)
+    nuevo_tramo = np.concatenate(([True], tramo_tiempo[1:] != tramo_tiempo[:-1]))
+    jitter[vivos] = detenido & ~inicio & cerca & ~nuevo_tramo
+    return saltos, jitter
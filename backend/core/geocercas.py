@@ -0,0 +1,131 @@
+import logging
+import math
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from core.espacial import haversine_km
+
+logger = logging.getLogger(__name__)
+
+Clave = Tuple[int, int]
+
+class GeocercaCompilada:
+    """Geocerca lista para evaluar: bbox precalculado y aristas del polígono en arrays"""
+
+    __slots__ = ("id", "circulo", "min_lat", "min_lng", "max_lat", "max_lng",
+                 "centro", "radio_km", "_lat1", "_lng1", "_lat2", "_lng2", "_pendiente")
+
+    def __init__(self, id: int, puntos: Optional[Sequence[Sequence[float]]] = None,
+                 centro: Optional[Tuple[float, float]] = None, radio_m: Optional[float] = None):
+        self.id = id
+        self.circulo = centro is not None
+
+        if self.circulo:
+            self.centro = centro
+            self.radio_km = radio_m / 1000.0
+            dlat = self.radio_km / 111.32
+            dlng = self.radio_km / (111.32 * max(math.cos(math.radians(centro[0])), 1e-6))
+            self.min_lat, self.max_lat = centro[0] - dlat, centro[0] + dlat
+            self.min_lng, self.max_lng = centro[1] - dlng, centro[1] + dlng
+            return
+
+        if not puntos or len(puntos) < 3:
+            raise ValueError(f"Geocerca {id}: el polígono necesita al menos 3 puntos")
+
+        lats = [p[0] for p in puntos]
+        lngs = [p[1] for p in puntos]
+        self.min_lat, self.max_lat = min(lats), max(lats)
+        self.min_lng, self.max_lng = min(lngs), max(lngs)
+
+        # Aristas (cerrando el anillo) con la pendiente inversa precalculada para ray casting
+        self._lat1, self._lng1, self._lat2, self._lng2, self._pendiente = [], [], [], [], []
+        for i in range(len(puntos)):
+            lat1, lng1 = puntos[i - 1][0], puntos[i - 1][1]
+            lat2, lng2 = puntos[i][0], puntos[i][1]
+            if lat1 == lat2:
+                continue
+            self._lat1.append(lat1)
+            self._lng1.append(lng1)
+            self._lat2.append(lat2)
+            self._lng2.append(lng2)
+            self._pendiente.append((lng2 - lng1) / (lat2 - lat1))
+
+    def contiene(self, lat: float, lng: float) -> bool:
+        if not (self.min_lat <= lat <= self.max_lat and self.min_lng <= lng <= self.max_lng):
+            return False
+
+        if self.circulo:
+            return haversine_km(lat, lng, self.centro[0], self.centro[1]) <= self.radio_km
+
+        dentro = False
+        lat1, lng1, lat2, pendiente = self._lat1, self._lng1, self._lat2, self._pendiente
+        for i in range(len(lat1)):
+            if (lat1[i] > lat) != (lat2[i] > lat):
+                if lng < lng1[i] + (lat - lat1[i]) * pendiente[i]:
+                    dentro = not dentro
+        return dentro
+
+class MotorGeocercas:
+    """Índice de geocercas en grilla uniforme.
+
+    Cada fix consulta una sola celda y prueba solo las geocercas candidatas,
+    así el costo no crece con la cantidad total de geocercas. Las geocercas
+    que cubrirían demasiadas celdas van a una lista aparte filtrada por bbox.
+    El estado dentro/fuera en vivo no vive acá sino en presencias_geocerca.
+    """
+
+    def __init__(self, tamano_celda: float = 0.05, max_celdas: int = 4096):
+        self.tamano_celda = tamano_celda
+        self.max_celdas = max_celdas
+        self.geocercas: Dict[int, GeocercaCompilada] = {}
+        self._celdas: Dict[Clave, List[GeocercaCompilada]] = {}
+        self._grandes: List[GeocercaCompilada] = []
+
+    def _clave(self, lat: float, lng: float) -> Clave:
+        return (math.floor(lng / self.tamano_celda), math.floor(lat / self.tamano_celda))
+
+    def cargar(self, geocercas: Iterable[GeocercaCompilada]) -> None:
+        """Recompilar el índice"""
+        self.geocercas = {}
+        self._celdas = {}
+        self._grandes = []
+
+        for geocerca in geocercas:
+            self.geocercas[geocerca.id] = geocerca
+            x0, y0 = self._clave(geocerca.min_lat, geocerca.min_lng)
+            x1, y1 = self._clave(geocerca.max_lat, geocerca.max_lng)
+            if (x1 - x0 + 1) * (y1 - y0 + 1) > self.max_celdas:
+                self._grandes.append(geocerca)
+                continue
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    self._celdas.setdefault((x, y), []).append(geocerca)
+
+        logger.info(f"Motor de geocercas cargado: {len(self.geocercas)} geocercas, {len(self._celdas)} celdas")
+
+    def contenedoras(self, lat: float, lng: float) -> Set[int]:
+        resultado = set()
+        for geocerca in self._celdas.get(self._clave(lat, lng), ()):
+            if geocerca.contiene(lat, lng):
+                resultado.add(geocerca.id)
+        for geocerca in self._grandes:
+            if geocerca.contiene(lat, lng):
+                resultado.add(geocerca.id)
+        return resultado
+
+    def evaluar(self, dispositivo_id: int, lat: float, lng: float,
+                estado: Dict[int, Set[int]]) -> List[Tuple[int, str]]:
+        """Transiciones (geocerca_id, 'entrada'|'salida') del fix según un estado propio (reproducción).
+
+        El primer fix de un dispositivo sin estado solo lo inicializa: quien
+        ya estaba adentro al comienzo del rango no cuenta como entrada.
+        """
+        actuales = self.contenedoras(lat, lng)
+        anteriores = estado.get(dispositivo_id)
+        estado[dispositivo_id] = actuales
+
+        if anteriores is None:
+            return []
+
+        transiciones = [(geocerca_id, "entrada") for geocerca_id in actuales - anteriores]
+        transiciones += [(geocerca_id, "salida") for geocerca_id in anteriores - actuales]
+        return transiciones
@@ -0,0 +1,296 @@
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Límites superiores de los buckets, en ms
+LIMITES_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class HistogramaLatencia:
+    """Histograma de buckets fijos: memoria constante sin importar el tráfico.
+
+    Los percentiles son la cota superior del bucket donde caen (p. ej.
+    "p95 <= 250 ms"), acotada por el máximo observado.
+    """
+
+    __slots__ = ("cuentas", "total", "suma", "maximo")
+
+    def __init__(self):
+        self.cuentas = [0] * (len(LIMITES_MS) + 1)
+        self.total = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+
+    def registrar(self, segundos: float) -> None:
+        ms = segundos * 1000
+        i = 0
+        while i < len(LIMITES_MS) and ms > LIMITES_MS[i]:
+            i += 1
+        self.cuentas[i] += 1
+        self.total += 1
+        self.suma += ms
+        if ms > self.maximo:
+            self.maximo = ms
+
+    def percentil(self, p: float) -> Optional[float]:
+        if not self.total:
+            return None
+        objetivo = p * self.total
+        acumulado = 0
+        for i, cuenta in enumerate(self.cuentas):
+            acumulado += cuenta
+            if acumulado >= objetivo:
+                return min(float(LIMITES_MS[i]), round(self.maximo, 1)) if i < len(LIMITES_MS) else round(self.maximo, 1)
+        return round(self.maximo, 1)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        acumulado = 0
+        buckets = {}
+        for limite, cuenta in zip(LIMITES_MS + ("+Inf",), self.cuentas):
+            acumulado += cuenta
+            buckets[str(limite)] = acumulado
+        return {
+            "total": self.total,
+            "promedio_ms": round(self.suma / self.total, 2) if self.total else None,
+            "p50_ms": self.percentil(0.5),
+            "p95_ms": self.percentil(0.95),
+            "p99_ms": self.percentil(0.99),
+            "max_ms": round(self.maximo, 1) if self.total else None,
+            "buckets": buckets,
+        }
+
+class MedicionRequest:
+    """Lo que hizo la base durante un request; lo llenan los eventos de SQLAlchemy"""
+
+    __slots__ = ("consultas", "commits", "db_seg", "espera_pool_seg", "sentencias")
+
+    def __init__(self, capturar_sql: bool):
+        self.consultas = 0
+        self.commits = 0
+        self.db_seg = 0.0
+        self.espera_pool_seg = 0.0
+        # (segundos, SQL) solo si el log de requests lentos está activo
+        self.sentencias: Optional[List[Tuple[float, str]]] = [] if capturar_sql else None
+
+# Medición del request en curso; la sesión async ejecuta en un greenlet que hereda este contexto
+_request_actual: ContextVar[Optional[MedicionRequest]] = ContextVar("metricas_request", default=None)
+
+class MetricasRuta:
+    __slots__ = ("latencia", "requests", "errores", "consultas", "consultas_max", "commits", "db_seg", "espera_pool_seg")
+
+    def __init__(self):
+        self.latencia = HistogramaLatencia()
+        self.requests = 0
+        self.errores = 0
+        self.consultas = 0
+        self.consultas_max = 0
+        self.commits = 0
+        self.db_seg = 0.0
+        self.espera_pool_seg = 0.0
+
+    def estadisticas(self) -> Dict[str, Any]:
+        n = self.requests or 1
+        return {
+            "requests": self.requests,
+            "errores_5xx": self.errores,
+            "latencia": self.latencia.estadisticas(),
+            # Muchas consultas por request en promedio o en el peor caso delatan un N+1
+            "consultas_por_request": round(self.consultas / n, 2),
+            "consultas_max": self.consultas_max,
+            "commits_por_request": round(self.commits / n, 2),
+            "db_ms_promedio": round(self.db_seg / n * 1000, 2),
+            "espera_pool_ms_promedio": round(self.espera_pool_seg / n * 1000, 2),
+        }
+
+class MetricasHTTP:
+    """Latencia y trabajo de base por ruta (método + plantilla de la ruta, no la URL)"""
+
+    def __init__(self, lento_ms: float, max_sentencias: int):
+        self.lento_ms = lento_ms
+        self.max_sentencias = max_sentencias
+        self.rutas: Dict[Tuple[str, str], MetricasRuta] = {}
+        self.requests_lentos = 0
+
+    def registrar(self, metodo: str, ruta: str, estado: int, segundos: float, medicion: MedicionRequest) -> None:
+        metricas = self.rutas.get((metodo, ruta))
+        if metricas is None:
+            metricas = self.rutas[(metodo, ruta)] = MetricasRuta()
+        metricas.requests += 1
+        if estado >= 500:
+            metricas.errores += 1
+        metricas.latencia.registrar(segundos)
+        metricas.consultas += medicion.consultas
+        metricas.consultas_max = max(metricas.consultas_max, medicion.consultas)
+        metricas.commits += medicion.commits
+        metricas.db_seg += medicion.db_seg
+        metricas.espera_pool_seg += medicion.espera_pool_seg
+
+        if self.lento_ms and segundos * 1000 >= self.lento_ms:
+            self.requests_lentos += 1
+            self._log_lento(metodo, ruta, estado, segundos, medicion)
+
+    def _log_lento(self, metodo: str, ruta: str, estado: int, segundos: float, medicion: MedicionRequest) -> None:
+        lineas = [
+            f"🐢 Request lento: {metodo} {ruta} -> {estado} en {segundos * 1000:.0f} ms | "
+            f"{medicion.consultas} consultas, {medicion.commits} commits, db {medicion.db_seg * 1000:.0f} ms, "
+            f"espera de pool {medicion.espera_pool_seg * 1000:.0f} ms"
+        ]
+        for duracion, sql in medicion.sentencias or []:
+            lineas.append(f"    {duracion * 1000:8.1f} ms  {sql}")
+        if medicion.consultas > len(medicion.sentencias or []):
+            lineas.append(f"    ... {medicion.consultas - len(medicion.sentencias or [])} consultas más")
+        logger.warning("\n".join(lineas))
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "requests_lentos": self.requests_lentos,
+            "umbral_lento_ms": self.lento_ms or None,
+            "rutas": {
+                f"{metodo} {ruta}": m.estadisticas()
+                for (metodo, ruta), m in sorted(self.rutas.items(), key=lambda x: (x[0][1], x[0][0]))
+            },
+        }
+
+class MetricasDB:
+    """Consultas, tiempo de base y espera del pool de un engine"""
+
+    def __init__(self):
+        self.consultas = 0
+        self.errores = 0
+        self.commits = 0
+        self.rollbacks = 0
+        self.db_seg = 0.0
+        self.espera_pool = HistogramaLatencia()
+        self.timeouts_pool = 0
+        self.pico_en_uso = 0
+
+    def registrar_espera(self, segundos: float) -> None:
+        self.espera_pool.registrar(segundos)
+        medicion = _request_actual.get()
+        if medicion is not None:
+            medicion.espera_pool_seg += segundos
+
+    def instrumentar(self, engine) -> None:
+        """Enganchar los eventos de SQLAlchemy al engine (sync_engine si es async)"""
+        engine = getattr(engine, "sync_engine", engine)
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _antes(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("metricas_inicio", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _despues(conn, cursor, statement, parameters, context, executemany):
+            duracion = time.perf_counter() - conn.info["metricas_inicio"].pop()
+            self.consultas += 1
+            self.db_seg += duracion
+            medicion = _request_actual.get()
+            if medicion is not None:
+                medicion.consultas += 1
+                medicion.db_seg += duracion
+                if medicion.sentencias is not None and len(medicion.sentencias) < metricas_http.max_sentencias:
+                    medicion.sentencias.append((duracion, " ".join(statement.split())[:500]))
+
+        @event.listens_for(engine, "handle_error")
+        def _error(contexto):
+            inicios = contexto.connection.info.get("metricas_inicio") if contexto.connection is not None else None
+            if inicios:
+                inicios.pop()
+            self.errores += 1
+
+        @event.listens_for(engine, "commit")
+        def _commit(conn):
+            self.commits += 1
+            medicion = _request_actual.get()
+            if medicion is not None:
+                medicion.commits += 1
+
+        @event.listens_for(engine, "rollback")
+        def _rollback(conn):
+            self.rollbacks += 1
+
+        @event.listens_for(engine, "checkout")
+        def _checkout(dbapi_connection, connection_record, connection_proxy):
+            self.pico_en_uso = max(self.pico_en_uso, engine.pool.checkedout())
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "consultas": self.consultas,
+            "errores": self.errores,
+            "commits": self.commits,
+            "rollbacks": self.rollbacks,
+            "db_ms_total": round(self.db_seg * 1000, 1),
+            "espera_pool": self.espera_pool.estadisticas(),
+            "timeouts_pool": self.timeouts_pool,
+            "pico_en_uso": self.pico_en_uso,
+        }
+
+class PoolMedido(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool que mide cuánto tarda cada checkout (espera + conexión nueva)"""
+
+    metricas: MetricasDB
+
+    def connect(self):
+        inicio = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.metricas.timeouts_pool += 1
+            raise
+        finally:
+            self.metricas.registrar_espera(time.perf_counter() - inicio)
+
+def clase_pool(metricas: MetricasDB) -> type:
+    """Subclase de PoolMedido ligada a `metricas`; el pool se recrea con su misma clase"""
+    return type("PoolMedido", (PoolMedido,), {"metricas": metricas})
+
+class MiddlewareMetricas:
+    """Middleware ASGI: latencia por ruta y trabajo de base de cada request HTTP.
+
+    La latencia llega hasta el último trozo del cuerpo de la respuesta (sin
+    contar tareas en segundo plano). Es ASGI puro para no envolver el cuerpo
+    ni cortar el contexto como BaseHTTPMiddleware.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        medicion = MedicionRequest(capturar_sql=bool(metricas_http.lento_ms))
+        token = _request_actual.set(medicion)
+        inicio = time.perf_counter()
+        estado = 500
+        fin: Optional[float] = None
+
+        async def enviar(mensaje):
+            nonlocal estado, fin
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            elif mensaje["type"] == "http.response.body" and not mensaje.get("more_body", False):
+                fin = time.perf_counter()
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _request_actual.reset(token)
+            ruta = scope.get("route")
+            metricas_http.registrar(
+                scope["method"],
+                getattr(ruta, "path", None) or "sin_ruta",
+                estado,
+                (fin or time.perf_counter()) - inicio,
+                medicion,
+            )
+
+metricas_http = MetricasHTTP(settings.METRICAS_REQUEST_LENTO_MS, settings.METRICAS_MAX_SENTENCIAS)
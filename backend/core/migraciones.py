@@ -0,0 +1,95 @@
+import logging
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import text
+
+from core.database import Base
+
+logger = logging.getLogger(__name__)
+
+# Revisiones en orden; la última es la que espera este código.
+# Al agregar una migración en migraciones/versions, sumarla acá.
+REVISIONES = (
+    "0001_esquema_inicial", "0002_clave_natural", "0003_sin_senal_unico",
+    "0004_version_por_xid", "0005_presencias_geocerca", "0006_alarma_unica",
+)
+REVISION_ESQUEMA = REVISIONES[-1]
+
+DIRECTORIO = Path(__file__).resolve().parent.parent
+
+# Clave del advisory lock que serializa las migraciones entre workers
+CLAVE_BLOQUEO = 7_240_431
+
+def _migrar(conexion) -> None:
+    # Alembic se importa solo cuando hay que migrar
+    from alembic import command
+    from alembic.config import Config
+    from alembic.migration import MigrationContext
+    from sqlalchemy import inspect
+
+    config = Config(str(DIRECTORIO / "alembic.ini"))
+    config.attributes["connection"] = conexion
+
+    actual = MigrationContext.configure(conexion).get_current_revision()
+    if actual is None and inspect(conexion).has_table("ubicaciones"):
+        # Base creada por create_all antes de las migraciones: completar las tablas que
+        # falten y adoptarla en la revisión inicial; las siguientes son idempotentes
+        import models  # noqa: F401
+        Base.metadata.create_all(conexion)
+        command.stamp(config, REVISIONES[0])
+        logger.info(f"Base existente adoptada en la revisión {REVISIONES[0]}")
+    command.upgrade(config, "head")
+
+async def migrar(engine) -> None:
+    """Aplicar las migraciones pendientes; con varios workers, uno migra y los demás esperan"""
+    async with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:clave)"), {"clave": CLAVE_BLOQUEO})
+        await conn.run_sync(_migrar)
+    logger.info(f"Esquema en la revisión {REVISION_ESQUEMA}")
+
+async def version_esquema(engine) -> Optional[str]:
+    """Revisión guardada en alembic_version (None si la tabla no existe)"""
+    async with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            if await conn.scalar(text("SELECT to_regclass('alembic_version')")) is None:
+                return None
+        try:
+            return await conn.scalar(text("SELECT version_num FROM alembic_version"))
+        except Exception:
+            return None
+
+async def asegurar_esquema(engine, rapido: bool = True) -> str:
+    """Dejar el esquema al día al arrancar. Devuelve qué se hizo.
+
+    En modo rápido se lee la fila de alembic_version (una consulta) y solo se
+    migra si la base está atrasada o sin versionar. Una revisión desconocida se
+    toma como más nueva (otro despliegue ya migró) y se sigue arrancando.
+    """
+    if not rapido:
+        await migrar(engine)
+        return "migrado"
+
+    actual = await version_esquema(engine)
+    if actual == REVISION_ESQUEMA:
+        return "al_dia"
+    if actual is not None and actual not in REVISIONES:
+        logger.warning(f"Revisión de esquema {actual} desconocida (este código espera {REVISION_ESQUEMA}); se asume más nueva")
+        return "mas_nuevo"
+
+    logger.warning(f"Esquema en {actual or 'sin versionar'}, se migra a {REVISION_ESQUEMA}")
+    await migrar(engine)
+    return "migrado"
+
+if __name__ == "__main__":
+    # python -m core.migraciones: migrar sin levantar la aplicación (paso de release)
+    import asyncio
+    from core.database import engine
+
+    async def _principal():
+        await migrar(engine)
+        await engine.dispose()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    asyncio.run(_principal())
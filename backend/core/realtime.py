@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import orjson
+from collections import OrderedDict, deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# (min_lng, min_lat, max_lng, max_lat)
+BBox = Tuple[float, float, float, float]
+
+class Suscriptor:
+    """Cliente de WebSocket con su filtro y su cola de salida acotada.
+
+    La cola guarda solo la posición más reciente por dispositivo: si el
+    cliente se atrasa, las posiciones intermedias se pisan en vez de acumularse.
+    """
+
+    def __init__(self, max_pendientes: int = 1000):
+        self.dispositivos: Optional[Set[int]] = None
+        self.bbox: Optional[BBox] = None
+        self.max_pendientes = max_pendientes
+        self.pendientes: "OrderedDict[int, dict]" = OrderedDict()
+        self.hay_datos = asyncio.Event()
+        self.coalescidos = 0
+        self.descartados = 0
+
+    def acepta(self, dispositivo_id: int, lat: float, lng: float) -> bool:
+        if self.dispositivos is not None and dispositivo_id not in self.dispositivos:
+            return False
+        if self.bbox is not None:
+            min_lng, min_lat, max_lng, max_lat = self.bbox
+            if not (min_lat <= lat <= max_lat and min_lng <= lng <= max_lng):
+                return False
+        return True
+
+    def ofrecer(self, dispositivo_id: int, evento: dict) -> None:
+        """Encolar sin bloquear; O(1)"""
+        if dispositivo_id in self.pendientes:
+            self.coalescidos += 1
+            self.pendientes.move_to_end(dispositivo_id)
+        self.pendientes[dispositivo_id] = evento
+
+        if len(self.pendientes) > self.max_pendientes:
+            self.pendientes.popitem(last=False)
+            self.descartados += 1
+
+        self.hay_datos.set()
+
+    async def siguiente_lote(self) -> List[dict]:
+        """Esperar y vaciar todas las posiciones pendientes"""
+        await self.hay_datos.wait()
+        self.hay_datos.clear()
+        lote = list(self.pendientes.values())
+        self.pendientes.clear()
+        return lote
+
+class DifusionHub:
+    """Reparte cada fix aceptado por la ingesta a los suscriptores interesados.
+
+    Los suscriptores con lista de dispositivos se indexan por dispositivo, así
+    un fix solo recorre a los que lo filtran más los de filtro global/bbox.
+    El hub es de un solo proceso: los fixes de otros workers le llegan por
+    RelayPosiciones.
+    """
+
+    def __init__(self):
+        self._por_dispositivo: Dict[int, Set[Suscriptor]] = {}
+        self._globales: Set[Suscriptor] = set()
+        self.publicados = 0
+
+    @property
+    def total_suscriptores(self) -> int:
+        return len(self._globales) + len(
+            {s for subs in self._por_dispositivo.values() for s in subs}
+        )
+
+    def registrar(self, suscriptor: Suscriptor, dispositivos: Optional[Iterable[int]] = None, bbox: Optional[BBox] = None) -> None:
+        self.eliminar(suscriptor)
+        suscriptor.dispositivos = set(dispositivos) if dispositivos is not None else None
+        suscriptor.bbox = bbox
+
+        if suscriptor.dispositivos is None:
+            self._globales.add(suscriptor)
+        else:
+            for dispositivo_id in suscriptor.dispositivos:
+                self._por_dispositivo.setdefault(dispositivo_id, set()).add(suscriptor)
+
+    def eliminar(self, suscriptor: Suscriptor) -> None:
+        self._globales.discard(suscriptor)
+        for dispositivo_id in suscriptor.dispositivos or ():
+            subs = self._por_dispositivo.get(dispositivo_id)
+            if subs is not None:
+                subs.discard(suscriptor)
+                if not subs:
+                    del self._por_dispositivo[dispositivo_id]
+
+    def publicar(self, dispositivo_id: int, lat: float, lng: float, evento: dict) -> None:
+        """Programar el reparto en el loop y volver de inmediato a la ingesta"""
+        if not self._globales and dispositivo_id not in self._por_dispositivo:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        loop.call_soon(self._difundir, dispositivo_id, lat, lng, evento)
+
+    def _difundir(self, dispositivo_id: int, lat: float, lng: float, evento: dict) -> None:
+        self.publicados += 1
+        for suscriptor in self._por_dispositivo.get(dispositivo_id, ()):
+            if suscriptor.acepta(dispositivo_id, lat, lng):
+                suscriptor.ofrecer(dispositivo_id, evento)
+        for suscriptor in self._globales:
+            if suscriptor.acepta(dispositivo_id, lat, lng):
+                suscriptor.ofrecer(dispositivo_id, evento)
+
+hub = DifusionHub()
+
+class RelayPosiciones:
+    """Lleva los fixes de cada worker a los hubs de todos con LISTEN/NOTIFY.
+
+    La ingesta encola el fix y vuelve; la tarea de fondo lo publica en el
+    canal en lotes de hasta MAX_PAYLOAD bytes (NOTIFY admite 8000) y escucha
+    el mismo canal para entregar al hub local, incluidos los fixes propios.
+    Sin canal, o mientras la conexión está caída, el fix solo llega al hub
+    de este worker.
+    """
+
+    MAX_PAYLOAD = 7500
+    ESPERA_RECONEXION_SEG = 5.0
+    VERIFICACION_SEG = 30.0
+
+    def __init__(self, hub: DifusionHub, canal: str, max_en_espera: int = 10000):
+        self.hub = hub
+        self.canal = canal
+        self._en_espera: deque = deque(maxlen=max_en_espera)
+        self._hay_datos = asyncio.Event()
+        self.conectado = False
+        self.enviados = 0
+        self.recibidos = 0
+        self.errores = 0
+
+    def publicar(self, dispositivo_id: int, lat: float, lng: float, evento: dict) -> None:
+        """Encolar para el canal sin bloquear; sin conexión, entregar solo en este worker"""
+        if not self.conectado:
+            self.hub.publicar(dispositivo_id, lat, lng, evento)
+            return
+        self._en_espera.append((dispositivo_id, lat, lng, evento))
+        self._hay_datos.set()
+
+    def _recibir(self, conexion: Any, pid: int, canal: str, payload: str) -> None:
+        try:
+            lote = orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            self.errores += 1
+            return
+        self.recibidos += len(lote)
+        for dispositivo_id, lat, lng, evento in lote:
+            self.hub.publicar(dispositivo_id, lat, lng, evento)
+
+    def _payloads(self) -> Iterator[str]:
+        """Vaciar la espera en arrays JSON de hasta MAX_PAYLOAD bytes"""
+        partes: List[bytes] = []
+        tamano = 2
+        while self._en_espera:
+            parte = orjson.dumps(self._en_espera.popleft())
+            if partes and tamano + len(parte) + 1 > self.MAX_PAYLOAD:
+                yield (b"[" + b",".join(partes) + b"]").decode()
+                partes, tamano = [], 2
+            partes.append(parte)
+            tamano += len(parte) + 1
+        if partes:
+            yield (b"[" + b",".join(partes) + b"]").decode()
+
+    def _entregar_en_espera(self) -> None:
+        """Al perder la conexión, lo que no salió se entrega al menos en este worker"""
+        while self._en_espera:
+            self.hub.publicar(*self._en_espera.popleft())
+
+    async def ejecutar(self, engine) -> None:
+        """Tarea de fondo: mantiene una conexión del pool escuchando el canal y publica lo encolado"""
+        if not self.canal:
+            logger.warning("WS_CANAL_NOTIFY vacío: el WebSocket solo recibe los fixes de este worker")
+            return
+
+        while True:
+            try:
+                async with engine.connect() as conn:
+                    raw = (await conn.get_raw_connection()).driver_connection
+                    await raw.add_listener(self.canal, self._recibir)
+                    self.conectado = True
+                    try:
+                        while True:
+                            try:
+                                await asyncio.wait_for(self._hay_datos.wait(), self.VERIFICACION_SEG)
+                            except asyncio.TimeoutError:
+                                # Sin tráfico: confirmar que la conexión que escucha sigue viva
+                                await raw.execute("SELECT 1")
+                                continue
+                            self._hay_datos.clear()
+                            for payload in self._payloads():
+                                await raw.execute("SELECT pg_notify($1, $2)", self.canal, payload)
+                                self.enviados += 1
+                    finally:
+                        self.conectado = False
+                        self._entregar_en_espera()
+                        # No devolver al pool una conexión con LISTEN activo
+                        await conn.invalidate()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errores += 1
+                logger.error(f"Canal {self.canal} de posiciones en vivo caído, reintentando: {e}")
+                await asyncio.sleep(self.ESPERA_RECONEXION_SEG)
+
+relay_posiciones = RelayPosiciones(hub, settings.WS_CANAL_NOTIFY, settings.WS_MAX_EN_ESPERA)
+
+class MedidorLatencia:
+    """Ventana de las últimas latencias observadas, con percentiles"""
+
+    def __init__(self, ventana: int = 1000):
+        self.muestras = deque(maxlen=ventana)
+        self.total = 0
+
+    def registrar(self, segundos: float) -> None:
+        self.muestras.append(segundos)
+        self.total += 1
+
+    def estadisticas(self) -> Dict[str, Optional[float]]:
+        ordenadas = sorted(self.muestras)
+
+        def percentil(p: float) -> Optional[float]:
+            if not ordenadas:
+                return None
+            return round(ordenadas[min(len(ordenadas) - 1, int(p * len(ordenadas)))] * 1000, 1)
+
+        return {
+            "total": self.total,
+            "p50_ms": percentil(0.5),
+            "p95_ms": percentil(0.95),
+            "p99_ms": percentil(0.99),
+            "max_ms": round(ordenadas[-1] * 1000, 1) if ordenadas else None,
+        }
@@ -0,0 +1,169 @@
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EXCESO_INICIO = "exceso_velocidad_inicio"
+EXCESO_FIN = "exceso_velocidad_fin"
+DETENCION = "detencion"
+ARRANQUE = "arranque"
+RALENTI = "ralenti_excesivo"
+SIN_SENAL = "sin_senal"
+SENAL_RECUPERADA = "senal_recuperada"
+
+Evento = Tuple[str, Dict[str, Any]]
+
+class EstadoDispositivo:
+    __slots__ = ("en_exceso", "exceso_desde", "velocidad_pico",
+                 "detenido", "detenido_desde", "ralenti_emitido", "sin_senal", "ultimo_fix")
+
+    def __init__(self):
+        self.en_exceso = False
+        self.exceso_desde: Optional[datetime] = None
+        self.velocidad_pico = 0.0
+        self.detenido: Optional[bool] = None
+        self.detenido_desde: Optional[datetime] = None
+        self.ralenti_emitido = False
+        self.sin_senal = False
+        self.ultimo_fix: Optional[datetime] = None
+
+class MotorReglas:
+    """Reglas de streaming con estado por dispositivo.
+
+    - Exceso de velocidad con histéresis: empieza al superar el límite y
+      termina recién al bajar de límite - histéresis, para no rebotar.
+    - Detención / arranque por umbral de velocidad.
+    - Ralentí excesivo: detenido más de N minutos. El GT06 no informa el
+      contacto, así que se usa el tiempo detenido como aproximación.
+    """
+
+    def __init__(self, histeresis_kmh: float, umbral_detenido_kmh: float, ralenti_min: float):
+        self.histeresis_kmh = histeresis_kmh
+        self.umbral_detenido_kmh = umbral_detenido_kmh
+        self.ralenti = timedelta(minutes=ralenti_min)
+        self.estados: Dict[int, EstadoDispositivo] = {}
+        self.fixes = 0
+        self.ns_total = 0
+        self.eventos_por_tipo: Dict[str, int] = {}
+
+    def evaluar(self, dispositivo_id: int, velocidad: float, marca_tiempo: datetime,
+                limite: Optional[float]) -> List[Evento]:
+        inicio = time.perf_counter_ns()
+        estado = self.estados.get(dispositivo_id)
+        if estado is None:
+            estado = self.estados[dispositivo_id] = EstadoDispositivo()
+
+        eventos: List[Evento] = []
+        velocidad = velocidad or 0.0
+
+        if estado.sin_senal:
+            estado.sin_senal = False
+            eventos.append((SENAL_RECUPERADA, {"sin_senal_desde": estado.ultimo_fix}))
+
+        # Fixes atrasados no alteran el estado temporal
+        if estado.ultimo_fix is not None and marca_tiempo < estado.ultimo_fix:
+            self._contabilizar(inicio, eventos)
+            return eventos
+        estado.ultimo_fix = marca_tiempo
+
+        if limite:
+            if not estado.en_exceso and velocidad > limite:
+                estado.en_exceso = True
+                estado.exceso_desde = marca_tiempo
+                estado.velocidad_pico = velocidad
+                eventos.append((EXCESO_INICIO, {"velocidad": velocidad, "limite": limite}))
+            elif estado.en_exceso:
+                estado.velocidad_pico = max(estado.velocidad_pico, velocidad)
+                if velocidad < limite - self.histeresis_kmh:
+                    estado.en_exceso = False
+                    eventos.append((EXCESO_FIN, {
+                        "velocidad_maxima": estado.velocidad_pico,
+                        "limite": limite,
+                        "duracion_seg": (marca_tiempo - estado.exceso_desde).total_seconds(),
+                    }))
+
+        detenido = velocidad < self.umbral_detenido_kmh
+        if estado.detenido is None:
+            estado.detenido = detenido
+            estado.detenido_desde = marca_tiempo if detenido else None
+        elif detenido and not estado.detenido:
+            estado.detenido = True
+            estado.detenido_desde = marca_tiempo
+            estado.ralenti_emitido = False
+            eventos.append((DETENCION, {}))
+        elif not detenido and estado.detenido:
+            duracion = (marca_tiempo - estado.detenido_desde).total_seconds() if estado.detenido_desde else None
+            estado.detenido = False
+            estado.detenido_desde = None
+            eventos.append((ARRANQUE, {"detenido_seg": duracion}))
+
+        if (estado.detenido and not estado.ralenti_emitido and estado.detenido_desde is not None
+                and marca_tiempo - estado.detenido_desde >= self.ralenti):
+            estado.ralenti_emitido = True
+            eventos.append((RALENTI, {"detenido_seg": (marca_tiempo - estado.detenido_desde).total_seconds()}))
+
+        self._contabilizar(inicio, eventos)
+        return eventos
+
+    def marcar_sin_senal(self, dispositivo_id: int) -> None:
+        estado = self.estados.get(dispositivo_id)
+        if estado is None:
+            estado = self.estados[dispositivo_id] = EstadoDispositivo()
+        estado.sin_senal = True
+
+    def _contabilizar(self, inicio: int, eventos: List[Evento]) -> None:
+        self.fixes += 1
+        self.ns_total += time.perf_counter_ns() - inicio
+        for tipo, _ in eventos:
+            self.eventos_por_tipo[tipo] = self.eventos_por_tipo.get(tipo, 0) + 1
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "fixes": self.fixes,
+            "dispositivos": len(self.estados),
+            "costo_promedio_us": round(self.ns_total / self.fixes / 1000, 3) if self.fixes else 0.0,
+            "eventos": dict(self.eventos_por_tipo),
+        }
+
+class PlanificadorVencimientos:
+    """Heap de vencimientos de reporte por dispositivo.
+
+    Cada fix reprograma el vencimiento en O(log n); las entradas viejas del
+    heap se descartan al salir (borrado perezoso), así revisar los vencidos
+    cuesta O(k log n) en vez de recorrer la tabla de dispositivos.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int]] = []
+        self._vigente: Dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._vigente)
+
+    def programar(self, dispositivo_id: int, vence: float) -> None:
+        self._vigente[dispositivo_id] = vence
+        heapq.heappush(self._heap, (vence, dispositivo_id))
+        # Compactar si el heap acumula demasiadas entradas obsoletas
+        if len(self._heap) > 4 * len(self._vigente) + 1024:
+            self._heap = [(v, d) for d, v in self._vigente.items()]
+            heapq.heapify(self._heap)
+
+    def cancelar(self, dispositivo_id: int) -> None:
+        self._vigente.pop(dispositivo_id, None)
+
+    def proximo(self) -> Optional[float]:
+        while self._heap and self._vigente.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def vencidos(self, ahora: float) -> List[int]:
+        resultado = []
+        while self._heap and self._heap[0][0] <= ahora:
+            vence, dispositivo_id = heapq.heappop(self._heap)
+            if self._vigente.get(dispositivo_id) == vence:
+                del self._vigente[dispositivo_id]
+                resultado.append(dispositivo_id)
+        return resultado
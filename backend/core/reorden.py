@@ -0,0 +1,95 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+class _EstadoDispositivo:
+    __slots__ = ("ocupado", "pendientes")
+
+    def __init__(self):
+        self.ocupado = False
+        # (marca_tiempo, orden de llegada, futuro)
+        self.pendientes: List[Tuple[datetime, int, asyncio.Future]] = []
+
+class VentanaReorden:
+    """Ventana de reordenamiento por dispositivo para la ingesta.
+
+    Los fixes de un mismo dispositivo se procesan de a uno. El que llega sin
+    otro en curso pasa directo (sin demora); los que llegan mientras tanto
+    esperan y, al liberarse el turno, se espera `espera_seg` a que lleguen los
+    demás de la ráfaga y sale el de marca de tiempo más vieja. Así un equipo
+    que vacía su memoria tras un corte de cobertura se procesa en orden
+    cronológico aunque los pedidos lleguen desordenados.
+
+    Es por proceso: con varios workers ordena los fixes que caen en el mismo.
+    La clave es el IMEI, para poder tomar el turno antes de tocar la base.
+    """
+
+    def __init__(self, espera_seg: float):
+        self.espera_seg = espera_seg
+        self._estados: Dict[int, _EstadoDispositivo] = {}
+        self._llegadas = itertools.count()
+        self.reordenados = 0
+        self.atrasados = 0
+
+    @asynccontextmanager
+    async def turno(self, imei: str, marca_tiempo: datetime) -> AsyncIterator[None]:
+        estado = self._estados.get(imei)
+        if estado is None:
+            estado = self._estados[imei] = _EstadoDispositivo()
+
+        if estado.ocupado:
+            futuro = asyncio.get_running_loop().create_future()
+            heapq.heappush(estado.pendientes, (marca_tiempo, next(self._llegadas), futuro))
+            try:
+                await futuro
+            except asyncio.CancelledError:
+                # Cancelado justo después de recibir el turno: hay que pasarlo
+                if futuro.done() and not futuro.cancelled():
+                    self._liberar(imei, estado)
+                raise
+        else:
+            estado.ocupado = True
+
+        try:
+            yield
+        finally:
+            self._liberar(imei, estado)
+
+    def ocupado(self, imei: str) -> bool:
+        """True si un fix de este equipo tendría que esperar turno"""
+        return imei in self._estados
+
+    def _liberar(self, imei: str, estado: _EstadoDispositivo) -> None:
+        if not estado.pendientes:
+            estado.ocupado = False
+            del self._estados[imei]
+            return
+        # El turno sigue tomado mientras se juntan los de la ráfaga
+        asyncio.get_running_loop().call_later(self.espera_seg, self._despertar, imei, estado)
+
+    def _despertar(self, imei: str, estado: _EstadoDispositivo) -> None:
+        while estado.pendientes:
+            primera_llegada = min(llegada for _, llegada, _ in estado.pendientes)
+            _, llegada, futuro = heapq.heappop(estado.pendientes)
+            if futuro.done():
+                continue
+            if llegada != primera_llegada:
+                self.reordenados += 1
+            futuro.set_result(None)
+            return
+        estado.ocupado = False
+        del self._estados[imei]
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "dispositivos_en_curso": len(self._estados),
+            "en_espera": sum(len(e.pendientes) for e in self._estados.values()),
+            "reordenados": self.reordenados,
+            "atrasados": self.atrasados,
+        }
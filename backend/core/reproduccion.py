@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import base64
+import logging
+import math
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import orjson
+
+from core.diferido import importar_diferido
+
+logger = logging.getLogger(__name__)
+
+np = importar_diferido("numpy")
+
+# Tope al descomprimir un id recibido (500 vehículos ocupan unos pocos KB)
+MAX_ID_DESCOMPRIMIDO = 64 * 1024
+
+def codificar_id(vehiculos: List[int], inicio: float, fin: float, intervalo: float) -> str:
+    """Id que lleva los parámetros de la reproducción: cualquier worker puede rearmarla"""
+    datos = orjson.dumps([sorted(set(vehiculos)), inicio, fin, intervalo])
+    return base64.urlsafe_b64encode(zlib.compress(datos, 9)).rstrip(b"=").decode()
+
+def decodificar_id(id: str) -> Optional[Tuple[List[int], float, float, float]]:
+    """(vehiculos, inicio, fin, intervalo) de un id de codificar_id; None si no lo es"""
+    try:
+        descompresor = zlib.decompressobj()
+        datos = descompresor.decompress(base64.urlsafe_b64decode(id + "=" * (-len(id) % 4)), MAX_ID_DESCOMPRIMIDO)
+        if descompresor.unconsumed_tail:
+            return None
+        vehiculos, inicio, fin, intervalo = orjson.loads(datos)
+        return [int(v) for v in vehiculos], float(inicio), float(fin), float(intervalo)
+    except (ValueError, TypeError, zlib.error):
+        return None
+
+class Pista:
+    """Puntos de un dispositivo como arrays ordenados por tiempo (epoch en segundos)"""
+
+    __slots__ = ("ts", "lat", "lng", "vel", "rumbo")
+
+    def __init__(self, ts, lat, lng, vel, rumbo):
+        self.ts = np.asarray(ts, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.vel = np.asarray(vel, dtype=np.float64)
+        # Rumbo desenrollado para interpolar 350° -> 10° por el camino corto
+        self.rumbo = np.unwrap(np.radians(np.asarray(rumbo, dtype=np.float64)))
+
+    def interpolar(self, tiempos: np.ndarray) -> Dict[str, np.ndarray]:
+        """Interpolar sobre los tiempos pedidos usando solo la ventana de puntos que los cubre"""
+        i0 = max(int(np.searchsorted(self.ts, tiempos[0], side="right")) - 1, 0)
+        i1 = min(int(np.searchsorted(self.ts, tiempos[-1], side="left")) + 1, len(self.ts))
+        ts = self.ts[i0:i1]
+
+        fuera = (tiempos < self.ts[0]) | (tiempos > self.ts[-1])
+        resultado = {
+            "lat": np.interp(tiempos, ts, self.lat[i0:i1]),
+            "lng": np.interp(tiempos, ts, self.lng[i0:i1]),
+            "vel": np.interp(tiempos, ts, self.vel[i0:i1]),
+            "rumbo": np.degrees(np.interp(tiempos, ts, self.rumbo[i0:i1])) % 360.0,
+        }
+        for clave, valores in resultado.items():
+            valores[fuera] = np.nan
+            resultado[clave] = np.round(valores, 6 if clave in ("lat", "lng") else 1)
+        return resultado
+
+class Reproduccion:
+    """Historial de varios dispositivos remuestreado a intervalo fijo, servido por bloques.
+
+    Los frames no se materializan: el índice de un instante es aritmético
+    ((t - inicio) / intervalo), así buscar una posición no relee desde el comienzo.
+    """
+
+    def __init__(self, id: str, pistas: Dict[int, Pista], inicio: float, fin: float,
+                 intervalo: float, frames_por_bloque: int):
+        self.id = id
+        self.pistas = pistas
+        self.inicio = inicio
+        self.fin = fin
+        self.intervalo = intervalo
+        self.frames_por_bloque = frames_por_bloque
+        self.total_frames = int(math.floor((fin - inicio) / intervalo)) + 1
+        self.usado_en = time.monotonic()
+
+    @property
+    def total_bloques(self) -> int:
+        return (self.total_frames + self.frames_por_bloque - 1) // self.frames_por_bloque
+
+    def indice_bloques(self) -> List[Dict[str, float]]:
+        paso = self.frames_por_bloque * self.intervalo
+        return [{"bloque": i, "desde": self.inicio + i * paso} for i in range(self.total_bloques)]
+
+    def frame_en(self, instante: float) -> int:
+        indice = int(math.ceil((instante - self.inicio) / self.intervalo))
+        return min(max(indice, 0), self.total_frames)
+
+    def bloques(self, desde: Optional[float] = None, hasta: Optional[float] = None) -> Iterator[bytes]:
+        """Líneas NDJSON, una por bloque de frames, desde el instante pedido"""
+        primero = self.frame_en(desde) if desde is not None else 0
+        ultimo = self.frame_en(hasta) if hasta is not None else self.total_frames
+
+        for comienzo in range(primero, ultimo, self.frames_por_bloque):
+            final = min(comienzo + self.frames_por_bloque, ultimo)
+            tiempos = self.inicio + np.arange(comienzo, final, dtype=np.float64) * self.intervalo
+            dispositivos = {
+                dispositivo_id: pista.interpolar(tiempos)
+                for dispositivo_id, pista in self.pistas.items()
+                if pista.ts[0] <= tiempos[-1] and pista.ts[-1] >= tiempos[0]
+            }
+            self.usado_en = time.monotonic()
+            yield orjson.dumps(
+                {"frame": comienzo, "t": tiempos, "dispositivos": dispositivos},
+                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE,
+            )
+
+class AlmacenReproducciones:
+    """LRU en memoria de reproducciones preparadas, con vencimiento por inactividad.
+
+    Es por worker: una que no esté acá se rearma desde su id (ver codificar_id).
+    """
+
+    def __init__(self, max_sesiones: int, ttl_seg: float):
+        self.max_sesiones = max_sesiones
+        self.ttl_seg = ttl_seg
+        self._sesiones: "OrderedDict[str, Reproduccion]" = OrderedDict()
+
+    def guardar(self, reproduccion: Reproduccion) -> None:
+        self._purgar()
+        self._sesiones[reproduccion.id] = reproduccion
+        while len(self._sesiones) > self.max_sesiones:
+            self._sesiones.popitem(last=False)
+
+    def obtener(self, id: str) -> Optional[Reproduccion]:
+        self._purgar()
+        reproduccion = self._sesiones.get(id)
+        if reproduccion is not None:
+            self._sesiones.move_to_end(id)
+            reproduccion.usado_en = time.monotonic()
+        return reproduccion
+
+    def _purgar(self) -> None:
+        limite = time.monotonic() - self.ttl_seg
+        for id in [i for i, r in self._sesiones.items() if r.usado_en < limite]:
+            del self._sesiones[id]
@@ -0,0 +1,144 @@
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from core.espacial import haversine_km
+
+logger = logging.getLogger(__name__)
+
+Clave = Tuple[int, datetime]
+
+def _utc(valor: datetime) -> datetime:
+    return valor.replace(tzinfo=timezone.utc) if valor.tzinfo is None else valor.astimezone(timezone.utc)
+
+def inicio_hora(marca_tiempo: datetime) -> datetime:
+    return _utc(marca_tiempo).replace(minute=0, second=0, microsecond=0)
+
+def inicio_dia(marca_tiempo: datetime, zona: ZoneInfo, dias: int = 0) -> datetime:
+    """Medianoche local del día del fix (desplazado `dias` días), expresada en UTC"""
+    local = _utc(marca_tiempo).astimezone(zona).date() + timedelta(days=dias)
+    return datetime(local.year, local.month, local.day, tzinfo=zona).astimezone(timezone.utc)
+
+def limites_dia(dia: date, zona: ZoneInfo) -> Tuple[datetime, datetime]:
+    """Inicio y fin (UTC) del día local"""
+    inicio = datetime(dia.year, dia.month, dia.day, tzinfo=zona)
+    return inicio.astimezone(timezone.utc), inicio_dia(inicio, zona, dias=1)
+
+def dia_local(marca_tiempo: datetime, zona: ZoneInfo) -> date:
+    return _utc(marca_tiempo).astimezone(zona).date()
+
+def dia_cerrado(dia: date, zona: ZoneInfo, gracia_min: float) -> bool:
+    """Un día ya no recibe fixes pasado su fin más un margen para los atrasados"""
+    fin = limites_dia(dia, zona)[1]
+    return fin + timedelta(minutes=gracia_min) < datetime.now(timezone.utc)
+
+class Acumulado:
+    """Métricas de un dispositivo en un período; se combinan sumando"""
+
+    __slots__ = ("distancia_km", "velocidad_maxima", "segundos_movimiento", "puntos", "primer_fix", "ultimo_fix")
+
+    def __init__(self):
+        self.distancia_km = 0.0
+        self.velocidad_maxima = 0.0
+        self.segundos_movimiento = 0.0
+        self.puntos = 0
+        self.primer_fix: Optional[datetime] = None
+        self.ultimo_fix: Optional[datetime] = None
+
+    def combinar(self, otro: "Acumulado") -> None:
+        self.distancia_km += otro.distancia_km
+        self.velocidad_maxima = max(self.velocidad_maxima, otro.velocidad_maxima)
+        self.segundos_movimiento += otro.segundos_movimiento
+        self.puntos += otro.puntos
+        if otro.primer_fix is not None and (self.primer_fix is None or otro.primer_fix < self.primer_fix):
+            self.primer_fix = otro.primer_fix
+        if otro.ultimo_fix is not None and (self.ultimo_fix is None or otro.ultimo_fix > self.ultimo_fix):
+            self.ultimo_fix = otro.ultimo_fix
+
+    def como_fila(self, dispositivo_id: int, periodo: datetime) -> Dict:
+        return {
+            "dispositivo_id": dispositivo_id,
+            "periodo": periodo,
+            "distancia_km": self.distancia_km,
+            "velocidad_maxima": self.velocidad_maxima,
+            "segundos_movimiento": self.segundos_movimiento,
+            "puntos": self.puntos,
+            "primer_fix": self.primer_fix,
+            "ultimo_fix": self.ultimo_fix,
+        }
+
+class CalculadorResumenes:
+    """Aporte de cada fix a los resúmenes, a partir del delta con el fix anterior.
+
+    El tramo anterior -> actual se imputa al período del fix actual. Cuenta
+    como movimiento si alguna de las dos velocidades o la velocidad media del
+    tramo supera el umbral, y solo si el hueco no excede max_hueco_seg (un
+    corte de señal largo no suma horas de marcha).
+    """
+
+    def __init__(self, umbral_kmh: float, max_hueco_seg: float, zona: str):
+        self.umbral_kmh = umbral_kmh
+        self.max_hueco_seg = max_hueco_seg
+        self.zona = ZoneInfo(zona)
+
+    def aporte(self, anterior: Optional[Tuple[float, float, datetime, float]],
+               actual: Tuple[float, float, datetime, float]) -> Acumulado:
+        lat, lng, marca_tiempo, velocidad = actual
+        marca_tiempo = _utc(marca_tiempo)
+        velocidad = velocidad or 0.0
+
+        acumulado = Acumulado()
+        acumulado.puntos = 1
+        acumulado.velocidad_maxima = velocidad
+        acumulado.primer_fix = acumulado.ultimo_fix = marca_tiempo
+
+        if anterior is not None:
+            lat0, lng0, marca0, velocidad0 = anterior
+            segundos = (marca_tiempo - _utc(marca0)).total_seconds()
+            distancia = haversine_km(lat0, lng0, lat, lng)
+            acumulado.distancia_km = distancia
+            if 0 < segundos <= self.max_hueco_seg:
+                media = distancia / (segundos / 3600.0)
+                if max(velocidad0 or 0.0, velocidad, media) >= self.umbral_kmh:
+                    acumulado.segundos_movimiento = segundos
+        return acumulado
+
+    def acumular(self, puntos: Iterable[Tuple[int, float, float, datetime, float]],
+                 previos: Optional[Dict[int, Tuple[float, float, datetime, float]]] = None) -> Dict[Clave, Acumulado]:
+        """Resúmenes horarios de puntos ordenados por dispositivo y tiempo.
+
+        previos tiene, por dispositivo, el último fix anterior al rango, para
+        que el primer tramo del rango también sume distancia.
+        """
+        previos = previos or {}
+        horarios: Dict[Clave, Acumulado] = {}
+        dispositivo_actual = None
+        anterior = None
+
+        for dispositivo_id, lat, lng, marca_tiempo, velocidad in puntos:
+            if dispositivo_id != dispositivo_actual:
+                dispositivo_actual = dispositivo_id
+                anterior = previos.get(dispositivo_id)
+            actual = (lat, lng, marca_tiempo, velocidad)
+            clave = (dispositivo_id, inicio_hora(marca_tiempo))
+            acumulado = horarios.get(clave)
+            if acumulado is None:
+                acumulado = horarios[clave] = Acumulado()
+            acumulado.combinar(self.aporte(anterior, actual))
+            anterior = actual
+        return horarios
+
+    def diarios(self, horarios: Dict[Clave, Acumulado]) -> Dict[Clave, Acumulado]:
+        resultado: Dict[Clave, Acumulado] = {}
+        for (dispositivo_id, hora), acumulado in horarios.items():
+            clave = (dispositivo_id, inicio_dia(hora, self.zona))
+            dia = resultado.get(clave)
+            if dia is None:
+                dia = resultado[clave] = Acumulado()
+            dia.combinar(acumulado)
+        return resultado
+
+    def rango_dias(self, fecha_inicio: datetime, fecha_fin: datetime) -> Tuple[datetime, datetime]:
+        """Rango ampliado a días locales completos, para reconstruir diarios enteros"""
+        return inicio_dia(fecha_inicio, self.zona), inicio_dia(fecha_fin, self.zona, dias=1)
@@ -0,0 +1,47 @@
+from fastapi.responses import ORJSONResponse
+from typing import Any, Callable, Iterable, List, Sequence, Union
+
+# Un campo es un nombre plano o (nombre, [subcampos]) para anidar un objeto
+Campo = Union[str, tuple]
+
+def _indices(campos: Sequence[Campo], siguiente: List[int]) -> tuple:
+    """Resuelve cada campo a su posición en la fila, o a la tupla de sus subcampos"""
+    resueltos = []
+    for campo in campos:
+        if isinstance(campo, tuple):
+            nombre, subcampos = campo
+            resueltos.append((nombre, _indices(subcampos, siguiente)))
+        else:
+            resueltos.append((campo, siguiente[0]))
+            siguiente[0] += 1
+    return tuple(resueltos)
+
+def _armar(resueltos: tuple, fila: Sequence[Any]) -> dict:
+    return {
+        nombre: _armar(posicion, fila) if isinstance(posicion, tuple) else fila[posicion]
+        for nombre, posicion in resueltos
+    }
+
+def compilar_mapeo(campos: Sequence[Campo]) -> Callable[[Sequence[Any]], dict]:
+    """Genera una función fila -> dict con los índices resueltos de antemano.
+
+    Sin anidamiento es un dict(zip(...)) sobre la tupla de nombres; con
+    subobjetos se recorren las posiciones ya resueltas.
+    """
+    if all(isinstance(campo, str) for campo in campos):
+        nombres = tuple(campos)
+        return lambda fila: dict(zip(nombres, fila))
+    resueltos = _indices(campos, [0])
+    return lambda fila: _armar(resueltos, fila)
+
+def serializar_filas(filas: Iterable[Sequence[Any]], mapeo: Callable[[Sequence[Any]], dict]) -> List[dict]:
+    """Aplica un mapeo a todas las filas"""
+    return [mapeo(fila) for fila in filas]
+
+def respuesta_rapida(contenido: Any, status_code: int = 200) -> ORJSONResponse:
+    """Respuesta serializada con orjson.
+
+    Al devolver un Response directamente, FastAPI omite la validación de
+    response_model, que sería redundante para filas ya tipadas por la base.
+    """
+    return ORJSONResponse(content=contenido, status_code=status_code)
@@ -1,9 +1,22 @@
+import time
+_inicio_carga = time.perf_counter()
+
 from pathlib import Path
 from dotenv import load_dotenv
+from datetime import datetime, timezone
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from core.database import init_db
-from routes import (tracker, vehiculo_routes as vehiculos, dispositivo_routes as dispositivos)
+from fastapi.middleware.gzip import GZipMiddleware
+from core.database import init_db, close_db, metricas_pools, metricas_db, verificar_db, engine, AsyncSessionLocal
+from core.metricas import MiddlewareMetricas, metricas_http
+from core.realtime import relay_posiciones
+from core.cache import cache_dias
+from core.config import settings
+from services.ultima_posicion_service import UltimaPosicionService
+from services.regla_service import ReglaService
+import asyncio
+from routes import (tracker, vehiculo_routes as vehiculos, dispositivo_routes as dispositivos, geocerca_routes as geocercas, evento_routes as eventos, reporte_routes as reportes)
 import logging
 
 logging.basicConfig(
@@ -32,26 +45,97 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compresión de respuestas (recorridos e historiales largos) si el cliente envía Accept-Encoding: gzip
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+# Latencia por ruta y consultas / tiempo de base por request (ver /metrics); el último agregado envuelve a los demás
+app.add_middleware(MiddlewareMetricas)
+
 # Incluir routers
 app.include_router(tracker.router, prefix="/api")
 app.include_router(vehiculos.router, prefix="/api")
 app.include_router(dispositivos.router, prefix="/api")
+app.include_router(geocercas.router, prefix="/api")
+app.include_router(eventos.router, prefix="/api")
+app.include_router(reportes.router, prefix="/api")
+
+# Importar módulos y armar la app; numpy y alembic se cargan recién cuando se usan
+tiempo_carga_ms = (time.perf_counter() - _inicio_carga) * 1000
+
+tareas_fondo = []
+iniciada_en = datetime.now(timezone.utc)
 
 @app.on_event("startup")
 async def startup_event():
-    """Inicializar base de datos al arrancar"""
+    """Inicializar base de datos al arrancar y registrar cuánto tarda cada paso"""
+    tiempos = {"modulos": tiempo_carga_ms}
+    marca = time.perf_counter()
+
+    def medir(paso: str) -> None:
+        nonlocal marca
+        ahora = time.perf_counter()
+        tiempos[paso] = (ahora - marca) * 1000
+        marca = ahora
+
     try:
-        await init_db()
-        logger.info("Aplicación iniciada correctamente")
+        esquema = await init_db()
+        medir("esquema")
+        async with AsyncSessionLocal() as db:
+            if await UltimaPosicionService.esta_vacia(db):
+                await UltimaPosicionService.reconstruir(db)
+        medir("ultimas_posiciones")
+        tareas_fondo.append(asyncio.create_task(ReglaService.ejecutar_planificador()))
+        tareas_fondo.append(asyncio.create_task(relay_posiciones.ejecutar(engine)))
+        tareas_fondo.append(asyncio.create_task(cache_dias.ejecutar_barrido(settings.CACHE_DIAS_BARRIDO_SEG)))
+        medir("tareas")
+        detalle = ", ".join(f"{paso} {ms:.0f} ms" for paso, ms in tiempos.items())
+        logger.info(f"Aplicación iniciada en {sum(tiempos.values()):.0f} ms (esquema {esquema}; {detalle})")
     except Exception as e:
         logger.error(f"Error al iniciar la aplicación: {e}")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Detener tareas de fondo al apagar"""
+    for tarea in tareas_fondo:
+        tarea.cancel()
+    await close_db()
+
+@app.get("/db/pools")
+async def estado_pools():
+    """Utilización de los pools de conexiones (primario y réplica de lectura)"""
+    return metricas_pools()
+
+@app.get("/metrics")
+async def metricas():
+    """Latencia por ruta, consultas por request, tiempo de base y espera / uso de los pools"""
+    return {
+        "desde": iniciada_en.isoformat(),
+        "http": metricas_http.estadisticas(),
+        "db": {nombre: m.estadisticas() for nombre, m in metricas_db.items()},
+        "pools": metricas_pools(),
+    }
+
 @app.get("/health")
 async def health_check():
-    """Health check para el API Gateway"""
-    return {
-        "status": "healthy",
-        "service": "tracking",
-        "timestamp": "2024-06-10T00:00:00Z"
-    }
\ No newline at end of file
+    """Health check para el API Gateway: 503 si la base no responde, degraded si el pool está lleno"""
+    ahora = datetime.now(timezone.utc)
+    db = await verificar_db()
+    pool = metricas_pools()["primario"]
+    if not db["alcanzable"]:
+        estado = "unhealthy"
+    elif pool["en_uso"] >= pool["capacidad"]:
+        estado = "degraded"
+    else:
+        estado = "healthy"
+    return JSONResponse(
+        status_code=503 if estado == "unhealthy" else 200,
+        content={
+            "status": estado,
+            "service": "tracking",
+            "timestamp": ahora.isoformat(),
+            "uptime_seg": round((ahora - iniciada_en).total_seconds()),
+            "db": db,
+            "pool": pool,
+        },
+    )
\ No newline at end of file
@@ -0,0 +1,42 @@
+import asyncio
+from logging.config import fileConfig
+
+from alembic import context
+
+from core.database import Base, engine
+import models  # noqa: F401  registra las tablas en Base.metadata
+
+config = context.config
+target_metadata = Base.metadata
+
+def _ejecutar(conexion) -> None:
+    context.configure(connection=conexion, target_metadata=target_metadata, compare_type=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+async def _ejecutar_online() -> None:
+    async with engine.connect() as conexion:
+        await conexion.run_sync(_ejecutar)
+    await engine.dispose()
+
+def _ejecutar_offline() -> None:
+    """Solo genera el SQL (alembic upgrade head --sql)"""
+    context.configure(
+        url=engine.url.render_as_string(hide_password=False),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+# Desde la aplicación (core.migraciones) llega la conexión abierta; desde la CLI se abre una
+conexion = config.attributes.get("connection")
+if context.is_offline_mode():
+    _ejecutar_offline()
+elif conexion is not None:
+    _ejecutar(conexion)
+else:
+    if config.config_file_name is not None:
+        fileConfig(config.config_file_name)
+    asyncio.run(_ejecutar_online())
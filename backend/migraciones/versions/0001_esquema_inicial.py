@@ -0,0 +1,142 @@
+"""Esquema inicial (el que creaba create_all antes de la clave natural de ubicaciones)
+
+Revision ID: 0001_esquema_inicial
+Revises:
+Fecha: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001_esquema_inicial"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table('dispositivos',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('imei', sa.String(), nullable=False),
+        sa.Column('marca', sa.String(), nullable=True),
+        sa.Column('modelo', sa.String(), nullable=True),
+        sa.Column('firmware_version', sa.String(), nullable=True),
+        sa.Column('activo', sa.Boolean(), nullable=True),
+        sa.Column('creado_en', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('ultima_vez_visto', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_dispositivos_id', 'dispositivos', ['id'], unique=False)
+    op.create_index('ix_dispositivos_imei', 'dispositivos', ['imei'], unique=True)
+
+    op.create_table('geocercas',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('nombre', sa.String(), nullable=False),
+        sa.Column('tipo', sa.String(), nullable=False),
+        sa.Column('puntos', sa.JSON(), nullable=True),
+        sa.Column('centro_lat', sa.Float(), nullable=True),
+        sa.Column('centro_lng', sa.Float(), nullable=True),
+        sa.Column('radio_m', sa.Float(), nullable=True),
+        sa.Column('activo', sa.Boolean(), nullable=True),
+        sa.Column('creado_en', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('actualizado_en', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_geocercas_id', 'geocercas', ['id'], unique=False)
+
+    op.create_table('eventos',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('dispositivo_id', sa.Integer(), nullable=False),
+        sa.Column('tipo', sa.String(), nullable=False),
+        sa.Column('geocerca_id', sa.Integer(), nullable=True),
+        sa.Column('latitud', sa.Float(), nullable=True),
+        sa.Column('longitud', sa.Float(), nullable=True),
+        sa.Column('detalle', sa.JSON(), nullable=True),
+        sa.Column('marca_tiempo', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['dispositivo_id'], ['dispositivos.id']),
+        sa.ForeignKeyConstraint(['geocerca_id'], ['geocercas.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_eventos_dispositivo_marca_tiempo', 'eventos', ['dispositivo_id', 'marca_tiempo'], unique=False)
+    op.create_index('ix_eventos_id', 'eventos', ['id'], unique=False)
+    op.create_index('ix_eventos_tipo', 'eventos', ['tipo'], unique=False)
+
+    for tabla in ('resumenes_horarios', 'resumenes_diarios'):
+        op.create_table(tabla,
+            sa.Column('dispositivo_id', sa.Integer(), nullable=False),
+            sa.Column('periodo', sa.DateTime(timezone=True), nullable=False),
+            sa.Column('distancia_km', sa.Float(), nullable=False),
+            sa.Column('velocidad_maxima', sa.Float(), nullable=False),
+            sa.Column('segundos_movimiento', sa.Float(), nullable=False),
+            sa.Column('puntos', sa.Integer(), nullable=False),
+            sa.Column('primer_fix', sa.DateTime(timezone=True), nullable=True),
+            sa.Column('ultimo_fix', sa.DateTime(timezone=True), nullable=True),
+            sa.ForeignKeyConstraint(['dispositivo_id'], ['dispositivos.id']),
+            sa.PrimaryKeyConstraint('dispositivo_id', 'periodo')
+        )
+
+    op.create_table('ubicaciones',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('dispositivo_id', sa.Integer(), nullable=False),
+        sa.Column('latitud', sa.Float(), nullable=False),
+        sa.Column('longitud', sa.Float(), nullable=False),
+        sa.Column('velocidad', sa.Float(), nullable=True),
+        sa.Column('direccion', sa.Float(), nullable=True),
+        sa.Column('altitud', sa.Float(), nullable=True),
+        sa.Column('precision', sa.Float(), nullable=True),
+        sa.Column('marca_tiempo', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['dispositivo_id'], ['dispositivos.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_ubicaciones_id', 'ubicaciones', ['id'], unique=False)
+    op.create_index('ix_ubicaciones_marca_tiempo', 'ubicaciones', ['marca_tiempo'], unique=False)
+
+    op.create_table('vehiculos',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('patente', sa.String(), nullable=False),
+        sa.Column('marca', sa.String(), nullable=True),
+        sa.Column('modelo', sa.String(), nullable=True),
+        sa.Column('año', sa.Integer(), nullable=True),
+        sa.Column('tipo_motor', sa.String(), nullable=True),
+        sa.Column('capacidad_combustible', sa.Float(), nullable=True),
+        sa.Column('tipo_vehiculo', sa.String(), nullable=True),
+        sa.Column('odometro_inicial', sa.Float(), nullable=True),
+        sa.Column('velocidad_maxima_permitida', sa.Float(), nullable=True),
+        sa.Column('activo', sa.Boolean(), nullable=True),
+        sa.Column('creado_en', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('dispositivo_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['dispositivo_id'], ['dispositivos.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_vehiculos_id', 'vehiculos', ['id'], unique=False)
+    op.create_index('ix_vehiculos_patente', 'vehiculos', ['patente'], unique=True)
+
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(sa.schema.CreateSequence(sa.Sequence('ultimas_posiciones_version_seq')))
+    op.create_table('ultimas_posiciones',
+        sa.Column('dispositivo_id', sa.Integer(), nullable=False),
+        sa.Column('ubicacion_id', sa.Integer(), nullable=False),
+        sa.Column('latitud', sa.Float(), nullable=False),
+        sa.Column('longitud', sa.Float(), nullable=False),
+        sa.Column('velocidad', sa.Float(), nullable=True),
+        sa.Column('direccion', sa.Float(), nullable=True),
+        sa.Column('altitud', sa.Float(), nullable=True),
+        sa.Column('precision', sa.Float(), nullable=True),
+        sa.Column('marca_tiempo', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['dispositivo_id'], ['dispositivos.id']),
+        sa.ForeignKeyConstraint(['ubicacion_id'], ['ubicaciones.id']),
+        sa.PrimaryKeyConstraint('dispositivo_id')
+    )
+    op.create_index('ix_ultimas_posiciones_marca_tiempo', 'ultimas_posiciones', ['marca_tiempo'], unique=False)
+    op.create_index('ix_ultimas_posiciones_version', 'ultimas_posiciones', ['version'], unique=False)
+
+def downgrade() -> None:
+    op.drop_table('ultimas_posiciones')
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(sa.schema.DropSequence(sa.Sequence('ultimas_posiciones_version_seq')))
+    op.drop_table('vehiculos')
+    op.drop_table('ubicaciones')
+    op.drop_table('resumenes_diarios')
+    op.drop_table('resumenes_horarios')
+    op.drop_table('eventos')
+    op.drop_table('geocercas')
+    op.drop_table('dispositivos')
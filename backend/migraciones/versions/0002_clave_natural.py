@@ -0,0 +1,54 @@
+"""Clave natural de ubicaciones: (dispositivo_id, marca_tiempo) única y columna secuencia
+
+Las bases con datos pueden tener fixes repetidos: antes del índice se
+repunta ultimas_posiciones al fix que se conserva y se borran los demás.
+Si el índice ya existe (bases migradas por el arranque anterior) no hace nada.
+
+Revision ID: 0002_clave_natural
+Revises: 0001_esquema_inicial
+Fecha: 2026-10-19
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+revision = "0002_clave_natural"
+down_revision = "0001_esquema_inicial"
+branch_labels = None
+depends_on = None
+
+INDICE = "uq_ubicaciones_dispositivo_marca_tiempo"
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        inspector = sa.inspect(bind)
+        if "secuencia" not in {c["name"] for c in inspector.get_columns("ubicaciones")}:
+            op.add_column('ubicaciones', sa.Column('secuencia', sa.Integer(), nullable=True))
+        existentes = {i["name"] for i in inspector.get_indexes("ubicaciones")}
+        existentes |= {u["name"] for u in inspector.get_unique_constraints("ubicaciones")}
+        if INDICE not in existentes:
+            op.create_index(INDICE, 'ubicaciones', ['dispositivo_id', 'marca_tiempo'], unique=True)
+        return
+
+    op.execute("ALTER TABLE ubicaciones ADD COLUMN IF NOT EXISTS secuencia INTEGER")
+    if not context.is_offline_mode() and bind.scalar(sa.text(f"SELECT to_regclass('{INDICE}')")) is not None:
+        return
+    op.execute("""
+        UPDATE ultimas_posiciones up SET ubicacion_id = d.conservar
+        FROM (
+            SELECT id, min(id) OVER (PARTITION BY dispositivo_id, marca_tiempo) AS conservar
+            FROM ubicaciones
+        ) d
+        WHERE up.ubicacion_id = d.id AND d.id <> d.conservar
+    """)
+    op.execute("""
+        DELETE FROM ubicaciones u USING ubicaciones o
+        WHERE u.dispositivo_id = o.dispositivo_id
+          AND u.marca_tiempo = o.marca_tiempo
+          AND u.id > o.id
+    """)
+    op.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {INDICE} ON ubicaciones (dispositivo_id, marca_tiempo)")
+
+def downgrade() -> None:
+    op.drop_index(INDICE, table_name='ubicaciones')
+    op.drop_column('ubicaciones', 'secuencia')
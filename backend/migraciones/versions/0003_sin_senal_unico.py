@@ -0,0 +1,41 @@
+"""Un solo evento sin_senal por dispositivo y corte de reporte
+
+La marca de tiempo del evento es last_seen + REGLAS_SIN_REPORTE_MIN, igual
+en todos los workers: el índice único parcial hace que solo uno lo inserte.
+
+Revision ID: 0003_sin_senal_unico
+Revises: 0002_clave_natural
+Fecha: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003_sin_senal_unico"
+down_revision = "0002_clave_natural"
+branch_labels = None
+depends_on = None
+
+INDICE = "uq_eventos_sin_senal"
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        if INDICE not in {i["name"] for i in sa.inspect(bind).get_indexes("eventos")}:
+            op.create_index(INDICE, 'eventos', ['dispositivo_id', 'marca_tiempo'], unique=True,
+                            sqlite_where=sa.text("tipo = 'sin_senal'"))
+        return
+
+    op.execute("""
+        DELETE FROM eventos e USING eventos o
+        WHERE e.tipo = 'sin_senal' AND o.tipo = 'sin_senal'
+          AND e.dispositivo_id = o.dispositivo_id
+          AND e.marca_tiempo = o.marca_tiempo
+          AND e.id > o.id
+    """)
+    op.execute(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {INDICE} ON eventos (dispositivo_id, marca_tiempo) "
+        "WHERE tipo = 'sin_senal'"
+    )
+
+def downgrade() -> None:
+    op.drop_index(INDICE, table_name='eventos')
@@ -0,0 +1,32 @@
+"""La versión de ultimas_posiciones pasa a ser el xid de la transacción
+
+Con una secuencia, una versión tomada antes se podía confirmar después de
+otra mayor y un cursor basado en max(version) la salteaba. Ahora los
+cursores son el xmin del snapshot de lectura (ver CursorFlota). Las filas
+existentes toman el xid de esta migración, menor que cualquiera posterior.
+
+Revision ID: 0004_version_por_xid
+Revises: 0003_sin_senal_unico
+Fecha: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004_version_por_xid"
+down_revision = "0003_sin_senal_unico"
+branch_labels = None
+depends_on = None
+
+SECUENCIA = "ultimas_posiciones_version_seq"
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("UPDATE ultimas_posiciones SET version = pg_current_xact_id()::text::bigint")
+    op.execute(f"DROP SEQUENCE IF EXISTS {SECUENCIA}")
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute(sa.schema.CreateSequence(sa.Sequence(SECUENCIA)))
+    op.execute(f"SELECT setval('{SECUENCIA}', COALESCE((SELECT max(version) FROM ultimas_posiciones), 0) + 1, false)")
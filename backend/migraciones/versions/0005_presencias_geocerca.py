@@ -0,0 +1,54 @@
+"""Estado dentro/fuera de geocercas compartido: tabla presencias_geocerca
+
+Antes el estado vivía en la memoria de cada worker: tras un reinicio se
+perdían las transiciones y con varios workers se duplicaban o faltaban
+eventos. La tabla se siembra con el último evento de entrada/salida de cada
+(dispositivo, geocerca) activa: hay fila si ese evento es una entrada.
+
+Revision ID: 0005_presencias_geocerca
+Revises: 0004_version_por_xid
+Fecha: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005_presencias_geocerca"
+down_revision = "0004_version_por_xid"
+branch_labels = None
+depends_on = None
+
+TABLA = "presencias_geocerca"
+
+def upgrade() -> None:
+    # Bases adoptadas desde create_all ya pueden tenerla
+    if sa.inspect(op.get_bind()).has_table(TABLA):
+        return
+
+    op.create_table(TABLA,
+        sa.Column('dispositivo_id', sa.Integer(), nullable=False),
+        sa.Column('geocerca_id', sa.Integer(), nullable=False),
+        sa.Column('desde', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['dispositivo_id'], ['dispositivos.id']),
+        sa.ForeignKeyConstraint(['geocerca_id'], ['geocercas.id']),
+        sa.PrimaryKeyConstraint('dispositivo_id', 'geocerca_id')
+    )
+    op.create_index('ix_presencias_geocerca_geocerca_id', TABLA, ['geocerca_id'], unique=False)
+
+    op.execute(f"""
+        INSERT INTO {TABLA} (dispositivo_id, geocerca_id, desde)
+        SELECT e.dispositivo_id, e.geocerca_id, e.marca_tiempo
+        FROM eventos e
+        JOIN geocercas g ON g.id = e.geocerca_id AND g.activo
+        WHERE e.tipo = 'geocerca_entrada'
+          AND NOT EXISTS (
+              SELECT 1 FROM eventos o
+              WHERE o.dispositivo_id = e.dispositivo_id
+                AND o.geocerca_id = e.geocerca_id
+                AND o.tipo IN ('geocerca_entrada', 'geocerca_salida')
+                AND (o.marca_tiempo > e.marca_tiempo OR (o.marca_tiempo = e.marca_tiempo AND o.id > e.id))
+          )
+    """)
+
+def downgrade() -> None:
+    op.drop_index('ix_presencias_geocerca_geocerca_id', table_name=TABLA)
+    op.drop_table(TABLA)
@@ -0,0 +1,42 @@
+"""Una sola alarma por dispositivo, tipo y marca de tiempo
+
+registrar_alarma buscaba y después insertaba: dos reintentos simultáneos
+de la misma alarma podían guardarla dos veces. Con el índice único parcial
+inserta con ON CONFLICT DO NOTHING y, si choca, devuelve la ya guardada.
+
+Revision ID: 0006_alarma_unica
+Revises: 0005_presencias_geocerca
+Fecha: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006_alarma_unica"
+down_revision = "0005_presencias_geocerca"
+branch_labels = None
+depends_on = None
+
+INDICE = "uq_eventos_alarma"
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        if INDICE not in {i["name"] for i in sa.inspect(bind).get_indexes("eventos")}:
+            op.create_index(INDICE, 'eventos', ['dispositivo_id', 'tipo', 'marca_tiempo'], unique=True,
+                            sqlite_where=sa.text("tipo LIKE 'alarma_%'"))
+        return
+
+    op.execute("""
+        DELETE FROM eventos e USING eventos o
+        WHERE e.tipo LIKE 'alarma_%' AND o.tipo = e.tipo
+          AND e.dispositivo_id = o.dispositivo_id
+          AND e.marca_tiempo = o.marca_tiempo
+          AND e.id > o.id
+    """)
+    op.execute(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {INDICE} ON eventos (dispositivo_id, tipo, marca_tiempo) "
+        "WHERE tipo LIKE 'alarma_%'"
+    )
+
+def downgrade() -> None:
+    op.drop_index(INDICE, table_name='eventos')
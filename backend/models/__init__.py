@@ -1,5 +1,9 @@
 from .vehiculo import Vehiculo
 from .dispositivo import Dispositivo
 from .ubicacion import Ubicacion
+from .ultima_posicion import UltimaPosicion
+from .geocerca import Geocerca, PresenciaGeocerca
+from .evento import Evento
+from .resumen import ResumenHorario, ResumenDiario
 
-__all__ = ["Vehiculo", "Dispositivo", "Ubicacion"]
\ No newline at end of file
+__all__ = ["Vehiculo", "Dispositivo", "Ubicacion", "UltimaPosicion", "Geocerca", "PresenciaGeocerca", "Evento", "ResumenHorario", "ResumenDiario"]
\ No newline at end of file
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON, Index, text
+from sqlalchemy.sql import func
+from core.database import Base
+
+class Evento(Base):
+    __tablename__ = "eventos"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    dispositivo_id = Column(Integer, ForeignKey("dispositivos.id"), nullable=False)
+    tipo = Column(String, nullable=False, index=True)
+    geocerca_id = Column(Integer, ForeignKey("geocercas.id"))
+    latitud = Column(Float)
+    longitud = Column(Float)
+    detalle = Column(JSON)
+    timestamp = Column("marca_tiempo", DateTime(timezone=True), server_default=func.now(), nullable=False)
+    
+    __table_args__ = (
+        Index("ix_eventos_dispositivo_marca_tiempo", "dispositivo_id", "marca_tiempo"),
+        # Un sin_senal por corte de reporte aunque lo detecten varios workers
+        Index("uq_eventos_sin_senal", "dispositivo_id", "marca_tiempo", unique=True,
+              postgresql_where=text("tipo = 'sin_senal'"), sqlite_where=text("tipo = 'sin_senal'")),
+        # Un reintento de la misma alarma del equipo no la duplica
+        Index("uq_eventos_alarma", "dispositivo_id", "tipo", "marca_tiempo", unique=True,
+              postgresql_where=text("tipo LIKE 'alarma_%'"), sqlite_where=text("tipo LIKE 'alarma_%'")),
+    )
+    
+    def __repr__(self):
+        return f"<Evento(id={self.id}, tipo={self.tipo}, dispositivo_id={self.dispositivo_id})>"
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, JSON, ForeignKey
+from sqlalchemy.sql import func
+from core.database import Base
+
+class Geocerca(Base):
+    __tablename__ = "geocercas"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    nombre = Column(String, nullable=False)
+    tipo = Column(String, nullable=False)   # "poligono" | "circulo"
+    puntos = Column(JSON)                   # [[lat, lng], ...] para polígonos
+    centro_lat = Column(Float)
+    centro_lng = Column(Float)
+    radio_m = Column(Float)                 # metros, para círculos
+    activo = Column(Boolean, default=True)
+    created_at = Column("creado_en", DateTime(timezone=True), server_default=func.now())
+    updated_at = Column("actualizado_en", DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<Geocerca(id={self.id}, nombre={self.nombre})>"
+
+
+class PresenciaGeocerca(Base):
+    """Dispositivo dentro de una geocerca: fila presente desde su entrada hasta su salida"""
+    __tablename__ = "presencias_geocerca"
+    
+    dispositivo_id = Column(Integer, ForeignKey("dispositivos.id"), primary_key=True)
+    geocerca_id = Column(Integer, ForeignKey("geocercas.id"), primary_key=True, index=True)
+    desde = Column(DateTime(timezone=True), nullable=False)
+    
+    def __repr__(self):
+        return f"<PresenciaGeocerca(dispositivo_id={self.dispositivo_id}, geocerca_id={self.geocerca_id})>"
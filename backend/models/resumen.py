@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey
+from core.database import Base
+
+class ColumnasResumen:
+    """Métricas acumuladas de un dispositivo en un período (hora o día)"""
+    
+    dispositivo_id = Column(Integer, ForeignKey("dispositivos.id"), primary_key=True)
+    periodo = Column(DateTime(timezone=True), primary_key=True)   # inicio del período
+    distancia_km = Column(Float, nullable=False, default=0.0)
+    velocidad_maxima = Column(Float, nullable=False, default=0.0)
+    segundos_movimiento = Column(Float, nullable=False, default=0.0)
+    puntos = Column(Integer, nullable=False, default=0)
+    primer_fix = Column(DateTime(timezone=True))
+    ultimo_fix = Column(DateTime(timezone=True))
+
+class ResumenHorario(ColumnasResumen, Base):
+    __tablename__ = "resumenes_horarios"
+    
+    def __repr__(self):
+        return f"<ResumenHorario(dispositivo_id={self.dispositivo_id}, periodo={self.periodo})>"
+
+class ResumenDiario(ColumnasResumen, Base):
+    __tablename__ = "resumenes_diarios"
+    
+    def __repr__(self):
+        return f"<ResumenDiario(dispositivo_id={self.dispositivo_id}, periodo={self.periodo})>"
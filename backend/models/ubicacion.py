@@ -1,10 +1,15 @@
-from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from core.database import Base
 
 class Ubicacion(Base):
     __tablename__ = "ubicaciones"
+    # Clave natural: un dispositivo no reporta dos fixes con la misma marca de tiempo,
+    # así los reintentos del forwarder no duplican filas
+    __table_args__ = (
+        UniqueConstraint("dispositivo_id", "marca_tiempo", name="uq_ubicaciones_dispositivo_marca_tiempo"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     dispositivo_id = Column(Integer, ForeignKey("dispositivos.id"), nullable=False)
@@ -15,6 +20,7 @@ class Ubicacion(Base):
     altitud = Column(Float)                 # metros
     precision = Column(Float)               # metros
     # estado_motor = Column(Integer, default=0) 
+    secuencia = Column(Integer)             # número de serie del paquete en el equipo (opcional)
     timestamp = Column("marca_tiempo", DateTime(timezone=True), server_default=func.now(), index=True)
     
     dispositivo = relationship("Dispositivo", back_populates="ubicaciones")
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, BigInteger, Float, DateTime, ForeignKey
+from core.database import Base
+
+class UltimaPosicion(Base):
+    __tablename__ = "ultimas_posiciones"
+    
+    dispositivo_id = Column(Integer, ForeignKey("dispositivos.id"), primary_key=True)
+    ubicacion_id = Column(Integer, ForeignKey("ubicaciones.id"), nullable=False)
+    latitud = Column(Float, nullable=False)
+    longitud = Column(Float, nullable=False)
+    velocidad = Column(Float, default=0.0)
+    rumbo = Column("direccion", Float)
+    altitud = Column(Float)
+    precision = Column(Float)
+    timestamp = Column("marca_tiempo", DateTime(timezone=True), nullable=False, index=True)
+    # xid de la transacción que escribió la fila (pg_current_xact_id); ver CursorFlota
+    version = Column(BigInteger, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f"<UltimaPosicion(dispositivo_id={self.dispositivo_id}, version={self.version})>"
@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from core.database import get_db
+from core.database import get_db, get_db_lectura
 from services.dispositivo_service import DispositivoService
 from services.vehiculo_service import VehiculoService
+from services.importacion_service import ImportacionService
 from schemas.dispositivo_schema import (
     DispositivoCreate, DispositivoUpdate, DispositivoResponse, DispositivoWithUbicaciones
 )
-from typing import List
+from schemas.importacion_schema import ImportacionResponse
+from typing import List, Optional
 
 router = APIRouter(prefix="/dispositivos", tags=["dispositivos"])
 
@@ -31,24 +33,39 @@ async def crear_dispositivo(dispositivo: DispositivoCreate, db: AsyncSession = D
     
     return await DispositivoService.crear_dispositivo(db, dispositivo)
 
+@router.post("/importar", response_model=ImportacionResponse)
+async def importar_dispositivos(
+    request: Request,
+    formato: Optional[str] = Query(None, pattern="^(csv|ndjson)$", description="csv o ndjson; por defecto según Content-Type"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Alta masiva por CSV/NDJSON: upsert por imei y, si la fila trae patente, del vehículo vinculado"""
+    formato = formato or ImportacionService.formato_por_tipo(request.headers.get("content-type"))
+    if not formato:
+        raise HTTPException(status_code=415, detail="Enviar text/csv o application/x-ndjson, o indicar ?formato=")
+    try:
+        return await ImportacionService.importar_flota(db, ImportacionService.leer_filas(request.stream(), formato))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/", response_model=List[DispositivoResponse])
 async def listar_dispositivos(
     skip: int = Query(0, ge=0, description="Número de registros a omitir"),
     limit: int = Query(100, ge=1, le=1000, description="Límite de registros"),
     activos_solo: bool = Query(True, description="Solo dispositivos activos"),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db_lectura)
 ):
     return await DispositivoService.obtener_dispositivos(db, skip, limit, activos_solo)
 
 @router.get("/{dispositivo_id}", response_model=DispositivoResponse)
-async def obtener_dispositivo(dispositivo_id: str, db: AsyncSession = Depends(get_db)):
+async def obtener_dispositivo(dispositivo_id: str, db: AsyncSession = Depends(get_db_lectura)):
     dispositivo = await DispositivoService.obtener_dispositivo_por_id(db, dispositivo_id)
     if not dispositivo:
         raise HTTPException(status_code=404, detail="Dispositivo no encontrado")
     return dispositivo
 
 @router.get("/{dispositivo_id}/completo", response_model=DispositivoWithUbicaciones)
-async def obtener_dispositivo_completo(dispositivo_id: str, limit_ubicaciones: int = Query(100, ge=1, le=1000, description="Límite de ubicaciones"), db: AsyncSession = Depends(get_db)):
+async def obtener_dispositivo_completo(dispositivo_id: str, limit_ubicaciones: int = Query(100, ge=1, le=1000, description="Límite de ubicaciones"), db: AsyncSession = Depends(get_db_lectura)):
     dispositivo = await DispositivoService.obtener_dispositivo_con_ubicaciones(
         db, dispositivo_id, limit_ubicaciones
     )
@@ -57,14 +74,14 @@ async def obtener_dispositivo_completo(dispositivo_id: str, limit_ubicaciones: i
     return dispositivo
 
 @router.get("/imei/{imei}", response_model=DispositivoResponse)
-async def obtener_dispositivo_por_imei(imei: str, db: AsyncSession = Depends(get_db)):
+async def obtener_dispositivo_por_imei(imei: str, db: AsyncSession = Depends(get_db_lectura)):
     dispositivo = await DispositivoService.obtener_dispositivo_por_imei(db, imei)
     if not dispositivo:
         raise HTTPException(status_code=404, detail="Dispositivo no encontrado")
     return dispositivo
 
 @router.get("/vehiculo/{vehiculo_id}", response_model=List[DispositivoResponse])
-async def obtener_dispositivos_por_vehiculo(vehiculo_id: str, db: AsyncSession = Depends(get_db)):
+async def obtener_dispositivos_por_vehiculo(vehiculo_id: str, db: AsyncSession = Depends(get_db_lectura)):
     vehiculo = await VehiculoService.obtener_vehiculo_por_id(db, vehiculo_id)
     if not vehiculo:
         raise HTTPException(status_code=404, detail="Vehículo no encontrado")
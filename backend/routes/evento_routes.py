@@ -0,0 +1,33 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.database import get_db
+from schemas.evento_schema import EventoResponse
+from services.evento_service import EventoService, latencias_alarmas
+from services.regla_service import motor_reglas, planificador_senal
+from datetime import datetime
+from typing import List, Optional
+
+router = APIRouter(prefix="/eventos", tags=["eventos"])
+
+@router.get("/", response_model=List[EventoResponse])
+async def listar_eventos(
+    dispositivo_id: Optional[int] = Query(None, description="Filtrar por dispositivo"),
+    tipo: Optional[str] = Query(None, description="Filtrar por tipo de evento"),
+    fecha_inicio: Optional[datetime] = Query(None, description="Fecha de inicio (ISO format)"),
+    fecha_fin: Optional[datetime] = Query(None, description="Fecha de fin (ISO format)"),
+    limit: int = Query(1000, ge=1, le=5000, description="Límite de registros"),
+    db: AsyncSession = Depends(get_db)
+):
+    return await EventoService.obtener_eventos(
+        db, dispositivo_id, tipo, fecha_inicio, fecha_fin, limit
+    )
+
+@router.get("/reglas/estadisticas")
+async def estadisticas_reglas():
+    """Costo promedio por fix del motor de reglas y eventos emitidos"""
+    return {**motor_reglas.estadisticas(), "vencimientos_programados": len(planificador_senal)}
+
+@router.get("/alarmas/latencia")
+async def latencia_alarmas():
+    """Latencia de punta a punta de las alarmas (llegada al servidor TCP -> guardada)"""
+    return latencias_alarmas.estadisticas()
@@ -0,0 +1,59 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.database import get_db
+from services.geocerca_service import GeocercaService
+from schemas.geocerca_schema import GeocercaCreate, GeocercaResponse, ReproduccionGeocercas
+from schemas.evento_schema import EventoResponse
+from datetime import datetime
+from typing import List, Optional, Dict
+
+router = APIRouter(prefix="/geocercas", tags=["geocercas"])
+
+@router.post("/", response_model=GeocercaResponse, status_code=201)
+async def crear_geocerca(geocerca: GeocercaCreate, db: AsyncSession = Depends(get_db)):
+    return await GeocercaService.crear_geocerca(db, geocerca)
+
+@router.get("/", response_model=List[GeocercaResponse])
+async def listar_geocercas(
+    activos_solo: bool = Query(True, description="Solo geocercas activas"),
+    db: AsyncSession = Depends(get_db)
+):
+    return await GeocercaService.obtener_geocercas(db, activos_solo)
+
+@router.get("/eventos", response_model=List[EventoResponse])
+async def listar_eventos_geocerca(
+    dispositivo_id: Optional[int] = Query(None, description="Filtrar por dispositivo"),
+    geocerca_id: Optional[int] = Query(None, description="Filtrar por geocerca"),
+    fecha_inicio: Optional[datetime] = Query(None, description="Fecha de inicio (ISO format)"),
+    fecha_fin: Optional[datetime] = Query(None, description="Fecha de fin (ISO format)"),
+    limit: int = Query(1000, ge=1, le=5000, description="Límite de registros"),
+    db: AsyncSession = Depends(get_db)
+):
+    return await GeocercaService.obtener_eventos(
+        db, dispositivo_id, geocerca_id, fecha_inicio, fecha_fin, limit
+    )
+
+@router.post("/reproducir", response_model=Dict[str, int])
+async def reproducir_geocercas(reproduccion: ReproduccionGeocercas, db: AsyncSession = Depends(get_db)):
+    if reproduccion.fecha_inicio > reproduccion.fecha_fin:
+        raise HTTPException(status_code=400, detail="fecha_inicio debe ser anterior a fecha_fin")
+    
+    return await GeocercaService.reproducir(
+        db, reproduccion.fecha_inicio, reproduccion.fecha_fin,
+        reproduccion.dispositivos, reproduccion.reemplazar
+    )
+
+@router.get("/{geocerca_id}", response_model=GeocercaResponse)
+async def obtener_geocerca(geocerca_id: int, db: AsyncSession = Depends(get_db)):
+    geocerca = await GeocercaService.obtener_geocerca_por_id(db, geocerca_id)
+    if not geocerca:
+        raise HTTPException(status_code=404, detail="Geocerca no encontrada")
+    return geocerca
+
+@router.delete("/{geocerca_id}")
+async def eliminar_geocerca(geocerca_id: int, db: AsyncSession = Depends(get_db)):
+    eliminado = await GeocercaService.eliminar_geocerca(db, geocerca_id)
+    if not eliminado:
+        raise HTTPException(status_code=404, detail="Geocerca no encontrada")
+    
+    return {"message": "Geocerca eliminada correctamente"}
@@ -0,0 +1,51 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.database import get_db_lectura
+from schemas.reporte_schema import ResumenPeriodoResponse, TotalVehiculoResponse, ReconstruccionResumenes
+from services.resumen_service import ResumenService
+from datetime import datetime
+from typing import List, Optional
+
+router = APIRouter(prefix="/reportes", tags=["reportes"])
+
+def _validar_rango(fecha_inicio: datetime, fecha_fin: datetime) -> None:
+    if fecha_fin <= fecha_inicio:
+        raise HTTPException(status_code=400, detail="fecha_fin debe ser posterior a fecha_inicio")
+
+@router.get("/flota/diario", response_model=List[ResumenPeriodoResponse])
+async def reporte_diario(
+    fecha_inicio: datetime = Query(..., description="Fecha de inicio (ISO format)"),
+    fecha_fin: datetime = Query(..., description="Fecha de fin (ISO format)"),
+    vehiculo_id: Optional[int] = Query(None, description="Filtrar por vehículo"),
+    db: AsyncSession = Depends(get_db_lectura)
+):
+    """Km, velocidad máxima y horas en movimiento por vehículo y día"""
+    _validar_rango(fecha_inicio, fecha_fin)
+    return await ResumenService.obtener_reporte(db, "dia", fecha_inicio, fecha_fin, vehiculo_id)
+
+@router.get("/flota/horario", response_model=List[ResumenPeriodoResponse])
+async def reporte_horario(
+    fecha_inicio: datetime = Query(..., description="Fecha de inicio (ISO format)"),
+    fecha_fin: datetime = Query(..., description="Fecha de fin (ISO format)"),
+    vehiculo_id: Optional[int] = Query(None, description="Filtrar por vehículo"),
+    db: AsyncSession = Depends(get_db_lectura)
+):
+    """Km, velocidad máxima y horas en movimiento por vehículo y hora"""
+    _validar_rango(fecha_inicio, fecha_fin)
+    return await ResumenService.obtener_reporte(db, "hora", fecha_inicio, fecha_fin, vehiculo_id)
+
+@router.get("/flota/totales", response_model=List[TotalVehiculoResponse])
+async def reporte_totales(
+    fecha_inicio: datetime = Query(..., description="Fecha de inicio (ISO format)"),
+    fecha_fin: datetime = Query(..., description="Fecha de fin (ISO format)"),
+    db: AsyncSession = Depends(get_db_lectura)
+):
+    """Totales por vehículo en el rango de días, ordenados por distancia"""
+    _validar_rango(fecha_inicio, fecha_fin)
+    return await ResumenService.obtener_totales(db, fecha_inicio, fecha_fin)
+
+@router.post("/resumenes/reconstruir")
+async def reconstruir_resumenes(datos: ReconstruccionResumenes):
+    """Recalcular los resúmenes desde las ubicaciones guardadas (backfill)"""
+    _validar_rango(datos.fecha_inicio, datos.fecha_fin)
+    return await ResumenService.reconstruir(datos.fecha_inicio, datos.fecha_fin, datos.dispositivos)
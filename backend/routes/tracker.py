@@ -1,15 +1,108 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from core.database import get_db
-from services.ubicacion_service import UbicacionService
+from core.config import settings
+from core.database import get_db, get_db_lectura, get_db_ingesta, AsyncSessionLocal
+from core.realtime import hub, Suscriptor
+from core.cache import cache_polling, cache_dias
+from core.resumenes import dia_cerrado, limites_dia
+from core.serializacion import respuesta_rapida, serializar_filas
+from models.vehiculo import Vehiculo
+from services.ubicacion_service import (
+    UbicacionService, mapear_ubicacion, ventana_reorden, ZONA, CREADO, ATRASADO, DUPLICADO, OMITIDO, DESCARTADO
+)
+from services.filtro_service import FiltroService
+from services.ultima_posicion_service import UltimaPosicionService, grilla_flota
+from services.reproduccion_service import ReproduccionService
+from services.densidad_service import DensidadService
+from services.evento_service import EventoService
+from services.geometria_service import GeometriaService, FORMATO_JSON
 from schemas.ubicacion_schema import (
-    UbicacionCreate, UbicacionResponse, UbicacionTracker, RutaResponse
+    UbicacionCreate, UbicacionResponse, UbicacionTracker, RutaResponse,
+    RecorridosRequest, RecorridosResponse, LoteIngestaResponse, LimpiezaHistorial
 )
-from datetime import datetime, timedelta
+from schemas.reproduccion_schema import ReproduccionCreate, ReproduccionResponse
+from schemas.evento_schema import AlarmaTracker, EventoResponse
+from datetime import date, datetime, timedelta
 from typing import List, Optional, Dict, Any
+import asyncio
+import logging
+import orjson
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/tracker", tags=["tracker"])
 
+def _resolver_formato(request: Request, formato: Optional[str]) -> str:
+    try:
+        return GeometriaService.negociar_formato(formato, request.headers.get("accept"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _respuesta_codificada(ubicaciones, formato: str, precision: int, delta_ts: bool, propiedades: Optional[Dict[str, Any]] = None) -> JSONResponse:
+    contenido = GeometriaService.codificar_ubicaciones(
+        ubicaciones, formato, precision, delta_ts, propiedades
+    )
+    return JSONResponse(content=contenido, media_type=GeometriaService.media_type(formato))
+
+def _codificar(contenido: Any) -> bytes:
+    return orjson.dumps(contenido, option=orjson.OPT_NON_STR_KEYS)
+
+def _rango_dia(fecha: date):
+    """Límites del día local; el fin se corre 1 µs porque las consultas usan <= fecha_fin"""
+    inicio, fin = limites_dia(fecha, ZONA)
+    return inicio, fin - timedelta(microseconds=1)
+
+async def _historial_codificado(db: AsyncSession, dispositivo_id: str, fecha: date, limit: int, formato: str, precision: int, delta_ts: bool):
+    inicio, fin = _rango_dia(fecha)
+    ubicaciones = await UbicacionService.obtener_ubicaciones_por_dispositivo(db, dispositivo_id, inicio, fin, limit)
+    if formato != FORMATO_JSON:
+        contenido = GeometriaService.codificar_ubicaciones(
+            ubicaciones, formato, precision, delta_ts,
+            {"dispositivo_id": int(dispositivo_id), "total_puntos": len(ubicaciones)}
+        )
+        return _codificar(contenido), GeometriaService.media_type(formato)
+    return _codificar(serializar_filas(ubicaciones, mapear_ubicacion)), "application/json"
+
+async def _recorrido_codificado(db: AsyncSession, vehiculo_id: str, fecha: date, formato: str, precision: int, delta_ts: bool):
+    inicio, fin = _rango_dia(fecha)
+    recorrido = await UbicacionService.obtener_recorrido_vehiculo(db, vehiculo_id, inicio, fin)
+    if not recorrido:
+        raise HTTPException(status_code=404, detail="Dispositivo del vehículo inactivo")
+    if formato != FORMATO_JSON:
+        contenido = GeometriaService.codificar_ubicaciones(
+            recorrido.ubicaciones, formato, precision, delta_ts,
+            recorrido.model_dump(exclude={"ubicaciones"})
+        )
+        return _codificar(contenido), GeometriaService.media_type(formato)
+    return _codificar(recorrido.model_dump()), "application/json"
+
+async def _respuesta_dia(request: Request, db: AsyncSession, dispositivo_id: int, fecha: date, variante: tuple, producir) -> Response:
+    """Respuesta de un día completo; si el día está cerrado se sirve desde cache_dias con ETag fuerte"""
+    inicio, fin = limites_dia(fecha, ZONA)
+    cantidad, id_maximo = await UbicacionService.huella_dia(db, dispositivo_id, inicio, fin)
+    if not cantidad:
+        raise HTTPException(
+            status_code=404,
+            detail="No se encontraron ubicaciones para el rango especificado"
+        )
+
+    if not dia_cerrado(fecha, ZONA, settings.DIA_CERRADO_GRACIA_MIN):
+        contenido, media_type = await producir()
+        return Response(content=contenido, media_type=media_type)
+
+    digest = cache_dias.digest((variante, dispositivo_id, fecha, cantidad, id_maximo))
+    headers = {
+        "ETag": f'"{digest}"',
+        "Cache-Control": f"public, max-age={settings.CACHE_DIAS_MAX_AGE_SEG}",
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+
+    contenido, media_type = await cache_dias.obtener(dispositivo_id, fecha, digest, producir)
+    return Response(content=contenido, media_type=media_type, headers=headers)
+
 @router.post("/ubicacion", response_model=UbicacionResponse, status_code=201)
 async def crear_ubicacion(ubicacion: UbicacionCreate, db: AsyncSession = Depends(get_db)):
     try:
@@ -18,40 +111,126 @@ async def crear_ubicacion(ubicacion: UbicacionCreate, db: AsyncSession = Depends
         raise HTTPException(status_code=400, detail=f"Error creando ubicación: {str(e)}")
 
 @router.post("/data", response_model=UbicacionResponse, status_code=201)
-async def recibir_datos_tracker(datos_tracker: UbicacionTracker, db: AsyncSession = Depends(get_db)):
+async def recibir_datos_tracker(datos_tracker: UbicacionTracker, response: Response, db: AsyncSession = Depends(get_db_ingesta)):
+    """201 si el fix se guardó (en vivo o atrasado); 200 si ya existía o se omitió (X-Resultado indica cuál)"""
     try:
-        return await UbicacionService.procesar_datos_tracker(db, datos_tracker)
+        ubicacion, resultado = await UbicacionService.procesar_datos_tracker(db, datos_tracker)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error procesando datos: {str(e)}")
+    response.headers["X-Resultado"] = resultado
+    if resultado not in (CREADO, ATRASADO):
+        response.status_code = 200
+    return ubicacion
+
+@router.post("/alarma", response_model=EventoResponse, status_code=201)
+async def recibir_alarma(alarma: AlarmaTracker, response: Response, db: AsyncSession = Depends(get_db)):
+    """Carril prioritario: no pasa por el control de admisión de la ingesta de GPS"""
+    try:
+        evento, creado = await EventoService.registrar_alarma(db, alarma)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=f"Error registrando alarma: {str(e)}")
+    if not creado:
+        response.status_code = 200
+        response.headers["X-Resultado"] = DUPLICADO
+    return evento
+
+@router.post("/data/lote", response_model=LoteIngestaResponse)
+async def recibir_lote_tracker(lote: List[UbicacionTracker], db: AsyncSession = Depends(get_db_ingesta)):
+    """Ingesta de varios fixes en orden cronológico; reenviar un lote completo es seguro (los ya guardados dan duplicado)"""
+    if len(lote) > settings.INGESTA_MAX_LOTE:
+        raise HTTPException(status_code=413, detail=f"El lote no puede superar {settings.INGESTA_MAX_LOTE} fixes")
+
+    resultados = await UbicacionService.procesar_lote_tracker(db, lote)
+    conteo = {CREADO: 0, ATRASADO: 0, DUPLICADO: 0, OMITIDO: 0, DESCARTADO: 0, "error": 0}
+    for r in resultados:
+        conteo[r["resultado"]] += 1
+
+    return {
+        "creados": conteo[CREADO],
+        "atrasados": conteo[ATRASADO],
+        "duplicados": conteo[DUPLICADO],
+        "omitidos": conteo[OMITIDO],
+        "descartados": conteo[DESCARTADO],
+        "errores": conteo["error"],
+        "resultados": resultados,
+    }
+
+# /tiempo-real y /ultima-ubicacion leen del primario: la ingesta invalida la caché de la
+# última ubicación y el cursor de versiones supone leer lo recién escrito (una réplica atrasada lo saltearía)
+@router.get("/tiempo-real", response_model=List[Dict[str, Any]], response_class=ORJSONResponse)
+async def obtener_ubicaciones_live(
+    request: Request,
+    minutos_atras: int = Query(5, description="Ventana de tiempo en minutos"),
+    since: Optional[str] = Query(None, max_length=64, description="Cursor de la respuesta anterior: solo devuelve dispositivos que cambiaron")
+):
+    async def version():
+        async with AsyncSessionLocal() as db:
+            return await UltimaPosicionService.version_flota(db, minutos_atras)
 
-@router.get("/tiempo-real", response_model=List[Dict[str, Any]])
-async def obtener_ubicaciones_live(minutos_atras: int = Query(5, description="Ventana de tiempo en minutos"), db: AsyncSession = Depends(get_db)):
     try:
-        return await UbicacionService.obtener_ubicaciones_tiempo_real(db, minutos_atras)
+        # Huella de la flota (una consulta de agregados por ventana y TTL) antes de leer posiciones:
+        # si el cliente ya tiene esa versión se responde 304 sin más trabajo en la base
+        huella = await cache_polling.obtener(("version-flota", minutos_atras), version)
+        etag = f'W/"{minutos_atras}-{huella}"'
+        if request.headers.get("if-none-match") == etag:
+            headers = {"ETag": etag}
+            if since is not None:
+                headers["X-Cursor"] = since
+            return Response(status_code=304, headers=headers)
+
+        async def consultar():
+            async with AsyncSessionLocal() as db:
+                return await UltimaPosicionService.leer_flota(db, minutos_atras)
+
+        # Una sola lectura por versión sirve a las consultas completas y a todos los cursores
+        foto = await cache_polling.obtener(("tiempo-real", minutos_atras, huella), consultar)
+        resultado = UltimaPosicionService.flota_desde(foto, since)
+        contenido = resultado["ubicaciones"] if since is None else resultado
+        respuesta = respuesta_rapida(contenido)
+        respuesta.headers.update({"ETag": etag, "X-Cursor": resultado["cursor"]})
+        return respuesta
     except Exception as e:
-        print(f"Error tiempo real: {e}")
-        return []
+        logger.error(f"Error tiempo real: {e}")
+        raise HTTPException(status_code=500, detail="Error obteniendo ubicaciones en tiempo real")
     
-@router.get("/dispositivo/{dispositivo_id}/actual", response_model=UbicacionResponse)
-async def obtener_ubicacion_actual(dispositivo_id: str, db: AsyncSession = Depends(get_db)):
+@router.get("/dispositivo/{dispositivo_id}/actual", response_model=UbicacionResponse, response_class=ORJSONResponse)
+async def obtener_ubicacion_actual(dispositivo_id: str, db: AsyncSession = Depends(get_db_lectura)):
     ubicacion = await UbicacionService.obtener_ubicacion_actual(db, dispositivo_id)
     if not ubicacion:
         raise HTTPException(
             status_code=404, 
             detail="No se encontraron ubicaciones para este dispositivo"
         )
-    return ubicacion
+    return respuesta_rapida(mapear_ubicacion(ubicacion))
 
-@router.get("/dispositivo/{dispositivo_id}/historial", response_model=List[UbicacionResponse])
+@router.get("/dispositivo/{dispositivo_id}/historial", response_model=List[UbicacionResponse], response_class=ORJSONResponse)
 async def obtener_historial_ubicaciones(
+    request: Request,
     dispositivo_id: str,
     fecha_inicio: Optional[datetime] = Query(None, description="Fecha de inicio (ISO format)"),
     fecha_fin: Optional[datetime] = Query(None, description="Fecha de fin (ISO format)"),
     limit: int = Query(1000, ge=1, le=5000, description="Límite de registros"),
-    db: AsyncSession = Depends(get_db)
+    formato: Optional[str] = Query(None, description="json, polyline, geojson o columnar (por defecto según Accept)"),
+    precision: int = Query(5, ge=1, le=7, description="Decimales de las coordenadas en formatos compactos"),
+    delta_ts: bool = Query(True, description="Timestamps delta-codificados en formatos compactos"),
+    fecha: Optional[date] = Query(None, description="Día local completo (YYYY-MM-DD); reemplaza fecha_inicio/fecha_fin"),
+    db: AsyncSession = Depends(get_db_lectura)
 ):
+    formato = _resolver_formato(request, formato)
+
+    if fecha is not None:
+        async def producir():
+            return await _historial_codificado(db, dispositivo_id, fecha, limit, formato, precision, delta_ts)
+        return await _respuesta_dia(
+            request, db, int(dispositivo_id), fecha,
+            ("historial", limit, formato, precision, delta_ts), producir
+        )
+
     if not fecha_inicio and not fecha_fin:
         fecha_fin = datetime.utcnow()
         fecha_inicio = fecha_fin - timedelta(hours=24)
@@ -66,15 +245,39 @@ async def obtener_historial_ubicaciones(
             detail="No se encontraron ubicaciones para el rango especificado"
         )
     
-    return ubicaciones
+    if formato != FORMATO_JSON:
+        return _respuesta_codificada(
+            ubicaciones, formato, precision, delta_ts,
+            {"dispositivo_id": int(dispositivo_id), "total_puntos": len(ubicaciones)}
+        )
+    
+    return respuesta_rapida(serializar_filas(ubicaciones, mapear_ubicacion))
 
 @router.get("/vehiculo/{vehiculo_id}/recorrido", response_model=RutaResponse)
 async def obtener_recorrido_vehiculo(
+    request: Request,
     vehiculo_id: str,
     fecha_inicio: Optional[datetime] = Query(None, description="Fecha de inicio (ISO format)"),
     fecha_fin: Optional[datetime] = Query(None, description="Fecha de fin (ISO format)"),
-    db: AsyncSession = Depends(get_db)
+    formato: Optional[str] = Query(None, description="json, polyline, geojson o columnar (por defecto según Accept)"),
+    precision: int = Query(5, ge=1, le=7, description="Decimales de las coordenadas en formatos compactos"),
+    delta_ts: bool = Query(True, description="Timestamps delta-codificados en formatos compactos"),
+    fecha: Optional[date] = Query(None, description="Día local completo (YYYY-MM-DD); reemplaza fecha_inicio/fecha_fin"),
+    db: AsyncSession = Depends(get_db_lectura)
 ):  
+    formato = _resolver_formato(request, formato)
+
+    if fecha is not None:
+        dispositivo_id = await UbicacionService.dispositivo_de_vehiculo(db, int(vehiculo_id))
+        if dispositivo_id is None:
+            raise HTTPException(status_code=404, detail="Vehículo no encontrado")
+        async def producir():
+            return await _recorrido_codificado(db, vehiculo_id, fecha, formato, precision, delta_ts)
+        return await _respuesta_dia(
+            request, db, dispositivo_id, fecha,
+            ("recorrido", int(vehiculo_id), formato, precision, delta_ts), producir
+        )
+
     if not fecha_inicio and not fecha_fin:
         fecha_fin = datetime.utcnow()
         fecha_inicio = fecha_fin - timedelta(hours=24)
@@ -87,14 +290,249 @@ async def obtener_recorrido_vehiculo(
             status_code=404,
             detail="No se encontraron ubicaciones para el vehículo en el rango especificado"
         )
+    
+    if formato != FORMATO_JSON:
+        return _respuesta_codificada(
+            recorrido.ubicaciones, formato, precision, delta_ts,
+            recorrido.model_dump(exclude={"ubicaciones"})
+        )
+    
     return recorrido
 
-@router.get("/dispositivo/{dispositivo_id}/ultima-ubicacion", response_model=UbicacionResponse)
-async def obtener_ultima_ubicacion(dispositivo_id: str, db: AsyncSession = Depends(get_db)):
-    ubicacion = await UbicacionService.obtener_ultima_ubicacion(db, dispositivo_id)
+@router.post("/recorridos", response_model=RecorridosResponse, response_class=ORJSONResponse)
+async def obtener_recorridos_vehiculos(datos: RecorridosRequest, db: AsyncSession = Depends(get_db_lectura)):
+    """Recorridos de muchos vehículos en un mismo rango, con estadísticas por vehículo"""
+    if datos.fecha_fin <= datos.fecha_inicio:
+        raise HTTPException(status_code=400, detail="fecha_fin debe ser posterior a fecha_inicio")
+    if len(datos.vehiculos) > settings.RECORRIDOS_MAX_VEHICULOS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Se admiten hasta {settings.RECORRIDOS_MAX_VEHICULOS} vehículos por consulta"
+        )
+    
+    try:
+        recorridos = await UbicacionService.obtener_recorridos_vehiculos(
+            db, datos.vehiculos, datos.fecha_inicio, datos.fecha_fin, datos.tolerancia_m
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return respuesta_rapida(recorridos)
+
+@router.get("/dispositivo/{dispositivo_id}/ultima-ubicacion", response_model=UbicacionResponse, response_class=ORJSONResponse)
+async def obtener_ultima_ubicacion(dispositivo_id: int):
+    async def consultar():
+        async with AsyncSessionLocal() as db:
+            fila = await UbicacionService.obtener_ultima_ubicacion(db, dispositivo_id)
+        return mapear_ubicacion(fila) if fila else None
+
+    ubicacion = await cache_polling.obtener(("ultima", dispositivo_id), consultar)
     if not ubicacion:
         raise HTTPException(
             status_code=404,
             detail="No se encontró la última ubicación para este dispositivo"
         )
-    return ubicacion
\ No newline at end of file
+    return respuesta_rapida(ubicacion)
+
+@router.get("/viewport", response_class=ORJSONResponse)
+async def obtener_viewport(
+    bbox: str = Query(..., description="minLng,minLat,maxLng,maxLat"),
+    zoom: int = Query(..., ge=0, le=22, description="Nivel de zoom del mapa"),
+    max_minutos: int = Query(5, ge=1, description="Descartar dispositivos sin reportar hace más de N minutos"),
+    db: AsyncSession = Depends(get_db_lectura)
+):
+    """Vehículos dentro del área visible que reportaron hace poco; clusters con conteo a zoom bajo"""
+    try:
+        area = _bbox(bbox)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="bbox inválido, se espera minLng,minLat,maxLng,maxLat")
+    if area[0] > area[2] or area[1] > area[3]:
+        raise HTTPException(status_code=400, detail="bbox inválido: el mínimo supera al máximo")
+
+    await UltimaPosicionService.sincronizar_grilla(db)
+    reciente = UltimaPosicionService.visto_desde(max_minutos)
+
+    if zoom >= settings.VIEWPORT_ZOOM_MARCADORES:
+        marcadores = [grilla_flota.datos[id] for id in grilla_flota.en_bbox(area, reciente)]
+        return respuesta_rapida({"tipo": "marcadores", "elementos": marcadores})
+
+    clusters = grilla_flota.clusters(area, zoom, reciente)
+    for cluster in clusters:
+        if cluster["cantidad"] == 1:
+            cluster.update(grilla_flota.datos[cluster["id"]])
+    return respuesta_rapida({"tipo": "clusters", "elementos": clusters})
+
+@router.get("/nearest", response_class=ORJSONResponse)
+async def obtener_vehiculos_cercanos(
+    lat: float = Query(..., ge=-90, le=90, description="Latitud del punto de búsqueda"),
+    lng: float = Query(..., ge=-180, le=180, description="Longitud del punto de búsqueda"),
+    k: int = Query(5, ge=1, le=100, description="Cantidad de vehículos"),
+    tipo_vehiculo: Optional[str] = Query(None, description="Filtrar por tipo de vehículo"),
+    max_minutos: Optional[int] = Query(None, ge=1, description="Descartar vehículos sin reportar hace más de N minutos"),
+    radio_km: Optional[float] = Query(None, gt=0, description="Radio máximo de búsqueda en km"),
+    db: AsyncSession = Depends(get_db_lectura)
+):
+    """Vehículos activos más cercanos a un punto, ordenados por distancia de gran círculo"""
+    await UltimaPosicionService.sincronizar_grilla(db)
+    return respuesta_rapida(
+        UltimaPosicionService.cercanos(lat, lng, k, tipo_vehiculo, max_minutos, radio_km)
+    )
+
+@router.get("/heatmap/{z}/{x}/{y}", response_class=ORJSONResponse)
+async def obtener_tesela_heatmap(
+    z: int,
+    x: int,
+    y: int,
+    fecha_inicio: date = Query(..., description="Primer día (YYYY-MM-DD)"),
+    fecha_fin: date = Query(..., description="Último día, inclusive (YYYY-MM-DD)"),
+    resolucion: int = Query(5, ge=0, le=8, description="Subdivisiones por lado: 2^resolucion"),
+    dispositivo_id: Optional[int] = Query(None, description="Limitar a un dispositivo")
+):
+    """Densidad de permanencia de la flota dentro de una tesela z/x/y"""
+    if not (0 <= z <= 22 and 0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        raise HTTPException(status_code=400, detail="Tesela inválida")
+    try:
+        tesela = await DensidadService.obtener_tesela(
+            z, x, y, resolucion, fecha_inicio, fecha_fin, dispositivo_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    respuesta = respuesta_rapida(tesela)
+    # Días cerrados: el contenido ya no cambia
+    if tesela["cerrada"]:
+        respuesta.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        respuesta.headers["Cache-Control"] = f"public, max-age={int(settings.HEATMAP_TTL_SEG)}"
+    return respuesta
+
+@router.post("/reproduccion", response_model=ReproduccionResponse, status_code=201)
+async def crear_reproduccion(datos: ReproduccionCreate, db: AsyncSession = Depends(get_db)):
+    """Preparar la reproducción de varios vehículos; los frames se piden por bloques"""
+    try:
+        preparada = await ReproduccionService.preparar(
+            db, datos.vehiculos, datos.fecha_inicio, datos.fecha_fin, datos.intervalo_seg
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not preparada:
+        raise HTTPException(
+            status_code=404,
+            detail="No se encontraron ubicaciones para los vehículos en el rango especificado"
+        )
+    
+    reproduccion, patentes = preparada
+    return ReproduccionResponse(
+        id=reproduccion.id,
+        inicio=reproduccion.inicio,
+        fin=reproduccion.fin,
+        intervalo_seg=reproduccion.intervalo,
+        total_frames=reproduccion.total_frames,
+        frames_por_bloque=reproduccion.frames_por_bloque,
+        bloques=reproduccion.indice_bloques(),
+        vehiculos=patentes,
+    )
+
+@router.get("/reproduccion/{reproduccion_id}/frames")
+async def obtener_frames_reproduccion(
+    reproduccion_id: str,
+    desde: Optional[datetime] = Query(None, description="Instante desde el que reproducir (ISO format)"),
+    hasta: Optional[datetime] = Query(None, description="Instante hasta el que reproducir (ISO format)"),
+):
+    """Frames interpolados en NDJSON, un bloque por línea, a partir del instante pedido"""
+    reproduccion = await ReproduccionService.obtener(reproduccion_id)
+    if not reproduccion:
+        raise HTTPException(status_code=404, detail="Reproducción no encontrada o vencida")
+    
+    return StreamingResponse(
+        reproduccion.bloques(
+            desde.timestamp() if desde else None,
+            hasta.timestamp() if hasta else None,
+        ),
+        media_type="application/x-ndjson"
+    )
+
+@router.get("/cache/estadisticas")
+async def estadisticas_cache():
+    """Aciertos, consultas coalescidas e invalidaciones de la micro-caché de polling"""
+    return {
+        **cache_polling.estadisticas(),
+        "heatmap": DensidadService.estadisticas(),
+        "dias": cache_dias.estadisticas(),
+    }
+
+@router.get("/ingesta/estadisticas")
+async def estadisticas_ingesta():
+    """Fixes reordenados y atrasados, y decisiones del filtro GPS"""
+    return {**ventana_reorden.estadisticas(), "filtro": FiltroService.estadisticas()}
+
+@router.post("/limpieza")
+async def limpiar_historial(datos: LimpiezaHistorial):
+    """Filtro vectorizado sobre el historial: saltos imposibles y jitter de estacionamiento.
+    Sin `aplicar` solo informa lo que se borraría."""
+    if datos.fecha_fin <= datos.fecha_inicio:
+        raise HTTPException(status_code=400, detail="fecha_fin debe ser posterior a fecha_inicio")
+    return await FiltroService.limpiar_historial(datos.fecha_inicio, datos.fecha_fin, datos.dispositivos, datos.aplicar)
+
+def _lista_ids(valor) -> Optional[List[int]]:
+    if valor is None or valor == "":
+        return None
+    if isinstance(valor, str):
+        valor = valor.split(",")
+    return [int(v) for v in valor]
+
+def _bbox(valor) -> Optional[tuple]:
+    if valor is None or valor == "":
+        return None
+    if isinstance(valor, str):
+        valor = valor.split(",")
+    min_lng, min_lat, max_lng, max_lat = (float(v) for v in valor)
+    return (min_lng, min_lat, max_lng, max_lat)
+
+async def _aplicar_filtro(suscriptor: Suscriptor, filtro: Dict[str, Any]) -> None:
+    """Resolver vehículos a dispositivos y registrar el filtro en el hub"""
+    dispositivos = _lista_ids(filtro.get("dispositivos"))
+    vehiculos = _lista_ids(filtro.get("vehiculos"))
+
+    if vehiculos:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Vehiculo.dispositivo_id).where(Vehiculo.id.in_(vehiculos))
+            )
+            dispositivos = (dispositivos or []) + list(result.scalars().all())
+
+    hub.registrar(suscriptor, dispositivos, _bbox(filtro.get("bbox")))
+
+@router.websocket("/ws")
+async def feed_posiciones(websocket: WebSocket):
+    """Posiciones en vivo. Filtros por query (?dispositivos=1,2&vehiculos=3&bbox=minLng,minLat,maxLng,maxLat)
+    o enviando un JSON con las mismas claves para cambiarlos."""
+    await websocket.accept()
+    suscriptor = Suscriptor(settings.WS_MAX_PENDIENTES)
+
+    try:
+        await _aplicar_filtro(suscriptor, dict(websocket.query_params))
+    except (ValueError, TypeError):
+        await websocket.close(code=1008, reason="Filtro inválido")
+        return
+
+    async def emisor():
+        while True:
+            lote = await suscriptor.siguiente_lote()
+            await websocket.send_text(orjson.dumps(lote).decode())
+
+    tarea_emisor = asyncio.create_task(emisor())
+    try:
+        while True:
+            mensaje = await websocket.receive_text()
+            try:
+                await _aplicar_filtro(suscriptor, orjson.loads(mensaje))
+            except (ValueError, TypeError, AttributeError):
+                await websocket.send_text(orjson.dumps({"error": "Filtro inválido"}).decode())
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Error en WebSocket de posiciones: {e}")
+    finally:
+        tarea_emisor.cancel()
+        hub.eliminar(suscriptor)
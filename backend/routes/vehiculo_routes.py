@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from core.database import get_db
+from core.database import get_db, get_db_lectura
 from services.vehiculo_service import VehiculoService
+from services.regla_service import ReglaService
+from services.importacion_service import ImportacionService
 from schemas.vehiculo_schema import (
     VehiculoCreate, VehiculoUpdate, VehiculoResponse, VehiculoWithDispositivos
 )
-from typing import List
+from schemas.importacion_schema import ImportacionResponse
+from typing import List, Optional
 
 router = APIRouter(prefix="/vehiculos", tags=["vehiculos"])
 
@@ -20,31 +23,48 @@ async def crear_vehiculo(vehiculo: VehiculoCreate, db: AsyncSession = Depends(ge
     
     return await VehiculoService.crear_vehiculo(db, vehiculo)
 
+@router.post("/importar", response_model=ImportacionResponse)
+async def importar_vehiculos(
+    request: Request,
+    formato: Optional[str] = Query(None, pattern="^(csv|ndjson)$", description="csv o ndjson; por defecto según Content-Type"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Alta masiva por CSV/NDJSON: cada fila trae patente e imei; crea o actualiza ambos y los vincula"""
+    formato = formato or ImportacionService.formato_por_tipo(request.headers.get("content-type"))
+    if not formato:
+        raise HTTPException(status_code=415, detail="Enviar text/csv o application/x-ndjson, o indicar ?formato=")
+    try:
+        return await ImportacionService.importar_flota(
+            db, ImportacionService.leer_filas(request.stream(), formato), requiere_vehiculo=True
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/", response_model=List[VehiculoResponse])
 async def listar_vehiculos(
     skip: int = Query(0, ge=0, description="Número de registros a omitir"),
     limit: int = Query(100, ge=1, le=1000, description="Límite de registros"),
     activos_solo: bool = Query(True, description="Solo vehículos activos"),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db_lectura)
 ):
     return await VehiculoService.obtener_vehiculos(db, skip, limit, activos_solo)
 
 @router.get("/{vehiculo_id}", response_model=VehiculoResponse)
-async def obtener_vehiculo(vehiculo_id: str, db: AsyncSession = Depends(get_db)):
+async def obtener_vehiculo(vehiculo_id: str, db: AsyncSession = Depends(get_db_lectura)):
     vehiculo = await VehiculoService.obtener_vehiculo_por_id(db, vehiculo_id)
     if not vehiculo:
         raise HTTPException(status_code=404, detail="Vehículo no encontrado")
     return vehiculo
 
 @router.get("/{vehiculo_id}/completo", response_model=VehiculoWithDispositivos)
-async def obtener_vehiculo_completo(vehiculo_id: str, db: AsyncSession = Depends(get_db)):
+async def obtener_vehiculo_completo(vehiculo_id: str, db: AsyncSession = Depends(get_db_lectura)):
     vehiculo = await VehiculoService.obtener_vehiculo_con_dispositivos(db, vehiculo_id)
     if not vehiculo:
         raise HTTPException(status_code=404, detail="Vehículo no encontrado")
     return vehiculo
 
 @router.get("/patente/{patente}", response_model=VehiculoResponse)
-async def obtener_vehiculo_por_patente(patente: str, db: AsyncSession = Depends(get_db)):
+async def obtener_vehiculo_por_patente(patente: str, db: AsyncSession = Depends(get_db_lectura)):
     vehiculo = await VehiculoService.obtener_vehiculo_por_patente(db, patente)
     if not vehiculo:
         raise HTTPException(status_code=404, detail="Vehículo no encontrado")
@@ -68,6 +88,8 @@ async def actualizar_vehiculo(vehiculo_id: str, vehiculo_update: VehiculoUpdate,
     if not vehiculo_actualizado:
         raise HTTPException(status_code=404, detail="Error actualizando vehículo")
     
+    ReglaService.invalidar_config(vehiculo_actualizado.dispositivo_id)
+    
     return vehiculo_actualizado
 
 @router.delete("/{vehiculo_id}")
@@ -1,9 +1,17 @@
 from .vehiculo_schema import VehiculoBase, VehiculoCreate, VehiculoUpdate, VehiculoResponse
 from .dispositivo_schema import DispositivoBase, DispositivoCreate, DispositivoUpdate, DispositivoResponse
 from .ubicacion_schema import UbicacionBase, UbicacionCreate, UbicacionResponse
+from .geocerca_schema import GeocercaBase, GeocercaCreate, GeocercaResponse
+from .evento_schema import EventoResponse
+from .reporte_schema import ResumenPeriodoResponse, TotalVehiculoResponse, ReconstruccionResumenes
+from .importacion_schema import FilaFlota, ResultadoFilaImportacion, ImportacionResponse
 
 __all__ = [
     "VehiculoBase", "VehiculoCreate", "VehiculoUpdate", "VehiculoResponse",
     "DispositivoBase", "DispositivoCreate", "DispositivoUpdate", "DispositivoResponse",
-    "UbicacionBase", "UbicacionCreate", "UbicacionResponse"
+    "UbicacionBase", "UbicacionCreate", "UbicacionResponse",
+    "GeocercaBase", "GeocercaCreate", "GeocercaResponse",
+    "EventoResponse",
+    "ResumenPeriodoResponse", "TotalVehiculoResponse", "ReconstruccionResumenes",
+    "FilaFlota", "ResultadoFilaImportacion", "ImportacionResponse"
 ]
\ No newline at end of file
@@ -0,0 +1,27 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Optional, Dict, Any
+
+class EventoResponse(BaseModel):
+    id: int
+    dispositivo_id: int = Field(..., description="ID del dispositivo")
+    tipo: str = Field(..., description="Tipo de evento")
+    geocerca_id: Optional[int] = Field(None, description="Geocerca asociada, si corresponde")
+    latitud: Optional[float] = None
+    longitud: Optional[float] = None
+    detalle: Optional[Dict[str, Any]] = None
+    timestamp: datetime
+    
+    class Config:
+        from_attributes = True
+
+class AlarmaTracker(BaseModel):
+    device_id: str = Field(..., description="IMEI del dispositivo")
+    tipo: str = Field(..., description="Tipo de alarma (sos, corte_energia, ...)")
+    codigo: Optional[int] = Field(None, description="Código de alarma del protocolo")
+    lat: Optional[float] = Field(None, description="Latitud", ge=-90, le=90)
+    lng: Optional[float] = Field(None, description="Longitud", ge=-180, le=180)
+    speed: Optional[float] = Field(None, description="Velocidad", ge=0)
+    timestamp: Optional[datetime] = Field(None, description="Marca de tiempo del equipo")
+    recibido_en: Optional[datetime] = Field(None, description="Llegada del paquete al servidor TCP")
+    detalle: Optional[Dict[str, Any]] = None
@@ -0,0 +1,39 @@
+from pydantic import BaseModel, Field, model_validator
+from datetime import datetime
+from typing import Optional, List, Literal
+
+class GeocercaBase(BaseModel):
+    nombre: str = Field(..., description="Nombre de la geocerca", max_length=100)
+    tipo: Literal["poligono", "circulo"] = Field(..., description="Tipo de geometría")
+    puntos: Optional[List[List[float]]] = Field(None, description="Vértices [[lat, lng], ...] del polígono")
+    centro_lat: Optional[float] = Field(None, description="Latitud del centro (círculo)", ge=-90, le=90)
+    centro_lng: Optional[float] = Field(None, description="Longitud del centro (círculo)", ge=-180, le=180)
+    radio_m: Optional[float] = Field(None, description="Radio en metros (círculo)", gt=0)
+    activo: bool = Field(True, description="Estado de la geocerca")
+
+    @model_validator(mode="after")
+    def validar_geometria(self):
+        if self.tipo == "poligono":
+            if not self.puntos or len(self.puntos) < 3:
+                raise ValueError("Un polígono necesita al menos 3 puntos")
+            if any(len(p) != 2 for p in self.puntos):
+                raise ValueError("Cada punto debe ser [lat, lng]")
+        elif self.centro_lat is None or self.centro_lng is None or self.radio_m is None:
+            raise ValueError("Un círculo necesita centro_lat, centro_lng y radio_m")
+        return self
+
+class GeocercaCreate(GeocercaBase):
+    pass
+
+class GeocercaResponse(GeocercaBase):
+    id: int
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class ReproduccionGeocercas(BaseModel):
+    fecha_inicio: datetime = Field(..., description="Inicio del rango a reevaluar")
+    fecha_fin: datetime = Field(..., description="Fin del rango a reevaluar")
+    dispositivos: Optional[List[int]] = Field(None, description="Dispositivos a reevaluar (todos si se omite)")
+    reemplazar: bool = Field(True, description="Borrar los eventos de geocerca existentes en el rango")
@@ -0,0 +1,42 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List
+
+class FilaFlota(BaseModel):
+    """Una fila del archivo de alta de flota: el dispositivo y, si trae patente, su vehículo"""
+    imei: str = Field(..., description="IMEI del dispositivo", min_length=1, max_length=50)
+    dispositivo_marca: Optional[str] = Field(None, description="Marca del dispositivo", max_length=50)
+    dispositivo_modelo: Optional[str] = Field(None, description="Modelo del dispositivo (CY06 si es nuevo y no se indica)", max_length=50)
+    firmware_version: Optional[str] = Field(None, description="Versión de firmware", max_length=50)
+    dispositivo_activo: Optional[bool] = Field(None, description="Estado del dispositivo")
+    patente: Optional[str] = Field(None, description="Patente del vehículo al que se vincula el dispositivo", max_length=10)
+    marca: Optional[str] = Field(None, description="Marca del vehículo", max_length=50)
+    modelo: Optional[str] = Field(None, description="Modelo del vehículo", max_length=50)
+    year: Optional[int] = Field(None, description="Año del vehículo")
+    tipo_motor: Optional[str] = Field(None, description="Tipo de motor")
+    capacidad_combustible: Optional[float] = Field(None, description="Capacidad de combustible")
+    tipo_vehiculo: Optional[str] = Field(None, description="Tipo de vehículo")
+    odometro_inicial: Optional[float] = Field(None, description="Odómetro inicial")
+    velocidad_maxima_permitida: Optional[float] = Field(None, description="Velocidad máxima permitida")
+    activo: Optional[bool] = Field(None, description="Estado del vehículo")
+
+    class Config:
+        extra = "forbid"
+
+class ResultadoFilaImportacion(BaseModel):
+    fila: int = Field(..., description="Número de fila de datos (sin contar el encabezado)")
+    imei: Optional[str] = None
+    patente: Optional[str] = None
+    dispositivo: Optional[str] = Field(None, description="creado o actualizado")
+    vehiculo: Optional[str] = Field(None, description="creado, actualizado o vacío si la fila no trae patente")
+    dispositivo_id: Optional[int] = None
+    vehiculo_id: Optional[int] = None
+    error: Optional[str] = None
+
+class ImportacionResponse(BaseModel):
+    filas: int
+    dispositivos_creados: int
+    dispositivos_actualizados: int
+    vehiculos_creados: int
+    vehiculos_actualizados: int
+    errores: int
+    resultados: List[ResultadoFilaImportacion]
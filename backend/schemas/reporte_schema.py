@@ -0,0 +1,30 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Optional, List
+
+class ResumenPeriodoResponse(BaseModel):
+    vehiculo_id: int
+    vehiculo_patente: str
+    dispositivo_id: int
+    periodo: datetime = Field(..., description="Inicio de la hora o del día (local)")
+    distancia_km: float
+    velocidad_maxima: float = Field(..., description="Velocidad máxima en km/h")
+    horas_movimiento: float
+    puntos: int
+    primer_fix: Optional[datetime] = None
+    ultimo_fix: Optional[datetime] = None
+
+class TotalVehiculoResponse(BaseModel):
+    vehiculo_id: int
+    vehiculo_patente: str
+    dispositivo_id: int
+    distancia_km: float
+    velocidad_maxima: Optional[float] = None
+    horas_movimiento: float
+    puntos: int
+    dias_activos: int
+
+class ReconstruccionResumenes(BaseModel):
+    fecha_inicio: datetime = Field(..., description="Inicio del rango a recalcular (se amplía al día completo)")
+    fecha_fin: datetime = Field(..., description="Fin del rango a recalcular (se amplía al día completo)")
+    dispositivos: Optional[List[int]] = Field(None, description="Limitar a estos dispositivos")
@@ -0,0 +1,23 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Dict, List
+
+class ReproduccionCreate(BaseModel):
+    vehiculos: List[int] = Field(..., description="IDs de los vehículos a reproducir", min_length=1, max_length=500)
+    fecha_inicio: datetime = Field(..., description="Inicio de la reproducción")
+    fecha_fin: datetime = Field(..., description="Fin de la reproducción")
+    intervalo_seg: float = Field(1.0, description="Segundos de historial entre frames", gt=0, le=3600)
+
+class BloqueReproduccion(BaseModel):
+    bloque: int
+    desde: float = Field(..., description="Epoch (segundos) del primer frame del bloque")
+
+class ReproduccionResponse(BaseModel):
+    id: str
+    inicio: float = Field(..., description="Epoch (segundos) del primer frame")
+    fin: float = Field(..., description="Epoch (segundos) del último frame")
+    intervalo_seg: float
+    total_frames: int
+    frames_por_bloque: int
+    bloques: List[BloqueReproduccion]
+    vehiculos: Dict[int, str] = Field(..., description="dispositivo_id -> patente")
@@ -10,6 +10,7 @@ class UbicacionBase(BaseModel):
     rumbo: Optional[float] = Field(None, description="Rumbo en grados", ge=0, le=360)
     altitud: Optional[float] = Field(None, description="Altitud en metros")
     precision: Optional[float] = Field(None, description="Precisión en metros", ge=0)
+    secuencia: Optional[int] = Field(None, description="Número de serie del paquete en el equipo")
     timestamp: Optional[datetime] = Field(None, description="Marca de tiempo de la ubicación")
 
 class UbicacionCreate(UbicacionBase):
@@ -30,12 +31,57 @@ class UbicacionTracker(BaseModel):
     course: Optional[float] = Field(None, description="Rumbo", ge=0, le=360)
     altitude: Optional[float] = Field(None, description="Altitud")
     accuracy: Optional[float] = Field(None, description="Precisión", ge=0)
+    sequence: Optional[int] = Field(None, description="Número de serie del paquete", ge=0)
     timestamp: Optional[datetime] = None
 
+class ResultadoIngesta(BaseModel):
+    indice: int = Field(..., description="Posición del fix en el lote")
+    resultado: str = Field(..., description="creado, atrasado, duplicado, omitido, descartado o error")
+    id: Optional[int] = Field(None, description="ID de la ubicación creada o ya existente")
+    detalle: Optional[str] = None
+
+class LoteIngestaResponse(BaseModel):
+    creados: int
+    atrasados: int = Field(..., description="Guardados por el camino de datos atrasados")
+    duplicados: int
+    omitidos: int
+    descartados: int = Field(..., description="Rechazados por el filtro GPS (saltos imposibles)")
+    errores: int
+    resultados: List[ResultadoIngesta]
+
 class RutaResponse(BaseModel):
     dispositivo_id: int
     vehiculo_patente: Optional[str]
     ubicaciones: List[UbicacionResponse]
     total_puntos: int
     distancia_total: Optional[float] = None  
-    tiempo_total: Optional[float] = None  
\ No newline at end of file
+    tiempo_total: Optional[float] = None
+
+class RecorridosRequest(BaseModel):
+    vehiculos: List[int] = Field(..., description="IDs de los vehículos", min_length=1)
+    fecha_inicio: datetime = Field(..., description="Fecha de inicio")
+    fecha_fin: datetime = Field(..., description="Fecha de fin")
+    tolerancia_m: Optional[float] = Field(None, description="Simplificar cada recorrido con esta tolerancia en metros", gt=0)
+
+class RecorridoVehiculo(BaseModel):
+    vehiculo_id: int
+    vehiculo_patente: str
+    dispositivo_id: int
+    ubicaciones: List[UbicacionResponse]
+    total_puntos: int = Field(..., description="Puntos del recorrido antes de simplificar")
+    puntos_devueltos: int
+    distancia_total: Optional[float] = Field(None, description="Distancia en km (recorrido sin simplificar)")
+    tiempo_total: Optional[float] = Field(None, description="Duración en minutos")
+    velocidad_maxima: Optional[float] = None
+    velocidad_promedio: Optional[float] = Field(None, description="Distancia sobre duración, en km/h")
+
+class RecorridosResponse(BaseModel):
+    recorridos: List[RecorridoVehiculo]
+    total_puntos: int
+    vehiculos_sin_datos: List[int]
+
+class LimpiezaHistorial(BaseModel):
+    fecha_inicio: datetime = Field(..., description="Inicio del rango a limpiar")
+    fecha_fin: datetime = Field(..., description="Fin del rango a limpiar")
+    dispositivos: Optional[List[int]] = Field(None, description="Limitar a estos dispositivos")
+    aplicar: bool = Field(False, description="Borrar los puntos; si es falso solo se informa")
@@ -0,0 +1,132 @@
+from sqlalchemy import select, func, literal, Float
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.ubicacion import Ubicacion
+from core.config import settings
+from core.cache import MicroCache
+from core.database import sesion_lectura
+from core.espacial import bbox_tesela
+from core.resumenes import dia_cerrado, limites_dia
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+ZONA = ZoneInfo(settings.RESUMENES_ZONA_HORARIA)
+
+# Días abiertos: vida corta. Días cerrados: no cambian, se guardan sin vencimiento (LRU por tamaño)
+cache_teselas = MicroCache(settings.HEATMAP_TTL_SEG)
+cache_teselas_cerradas = MicroCache(math.inf, settings.HEATMAP_MAX_TESELAS_CERRADAS)
+
+Celdas = Dict[Tuple[int, int], float]
+
+class DensidadService:
+
+    @staticmethod
+    async def _celdas_dia(db: AsyncSession, z: int, x: int, y: int, resolucion: int, dia: date, dispositivo_id: Optional[int]) -> Celdas:
+        """Segundos de permanencia por subcelda de la tesela en un día, agregados en SQL.
+
+        La permanencia de cada fix es el tiempo hasta el siguiente fix del mismo
+        dispositivo (LEAD), con tope RESUMENES_MAX_HUECO_SEG para que un corte
+        de señal no cuente como tiempo detenido. LEAD corre sobre la serie
+        completa del día de cada dispositivo y recién después se filtra por la
+        tesela: si el siguiente fix se calculara dentro de la tesela, un
+        vehículo que sale y vuelve sumaría el tiempo afuera en su punto de salida.
+        """
+        min_lng, min_lat, max_lng, max_lat = bbox_tesela(z, x, y)
+        desde, hasta = limites_dia(dia, ZONA)
+        en_dia = (Ubicacion.timestamp >= desde, Ubicacion.timestamp < hasta)
+
+        def en_tesela(lat, lng):
+            return (lat >= min_lat, lat < max_lat, lng >= min_lng, lng < max_lng)
+
+        if dispositivo_id is not None:
+            dispositivos = [dispositivo_id]
+        else:
+            # Solo las series de dispositivos que pasaron por la tesela ese día
+            dispositivos = select(Ubicacion.dispositivo_id).where(
+                *en_dia, *en_tesela(Ubicacion.latitud, Ubicacion.longitud)
+            ).distinct().scalar_subquery()
+
+        siguiente = func.lead(Ubicacion.timestamp).over(
+            partition_by=Ubicacion.dispositivo_id, order_by=Ubicacion.timestamp
+        )
+        serie = select(
+            Ubicacion.latitud.label("lat"),
+            Ubicacion.longitud.label("lng"),
+            func.extract("epoch", siguiente - Ubicacion.timestamp).label("permanencia"),
+        ).where(*en_dia, Ubicacion.dispositivo_id.in_(dispositivos)).subquery()
+        puntos = select(serie).where(*en_tesela(serie.c.lat, serie.c.lng)).subquery()
+
+        # Índices de tesela web mercator al zoom z + resolucion
+        n = float(1 << (z + resolucion))
+        lat_rad = func.radians(puntos.c.lat, type_=Float)
+        uno = literal(1.0, Float)
+        celda_x = func.floor((puntos.c.lng + 180.0) / 360.0 * n)
+        celda_y = func.floor(
+            (uno - func.ln(func.tan(lat_rad, type_=Float) + uno / func.cos(lat_rad, type_=Float), type_=Float) / math.pi) / 2.0 * n
+        )
+        segundos = func.sum(func.least(func.coalesce(puntos.c.permanencia, 0.0), settings.RESUMENES_MAX_HUECO_SEG))
+
+        result = await db.execute(
+            select(celda_x.label("cx"), celda_y.label("cy"), segundos).group_by("cx", "cy")
+        )
+        return {(int(cx), int(cy)): float(total or 0.0) for cx, cy, total in result}
+
+    @staticmethod
+    async def obtener_tesela(z: int, x: int, y: int, resolucion: int, fecha_inicio: date, fecha_fin: date, dispositivo_id: Optional[int] = None) -> Dict[str, Any]:
+        """Mapa de calor de una tesela: suma por día de resultados cacheados por (tesela, día).
+
+        Cada día se consulta con una sesión propia, porque la caché comparte
+        la consulta entre requests.
+        """
+        dias = (fecha_fin - fecha_inicio).days + 1
+        if dias < 1:
+            raise ValueError("fecha_fin debe ser igual o posterior a fecha_inicio")
+        if dias > settings.HEATMAP_MAX_DIAS:
+            raise ValueError(f"El rango no puede superar {settings.HEATMAP_MAX_DIAS} días")
+
+        total: Celdas = {}
+        cerrada = True
+        for i in range(dias):
+            dia = fecha_inicio + timedelta(days=i)
+            cerrado = dia_cerrado(dia, ZONA, settings.DIA_CERRADO_GRACIA_MIN)
+            cerrada = cerrada and cerrado
+            cache = cache_teselas_cerradas if cerrado else cache_teselas
+            async def consultar(dia=dia):
+                async with sesion_lectura() as db:
+                    return await DensidadService._celdas_dia(db, z, x, y, resolucion, dia, dispositivo_id)
+
+            celdas = await cache.obtener(("tesela", z, x, y, resolucion, dia, dispositivo_id), consultar)
+            for clave, segundos in celdas.items():
+                total[clave] = total.get(clave, 0.0) + segundos
+
+        zoom_celdas = z + resolucion
+        elementos: List[Dict[str, Any]] = []
+        for (cx, cy), segundos in total.items():
+            if segundos <= 0:
+                continue
+            min_lng, min_lat, max_lng, max_lat = bbox_tesela(zoom_celdas, cx, cy)
+            elementos.append({
+                "x": cx,
+                "y": cy,
+                "lat": round((min_lat + max_lat) / 2, 6),
+                "lng": round((min_lng + max_lng) / 2, 6),
+                "segundos": round(segundos, 1),
+            })
+
+        return {
+            "z": z,
+            "x": x,
+            "y": y,
+            "zoom_celdas": zoom_celdas,
+            "cerrada": cerrada,
+            "max_segundos": max((e["segundos"] for e in elementos), default=0.0),
+            "celdas": elementos,
+        }
+
+    @staticmethod
+    def estadisticas() -> Dict[str, Any]:
+        return {"abiertas": cache_teselas.estadisticas(), "cerradas": cache_teselas_cerradas.estadisticas()}
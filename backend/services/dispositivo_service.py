@@ -3,6 +3,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from models.dispositivo import Dispositivo
 from schemas.dispositivo_schema import DispositivoCreate, DispositivoUpdate
+from services.ultima_posicion_service import UltimaPosicionService
 from typing import List, Optional
 import logging
 
@@ -78,6 +79,7 @@ class DispositivoService:
             
             stmt = update(Dispositivo).where(Dispositivo.id == dispositivo_id).values(**update_data)
             await db.execute(stmt)
+            await UltimaPosicionService.tocar(db, [int(dispositivo_id)])
             await db.commit()
             
             return await DispositivoService.obtener_dispositivo_por_id(db, dispositivo_id)
@@ -94,6 +96,7 @@ class DispositivoService:
                 Dispositivo.id == dispositivo_id
             ).values(vehiculo_id=vehiculo_id)
             await db.execute(stmt)
+            await UltimaPosicionService.tocar(db, [int(dispositivo_id)])
             await db.commit()
             
             return await DispositivoService.obtener_dispositivo_por_id(db, dispositivo_id)
@@ -110,6 +113,7 @@ class DispositivoService:
                 Dispositivo.id == dispositivo_id
             ).values(vehiculo_id=None)
             await db.execute(stmt)
+            await UltimaPosicionService.tocar(db, [int(dispositivo_id)])
             await db.commit()
             
             return await DispositivoService.obtener_dispositivo_por_id(db, dispositivo_id)
@@ -124,6 +128,7 @@ class DispositivoService:
         try:
             stmt = update(Dispositivo).where(Dispositivo.id == dispositivo_id).values(activo=False)
             result = await db.execute(stmt)
+            await UltimaPosicionService.tocar(db, [int(dispositivo_id)])
             await db.commit()
             return result.rowcount > 0
         except Exception as e:
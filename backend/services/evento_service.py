@@ -0,0 +1,90 @@
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.evento import Evento
+from models.dispositivo import Dispositivo
+from schemas.evento_schema import AlarmaTracker
+from core.realtime import MedidorLatencia
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Prefijo del tipo de evento para las alarmas reportadas por el equipo
+ALARMA = "alarma_"
+
+# Desde la llegada del paquete al servidor TCP hasta que la alarma queda guardada
+latencias_alarmas = MedidorLatencia()
+
+def _utc(valor: datetime) -> datetime:
+    return valor.replace(tzinfo=timezone.utc) if valor.tzinfo is None else valor
+
+class EventoService:
+    
+    @staticmethod
+    async def obtener_eventos(db: AsyncSession, dispositivo_id: Optional[int] = None, tipo: Optional[str] = None, fecha_inicio: Optional[datetime] = None, fecha_fin: Optional[datetime] = None, limit: int = 1000) -> List[Evento]:
+        """Obtener eventos, del más reciente al más antiguo"""
+        stmt = select(Evento)
+        if dispositivo_id is not None:
+            stmt = stmt.where(Evento.dispositivo_id == dispositivo_id)
+        if tipo:
+            stmt = stmt.where(Evento.tipo == tipo)
+        if fecha_inicio:
+            stmt = stmt.where(Evento.timestamp >= fecha_inicio)
+        if fecha_fin:
+            stmt = stmt.where(Evento.timestamp <= fecha_fin)
+        
+        result = await db.execute(stmt.order_by(Evento.timestamp.desc()).limit(limit))
+        return result.scalars().all()
+    
+    @staticmethod
+    async def registrar_alarma(db: AsyncSession, alarma: AlarmaTracker) -> Tuple[Evento, bool]:
+        """Guardar una alarma del equipo como evento; un reintento devuelve el ya guardado (False)"""
+        result = await db.execute(select(Dispositivo.id).where(Dispositivo.imei == alarma.device_id))
+        dispositivo_id = result.scalar_one_or_none()
+        if dispositivo_id is None:
+            raise ValueError(f"Dispositivo {alarma.device_id} no encontrado")
+
+        tipo = f"{ALARMA}{alarma.tipo}"
+        # recibido_en viaja igual en cada reintento: sirve de clave si el paquete no trae hora
+        marca_tiempo = _utc(alarma.timestamp or alarma.recibido_en or datetime.now(timezone.utc))
+        detalle = dict(alarma.detalle or {})
+        detalle["codigo"] = alarma.codigo
+        if alarma.speed is not None:
+            detalle["velocidad"] = alarma.speed
+        if alarma.recibido_en is not None:
+            detalle["recibido_en"] = alarma.recibido_en.isoformat()
+
+        # El índice único parcial uq_eventos_alarma resuelve los reintentos simultáneos:
+        # solo uno inserta y los demás leen la fila ya guardada
+        stmt = insert(Evento).values(
+            dispositivo_id=dispositivo_id,
+            tipo=tipo,
+            latitud=alarma.lat,
+            longitud=alarma.lng,
+            detalle=detalle,
+            timestamp=marca_tiempo,
+        ).on_conflict_do_nothing(
+            index_elements=[Evento.dispositivo_id, Evento.tipo, Evento.timestamp],
+            # Literal, igual al predicado del índice: con un parámetro Postgres no lo infiere
+            index_where=text(f"tipo LIKE '{ALARMA}%'")
+        ).returning(Evento)
+        evento = (await db.execute(select(Evento).from_statement(stmt))).scalar_one_or_none()
+        await db.commit()
+        if evento is None:
+            existente = (await db.execute(
+                select(Evento).where(
+                    Evento.dispositivo_id == dispositivo_id,
+                    Evento.tipo == tipo,
+                    Evento.timestamp == marca_tiempo
+                )
+            )).scalar_one()
+            return existente, False
+
+        if alarma.recibido_en is not None:
+            latencias_alarmas.registrar(
+                max((datetime.now(timezone.utc) - _utc(alarma.recibido_en)).total_seconds(), 0.0)
+            )
+        logger.warning(f"🚨 Alarma {alarma.tipo} | dispositivo {alarma.device_id} | evento {evento.id}")
+        return evento, True
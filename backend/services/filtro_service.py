@@ -0,0 +1,175 @@
+from sqlalchemy import select, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.ubicacion import Ubicacion
+from models.dispositivo import Dispositivo
+from models.ultima_posicion import UltimaPosicion
+from core.config import settings
+from core.diferido import importar_diferido
+from core.database import AsyncSessionLocal
+from core.filtro_gps import FiltroGPS, marcar_descartables
+from services.resumen_service import ResumenService
+from services.densidad_service import cache_teselas_cerradas
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+np = importar_diferido("numpy")
+
+filtro_gps = FiltroGPS(
+    settings.FILTRO_MAX_VELOCIDAD_KMH,
+    settings.FILTRO_MAX_ACELERACION_MS2,
+    settings.REGLAS_UMBRAL_DETENIDO_KMH,
+    settings.FILTRO_RADIO_DETENIDO_M,
+    settings.FILTRO_MAX_RECHAZOS,
+)
+
+# Ids por DELETE, para no armar sentencias gigantes
+TAMANO_BORRADO = 5000
+
+def _utc(valor: datetime) -> datetime:
+    return valor.replace(tzinfo=timezone.utc) if valor.tzinfo is None else valor
+
+class FiltroService:
+
+    @staticmethod
+    async def limpiar_historial(fecha_inicio: datetime, fecha_fin: datetime, dispositivos: Optional[List[int]] = None, aplicar: bool = False) -> Dict[str, Any]:
+        """Pasar el filtro vectorizado sobre el historial guardado.
+
+        Sin `aplicar` solo informa qué se borraría. Al aplicar, borra los saltos
+        y el jitter de estacionamiento y reconstruye los resúmenes del rango.
+        La última posición vigente de cada dispositivo nunca se borra.
+        """
+        if not dispositivos:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(select(Dispositivo.id).order_by(Dispositivo.id))
+                dispositivos = list(result.scalars())
+
+        tamano = settings.RESUMENES_BACKFILL_LOTE
+        lotes = [dispositivos[i:i + tamano] for i in range(0, len(dispositivos), tamano)]
+        semaforo = asyncio.Semaphore(settings.RESUMENES_BACKFILL_PARALELO)
+
+        async def procesar(lote: List[int]) -> Dict[str, Any]:
+            async with semaforo:
+                return await FiltroService._limpiar_lote(lote, fecha_inicio, fecha_fin, aplicar)
+
+        resultados = await asyncio.gather(*(procesar(lote) for lote in lotes), return_exceptions=True)
+
+        totales = {"dispositivos": len(dispositivos), "lotes_fallidos": 0,
+                   "puntos": 0, "saltos": 0, "jitter": 0, "descartables": 0, "eliminados": 0, "aplicado": aplicar}
+        afectados: List[int] = []
+        for resultado in resultados:
+            if isinstance(resultado, Exception):
+                totales["lotes_fallidos"] += 1
+                continue
+            afectados.extend(resultado.pop("afectados"))
+            for clave, valor in resultado.items():
+                totales[clave] += valor
+
+        if aplicar and afectados:
+            totales["resumenes"] = await ResumenService.reconstruir(fecha_inicio, fecha_fin, afectados)
+            cache_teselas_cerradas.invalidar_prefijo("tesela")
+        logger.info(f"Limpieza de historial {fecha_inicio:%Y-%m-%d} a {fecha_fin:%Y-%m-%d}: {totales}")
+        return totales
+
+    @staticmethod
+    async def _limpiar_lote(dispositivos: List[int], inicio: datetime, fin: datetime, aplicar: bool) -> Dict[str, Any]:
+        async with AsyncSessionLocal() as db:
+            try:
+                filas = (await db.execute(
+                    select(
+                        Ubicacion.dispositivo_id, Ubicacion.id, Ubicacion.timestamp,
+                        Ubicacion.latitud, Ubicacion.longitud, Ubicacion.velocidad
+                    ).where(
+                        Ubicacion.dispositivo_id.in_(dispositivos),
+                        Ubicacion.timestamp >= inicio,
+                        Ubicacion.timestamp <= fin
+                    ).order_by(Ubicacion.dispositivo_id, Ubicacion.timestamp)
+                )).all()
+                resultado = {"puntos": len(filas), "saltos": 0, "jitter": 0, "descartables": 0, "eliminados": 0, "afectados": []}
+                if not filas:
+                    return resultado
+
+                protegidos = set((await db.execute(
+                    select(UltimaPosicion.ubicacion_id).where(UltimaPosicion.dispositivo_id.in_(dispositivos))
+                )).scalars())
+
+                dispositivo, ids, marcas, lats, lngs, vels = zip(*filas)
+                dispositivo = np.asarray(dispositivo)
+                ids = np.asarray(ids)
+                ts = np.fromiter((m.timestamp() for m in marcas), dtype=np.float64, count=len(marcas))
+                lat = np.asarray(lats, dtype=np.float64)
+                lng = np.asarray(lngs, dtype=np.float64)
+                vel = np.asarray([v or 0.0 for v in vels], dtype=np.float64)
+
+                cortes = np.flatnonzero(np.diff(dispositivo)) + 1
+                limites = np.concatenate(([0], cortes, [len(dispositivo)]))
+                borrar: List[int] = []
+                for a, b in zip(limites[:-1], limites[1:]):
+                    saltos, jitter = marcar_descartables(ts[a:b], lat[a:b], lng[a:b], vel[a:b], filtro_gps)
+                    resultado["saltos"] += int(saltos.sum())
+                    resultado["jitter"] += int(jitter.sum())
+                    candidatos = [int(i) for i in ids[a:b][saltos | jitter] if int(i) not in protegidos]
+                    if candidatos:
+                        borrar.extend(candidatos)
+                        resultado["afectados"].append(int(dispositivo[a]))
+
+                resultado["descartables"] = len(borrar)
+                if aplicar and borrar:
+                    for i in range(0, len(borrar), TAMANO_BORRADO):
+                        await db.execute(delete(Ubicacion).where(Ubicacion.id.in_(borrar[i:i + TAMANO_BORRADO])))
+                    await db.commit()
+                    resultado["eliminados"] = len(borrar)
+                else:
+                    resultado["afectados"] = []
+                return resultado
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Error limpiando historial de {len(dispositivos)} dispositivos: {e}")
+                raise
+
+    @staticmethod
+    async def saltos_atrasados(db: AsyncSession, dispositivo_id: int, filas: List[Dict[str, Any]]) -> Set[datetime]:
+        """Marcas de tiempo de los fixes atrasados que son saltos imposibles.
+
+        El estado de FiltroGPS ya pasó de largo a los atrasados: se los mezcla con
+        lo guardado entre el punto anterior y el siguiente a su rango y se pasa
+        marcar_descartables sobre esa serie. Solo se descartan saltos; el jitter
+        de estacionamiento queda para la limpieza de historial.
+        """
+        marcas = [f["timestamp"] for f in filas]
+        desde, hasta = min(marcas), max(marcas)
+        del_dispositivo = Ubicacion.dispositivo_id == dispositivo_id
+        previo = select(func.max(Ubicacion.timestamp)).where(del_dispositivo, Ubicacion.timestamp < desde).scalar_subquery()
+        posterior = select(func.min(Ubicacion.timestamp)).where(del_dispositivo, Ubicacion.timestamp > hasta).scalar_subquery()
+        guardados = (await db.execute(
+            select(Ubicacion.timestamp, Ubicacion.latitud, Ubicacion.longitud, Ubicacion.velocidad).where(
+                del_dispositivo,
+                Ubicacion.timestamp >= func.coalesce(previo, desde),
+                Ubicacion.timestamp <= func.coalesce(posterior, hasta)
+            )
+        )).all()
+
+        # Un atrasado con la marca de un punto guardado es un reintento: cuenta lo guardado
+        serie = {_utc(m).timestamp(): (lat, lng, vel, None) for m, lat, lng, vel in guardados}
+        for fila in filas:
+            serie.setdefault(fila["timestamp"].timestamp(), (fila["latitud"], fila["longitud"], fila["velocidad"], fila["timestamp"]))
+        if len(serie) < 3:
+            return set()
+
+        ts = np.fromiter(sorted(serie), dtype=np.float64, count=len(serie))
+        puntos = [serie[t] for t in ts.tolist()]
+        lat = np.asarray([p[0] for p in puntos], dtype=np.float64)
+        lng = np.asarray([p[1] for p in puntos], dtype=np.float64)
+        vel = np.asarray([p[2] or 0.0 for p in puntos], dtype=np.float64)
+        saltos, _ = marcar_descartables(ts, lat, lng, vel, filtro_gps)
+        descartados = {puntos[i][3] for i in np.flatnonzero(saltos) if puntos[i][3] is not None}
+        if descartados:
+            logger.info(f"🚫 {len(descartados)} fix(es) atrasado(s) descartado(s) por salto imposible | dispositivo {dispositivo_id}")
+        return descartados
+
+    @staticmethod
+    def estadisticas() -> Dict[str, Any]:
+        return filtro_gps.estadisticas()
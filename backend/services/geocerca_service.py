@@ -0,0 +1,330 @@
+from sqlalchemy import select, update, delete, insert, func, literal, exists, or_, and_, DateTime
+from sqlalchemy.dialects.postgresql import insert as insert_pg
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from models.geocerca import Geocerca, PresenciaGeocerca
+from models.evento import Evento
+from models.ubicacion import Ubicacion
+from models.ultima_posicion import UltimaPosicion
+from schemas.geocerca_schema import GeocercaCreate
+from core.config import settings
+from core.geocercas import GeocercaCompilada, MotorGeocercas
+from datetime import datetime, timezone
+from typing import List, Optional, Dict, Set
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+TIPO_ENTRADA = "geocerca_entrada"
+TIPO_SALIDA = "geocerca_salida"
+
+class EstadoMotor:
+    """Momento de la última carga y marca de cambios de geocercas ya aplicada"""
+
+    def __init__(self):
+        self.cargado_en: Optional[float] = None
+        self.ultima_modificacion: Optional[datetime] = None
+
+motor_geocercas = MotorGeocercas(settings.GEOCERCAS_CELDA_GRADOS)
+estado_motor = EstadoMotor()
+
+def _compilar(geocerca: Geocerca) -> GeocercaCompilada:
+    if geocerca.tipo == "circulo":
+        return GeocercaCompilada(
+            geocerca.id, centro=(geocerca.centro_lat, geocerca.centro_lng), radio_m=geocerca.radio_m
+        )
+    return GeocercaCompilada(geocerca.id, puntos=geocerca.puntos)
+
+class GeocercaService:
+
+    @staticmethod
+    async def crear_geocerca(db: AsyncSession, geocerca_data: GeocercaCreate) -> Geocerca:
+        """Crear una nueva geocerca"""
+        try:
+            nueva_geocerca = Geocerca(**geocerca_data.model_dump())
+            db.add(nueva_geocerca)
+            await db.commit()
+            await db.refresh(nueva_geocerca)
+            estado_motor.cargado_en = None
+            logger.info(f"Geocerca creada: {nueva_geocerca.nombre}")
+            return nueva_geocerca
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error creando geocerca: {e}")
+            raise
+
+    @staticmethod
+    async def obtener_geocercas(db: AsyncSession, activos_solo: bool = True) -> List[Geocerca]:
+        """Obtener lista de geocercas"""
+        stmt = select(Geocerca)
+        if activos_solo:
+            stmt = stmt.where(Geocerca.activo == True)
+        result = await db.execute(stmt.order_by(Geocerca.nombre))
+        return result.scalars().all()
+
+    @staticmethod
+    async def obtener_geocerca_por_id(db: AsyncSession, geocerca_id: int) -> Optional[Geocerca]:
+        """Obtener geocerca por ID"""
+        result = await db.execute(select(Geocerca).where(Geocerca.id == geocerca_id))
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    async def eliminar_geocerca(db: AsyncSession, geocerca_id: int) -> bool:
+        """Eliminar geocerca (soft delete).
+
+        Los dispositivos que presencias_geocerca tiene adentro reciben su
+        evento de salida en la misma transacción: el motor descarta la
+        geocerca al recargar y no volvería a emitirla.
+        """
+        try:
+            stmt = update(Geocerca).where(
+                Geocerca.id == geocerca_id, Geocerca.activo == True
+            ).values(activo=False).returning(Geocerca.id)
+            if (await db.execute(stmt)).first() is None:
+                # Ya estaba dada de baja (o no existe): no hay salidas que emitir
+                return await GeocercaService.obtener_geocerca_por_id(db, geocerca_id) is not None
+
+            salidas = await GeocercaService._salidas_por_baja(db, geocerca_id)
+            await db.commit()
+            estado_motor.cargado_en = None
+            logger.info(f"Geocerca {geocerca_id} dada de baja: {len(salidas)} salida(s) emitida(s)")
+            return True
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error eliminando geocerca {geocerca_id}: {e}")
+            raise
+
+    @staticmethod
+    async def _salidas_por_baja(db: AsyncSession, geocerca_id: int) -> List[Evento]:
+        """Agregar a la sesión una salida por cada dispositivo que estaba adentro de la geocerca"""
+        presencias = PresenciaGeocerca.__table__
+        result = await db.execute(
+            delete(presencias).where(presencias.c.geocerca_id == geocerca_id).returning(presencias.c.dispositivo_id)
+        )
+        dispositivos = list(result.scalars())
+        if not dispositivos:
+            return []
+
+        # La salida se ubica en la última posición conocida del dispositivo
+        result = await db.execute(
+            select(UltimaPosicion.dispositivo_id, UltimaPosicion.latitud, UltimaPosicion.longitud)
+            .where(UltimaPosicion.dispositivo_id.in_(dispositivos))
+        )
+        posiciones = {dispositivo_id: (lat, lng) for dispositivo_id, lat, lng in result}
+        ahora = datetime.now(timezone.utc)
+        eventos = [
+            Evento(
+                dispositivo_id=dispositivo_id,
+                tipo=TIPO_SALIDA,
+                geocerca_id=geocerca_id,
+                latitud=posiciones.get(dispositivo_id, (None, None))[0],
+                longitud=posiciones.get(dispositivo_id, (None, None))[1],
+                detalle={"motivo": "baja_geocerca"},
+                timestamp=ahora,
+            )
+            for dispositivo_id in dispositivos
+        ]
+        db.add_all(eventos)
+        return eventos
+
+    @staticmethod
+    async def asegurar_motor(db: AsyncSession) -> MotorGeocercas:
+        """Compilar el índice si no está cargado o si cambió en la base (revisado cada N segundos)"""
+        ahora = time.monotonic()
+        if estado_motor.cargado_en is not None and ahora - estado_motor.cargado_en < settings.GEOCERCAS_RECARGA_SEG:
+            return motor_geocercas
+
+        ultima = (await db.execute(select(func.max(Geocerca.updated_at)))).scalar()
+        if estado_motor.cargado_en is None or ultima != estado_motor.ultima_modificacion:
+            geocercas = await GeocercaService.obtener_geocercas(db)
+            compiladas = []
+            for geocerca in geocercas:
+                try:
+                    compiladas.append(_compilar(geocerca))
+                except (ValueError, TypeError) as e:
+                    logger.error(f"Geocerca {geocerca.id} inválida, se omite: {e}")
+            motor_geocercas.cargar(compiladas)
+            estado_motor.ultima_modificacion = ultima
+
+        estado_motor.cargado_en = ahora
+        return motor_geocercas
+
+    @staticmethod
+    async def evaluar_fix(db: AsyncSession, ubicacion: Ubicacion) -> List[Evento]:
+        """Agregar a la sesión los eventos de entrada/salida que genera el fix.
+
+        El estado dentro/fuera se lee de presencias_geocerca, compartida por
+        los workers y persistente entre reinicios. Cada transición se aplica
+        con DELETE / INSERT ... RETURNING: si dos workers la ven a la vez,
+        solo la emite el que efectivamente cambió la fila.
+        """
+        motor = await GeocercaService.asegurar_motor(db)
+        dispositivo_id = ubicacion.dispositivo_id
+        presencias = PresenciaGeocerca.__table__
+
+        actuales = motor.contenedoras(ubicacion.latitud, ubicacion.longitud)
+        anteriores = set((await db.execute(
+            select(presencias.c.geocerca_id).where(presencias.c.dispositivo_id == dispositivo_id)
+        )).scalars())
+
+        salidas = anteriores - actuales
+        desconocidas = salidas - motor.geocercas.keys()
+        if desconocidas:
+            # Geocercas que este worker todavía no cargó: si siguen activas no es una salida
+            salidas -= set((await db.execute(
+                select(Geocerca.id).where(Geocerca.id.in_(desconocidas), Geocerca.activo == True)
+            )).scalars())
+        entradas = actuales - anteriores
+
+        transiciones = []
+        if salidas:
+            result = await db.execute(
+                delete(presencias).where(
+                    presencias.c.dispositivo_id == dispositivo_id,
+                    presencias.c.geocerca_id.in_(salidas)
+                ).returning(presencias.c.geocerca_id)
+            )
+            transiciones += [(geocerca_id, TIPO_SALIDA) for geocerca_id in result.scalars()]
+        if entradas:
+            # Solo geocercas activas: un worker que no recargó tras una baja todavía la evalúa
+            stmt = insert_pg(presencias).from_select(
+                ["dispositivo_id", "geocerca_id", "desde"],
+                select(
+                    literal(dispositivo_id), Geocerca.id, literal(ubicacion.timestamp, DateTime(timezone=True))
+                ).where(Geocerca.id.in_(entradas), Geocerca.activo == True)
+            ).on_conflict_do_nothing().returning(presencias.c.geocerca_id)
+            transiciones += [(geocerca_id, TIPO_ENTRADA) for geocerca_id in (await db.execute(stmt)).scalars()]
+
+        eventos = [
+            Evento(
+                dispositivo_id=dispositivo_id,
+                tipo=tipo,
+                geocerca_id=geocerca_id,
+                latitud=ubicacion.latitud,
+                longitud=ubicacion.longitud,
+                timestamp=ubicacion.timestamp,
+            )
+            for geocerca_id, tipo in transiciones
+        ]
+        if eventos:
+            db.add_all(eventos)
+            logger.info(f"🚧 Dispositivo {dispositivo_id}: {len(eventos)} evento(s) de geocerca")
+        return eventos
+
+    @staticmethod
+    async def derivar_presencias(db: AsyncSession, dispositivos: Optional[List[int]] = None) -> None:
+        """Rehacer presencias_geocerca desde el último evento de entrada/salida de cada (dispositivo, geocerca)"""
+        presencias = PresenciaGeocerca.__table__
+        evento = aliased(Evento)
+        posterior = aliased(Evento)
+
+        hay_posterior = exists().where(
+            posterior.dispositivo_id == evento.dispositivo_id,
+            posterior.geocerca_id == evento.geocerca_id,
+            posterior.tipo.in_((TIPO_ENTRADA, TIPO_SALIDA)),
+            or_(
+                posterior.timestamp > evento.timestamp,
+                and_(posterior.timestamp == evento.timestamp, posterior.id > evento.id)
+            )
+        )
+        ultimas_entradas = select(
+            evento.dispositivo_id, evento.geocerca_id, evento.timestamp
+        ).join(
+            Geocerca, Geocerca.id == evento.geocerca_id
+        ).where(
+            evento.tipo == TIPO_ENTRADA,
+            Geocerca.activo == True,
+            ~hay_posterior
+        )
+
+        borrar = delete(presencias)
+        if dispositivos:
+            borrar = borrar.where(presencias.c.dispositivo_id.in_(dispositivos))
+            ultimas_entradas = ultimas_entradas.where(evento.dispositivo_id.in_(dispositivos))
+        await db.execute(borrar)
+        await db.execute(
+            insert(presencias).from_select(["dispositivo_id", "geocerca_id", "desde"], ultimas_entradas)
+        )
+
+    @staticmethod
+    async def reproducir(db: AsyncSession, fecha_inicio: datetime, fecha_fin: datetime, dispositivos: Optional[List[int]] = None, reemplazar: bool = True) -> Dict[str, int]:
+        """Reevaluar geocercas sobre el historial guardado.
+
+        Recorre las ubicaciones en streaming, ordenadas por dispositivo y tiempo,
+        con un estado propio e inserta los eventos en lotes. Al terminar,
+        presencias_geocerca se rehace desde los eventos resultantes.
+        """
+        try:
+            motor = await GeocercaService.asegurar_motor(db)
+            tipos = (TIPO_ENTRADA, TIPO_SALIDA)
+
+            if reemplazar:
+                stmt_borrar = delete(Evento).where(
+                    Evento.tipo.in_(tipos),
+                    Evento.timestamp >= fecha_inicio,
+                    Evento.timestamp <= fecha_fin,
+                )
+                if dispositivos:
+                    stmt_borrar = stmt_borrar.where(Evento.dispositivo_id.in_(dispositivos))
+                await db.execute(stmt_borrar)
+
+            stmt = select(
+                Ubicacion.dispositivo_id, Ubicacion.latitud, Ubicacion.longitud, Ubicacion.timestamp
+            ).where(
+                Ubicacion.timestamp >= fecha_inicio,
+                Ubicacion.timestamp <= fecha_fin,
+            ).order_by(Ubicacion.dispositivo_id, Ubicacion.timestamp)
+            if dispositivos:
+                stmt = stmt.where(Ubicacion.dispositivo_id.in_(dispositivos))
+
+            estado: Dict[int, Set[int]] = {}
+            lote = []
+            puntos = 0
+            total_eventos = 0
+
+            result = await db.stream(stmt.execution_options(yield_per=settings.GEOCERCAS_LOTE_REPRODUCCION))
+            async for dispositivo_id, lat, lng, marca_tiempo in result:
+                puntos += 1
+                for geocerca_id, transicion in motor.evaluar(dispositivo_id, lat, lng, estado):
+                    lote.append({
+                        "dispositivo_id": dispositivo_id,
+                        "tipo": TIPO_ENTRADA if transicion == "entrada" else TIPO_SALIDA,
+                        "geocerca_id": geocerca_id,
+                        "latitud": lat,
+                        "longitud": lng,
+                        "marca_tiempo": marca_tiempo,
+                    })
+                if len(lote) >= settings.GEOCERCAS_LOTE_REPRODUCCION:
+                    await db.execute(insert(Evento.__table__), lote)
+                    total_eventos += len(lote)
+                    lote = []
+
+            if lote:
+                await db.execute(insert(Evento.__table__), lote)
+                total_eventos += len(lote)
+
+            # Los eventos del rango cambiaron: el estado en vivo sigue al último de cada par
+            await GeocercaService.derivar_presencias(db, dispositivos)
+            await db.commit()
+            logger.info(f"Reproducción de geocercas: {puntos} puntos, {total_eventos} eventos")
+            return {"puntos": puntos, "eventos": total_eventos, "dispositivos": len(estado)}
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error reproduciendo geocercas: {e}")
+            raise
+
+    @staticmethod
+    async def obtener_eventos(db: AsyncSession, dispositivo_id: Optional[int] = None, geocerca_id: Optional[int] = None, fecha_inicio: Optional[datetime] = None, fecha_fin: Optional[datetime] = None, limit: int = 1000) -> List[Evento]:
+        """Obtener eventos de geocerca"""
+        stmt = select(Evento).where(Evento.tipo.in_((TIPO_ENTRADA, TIPO_SALIDA)))
+        if dispositivo_id is not None:
+            stmt = stmt.where(Evento.dispositivo_id == dispositivo_id)
+        if geocerca_id is not None:
+            stmt = stmt.where(Evento.geocerca_id == geocerca_id)
+        if fecha_inicio:
+            stmt = stmt.where(Evento.timestamp >= fecha_inicio)
+        if fecha_fin:
+            stmt = stmt.where(Evento.timestamp <= fecha_fin)
+        result = await db.execute(stmt.order_by(Evento.timestamp.desc()).limit(limit))
+        return result.scalars().all()
@@ -0,0 +1,189 @@
+from datetime import datetime
+from typing import List, Optional, Dict, Any, Sequence
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+FORMATO_JSON = "json"
+FORMATO_POLYLINE = "polyline"
+FORMATO_GEOJSON = "geojson"
+FORMATO_COLUMNAR = "columnar"
+
+FORMATOS = (FORMATO_JSON, FORMATO_POLYLINE, FORMATO_GEOJSON, FORMATO_COLUMNAR)
+
+# Tipos MIME aceptados en el header Accept para negociar el formato
+MEDIA_TYPES = {
+    "application/vnd.google.polyline+json": FORMATO_POLYLINE,
+    "application/geo+json": FORMATO_GEOJSON,
+    "application/vnd.tracking.columnar+json": FORMATO_COLUMNAR,
+}
+
+class GeometriaService:
+
+    @staticmethod
+    def negociar_formato(formato: Optional[str], accept: Optional[str]) -> str:
+        """Resolver el formato pedido: query param primero, luego header Accept"""
+        if formato:
+            formato = formato.lower()
+            if formato not in FORMATOS:
+                raise ValueError(f"Formato no soportado: {formato}")
+            return formato
+
+        if accept:
+            for parte in accept.split(","):
+                media_type = parte.split(";")[0].strip().lower()
+                if media_type in MEDIA_TYPES:
+                    return MEDIA_TYPES[media_type]
+
+        return FORMATO_JSON
+
+    @staticmethod
+    def media_type(formato: str) -> str:
+        """Tipo MIME de respuesta para un formato"""
+        for media_type, f in MEDIA_TYPES.items():
+            if f == formato:
+                return media_type
+        return "application/json"
+
+    @staticmethod
+    def codificar_polyline(coordenadas: Sequence[tuple], precision: int = 5) -> str:
+        """Codificar pares (lat, lng) con el algoritmo Encoded Polyline de Google"""
+        factor = 10 ** precision
+        resultado = []
+        prev_lat = 0
+        prev_lng = 0
+
+        for lat, lng in coordenadas:
+            lat_i = int(round(lat * factor))
+            lng_i = int(round(lng * factor))
+
+            for delta in (lat_i - prev_lat, lng_i - prev_lng):
+                valor = ~(delta << 1) if delta < 0 else (delta << 1)
+                while valor >= 0x20:
+                    resultado.append(chr((0x20 | (valor & 0x1F)) + 63))
+                    valor >>= 5
+                resultado.append(chr(valor + 63))
+
+            prev_lat = lat_i
+            prev_lng = lng_i
+
+        return "".join(resultado)
+
+    @staticmethod
+    def simplificar(coordenadas: Sequence[tuple], tolerancia_m: float) -> List[int]:
+        """Índices de los puntos que conserva Douglas-Peucker con la tolerancia en metros.
+
+        Proyecta a un plano equirectangular local (suficiente para tramos de un
+        recorrido) y usa una pila en vez de recursión para trazas largas.
+        """
+        n = len(coordenadas)
+        if n <= 2 or tolerancia_m <= 0:
+            return list(range(n))
+
+        lat_ref = math.radians(sum(lat for lat, _ in coordenadas) / n)
+        metros_grado = 111320.0
+        xs = [lng * metros_grado * math.cos(lat_ref) for _, lng in coordenadas]
+        ys = [lat * metros_grado for lat, _ in coordenadas]
+        tolerancia2 = tolerancia_m * tolerancia_m
+
+        conservar = [False] * n
+        conservar[0] = conservar[-1] = True
+        pila = [(0, n - 1)]
+        while pila:
+            inicio, fin = pila.pop()
+            dx, dy = xs[fin] - xs[inicio], ys[fin] - ys[inicio]
+            largo2 = dx * dx + dy * dy
+            max_d2, indice = 0.0, -1
+            for i in range(inicio + 1, fin):
+                px, py = xs[i] - xs[inicio], ys[i] - ys[inicio]
+                if largo2 == 0:
+                    d2 = px * px + py * py
+                else:
+                    t = max(0.0, min(1.0, (px * dx + py * dy) / largo2))
+                    ex, ey = px - t * dx, py - t * dy
+                    d2 = ex * ex + ey * ey
+                if d2 > max_d2:
+                    max_d2, indice = d2, i
+            if indice != -1 and max_d2 > tolerancia2:
+                conservar[indice] = True
+                pila.append((inicio, indice))
+                pila.append((indice, fin))
+
+        return [i for i in range(n) if conservar[i]]
+
+    @staticmethod
+    def codificar_timestamps(timestamps: Sequence[datetime], delta: bool = True) -> List[int]:
+        """Epoch en segundos; con delta, el primero es absoluto y el resto diferencias"""
+        epochs = [int(ts.timestamp()) for ts in timestamps]
+        if not delta or not epochs:
+            return epochs
+
+        resultado = [epochs[0]]
+        for i in range(1, len(epochs)):
+            resultado.append(epochs[i] - epochs[i - 1])
+        return resultado
+
+    @staticmethod
+    def codificar_ubicaciones(
+        ubicaciones: Sequence[Any],
+        formato: str,
+        precision: int = 5,
+        delta_ts: bool = True,
+        propiedades: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Codificar una lista de ubicaciones (ORM o schema) en un formato compacto.
+
+        Los puntos se ordenan por tiempo ascendente: el historial llega del más
+        nuevo al más viejo y tanto la polyline como los deltas de ts asumen avance.
+        """
+        ubicaciones = sorted(ubicaciones, key=lambda u: u.timestamp)
+        coordenadas = [(u.latitud, u.longitud) for u in ubicaciones]
+        timestamps = GeometriaService.codificar_timestamps(
+            [u.timestamp for u in ubicaciones], delta_ts
+        )
+        velocidades = [round(u.velocidad or 0.0, 1) for u in ubicaciones]
+        propiedades = dict(propiedades or {})
+
+        if formato == FORMATO_POLYLINE:
+            return {
+                **propiedades,
+                "formato": FORMATO_POLYLINE,
+                "precision": precision,
+                "delta_ts": delta_ts,
+                "polyline": GeometriaService.codificar_polyline(coordenadas, precision),
+                "ts": timestamps,
+                "vel": velocidades,
+            }
+
+        if formato == FORMATO_GEOJSON:
+            # GeoJSON usa orden [lng, lat]
+            return {
+                "type": "Feature",
+                "geometry": {
+                    "type": "LineString",
+                    "coordinates": [
+                        [round(lng, precision), round(lat, precision)] for lat, lng in coordenadas
+                    ],
+                },
+                "properties": {
+                    **propiedades,
+                    "delta_ts": delta_ts,
+                    "ts": timestamps,
+                    "vel": velocidades,
+                },
+            }
+
+        if formato == FORMATO_COLUMNAR:
+            return {
+                **propiedades,
+                "formato": FORMATO_COLUMNAR,
+                "precision": precision,
+                "delta_ts": delta_ts,
+                "lat": [round(lat, precision) for lat, _ in coordenadas],
+                "lng": [round(lng, precision) for _, lng in coordenadas],
+                "ts": timestamps,
+                "vel": velocidades,
+            }
+
+        raise ValueError(f"Formato no soportado: {formato}")
@@ -0,0 +1,247 @@
+from sqlalchemy import select, func, inspect
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import ValidationError
+from models.dispositivo import Dispositivo
+from models.vehiculo import Vehiculo
+from schemas.importacion_schema import FilaFlota
+from services.regla_service import ReglaService
+from services.ultima_posicion_service import UltimaPosicionService
+from core.config import settings
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import codecs
+import csv
+import logging
+import orjson
+
+logger = logging.getLogger(__name__)
+
+FORMATO_CSV = "csv"
+FORMATO_NDJSON = "ndjson"
+
+_TIPOS_CONTENIDO = {
+    "text/csv": FORMATO_CSV,
+    "application/csv": FORMATO_CSV,
+    "application/x-ndjson": FORMATO_NDJSON,
+    "application/ndjson": FORMATO_NDJSON,
+    "application/jsonl": FORMATO_NDJSON,
+}
+
+# Columna del archivo -> columna de dispositivos (el resto de FilaFlota es del vehículo)
+CAMPOS_DISPOSITIVO = {
+    "imei": "imei",
+    "dispositivo_marca": "marca",
+    "dispositivo_modelo": "modelo",
+    "firmware_version": "firmware_version",
+    "dispositivo_activo": "activo",
+}
+CAMPOS_VEHICULO = [c for c in FilaFlota.model_fields if c not in CAMPOS_DISPOSITIVO]
+
+def _mensaje(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in e['loc']) or 'fila'}: {e['msg']}" for e in error.errors()
+    )
+
+async def _upsert(db: AsyncSession, modelo, valores: List[Dict[str, Any]], clave: str, forzar: Tuple[str, ...] = ()) -> Dict[str, int]:
+    """Upsert por `clave` ({clave: id}); los campos vacíos no pisan lo guardado.
+
+    Se ejecuta como executemany: SQLAlchemy arma INSERT multi-fila con RETURNING
+    ("insertmanyvalues") sobre una sentencia compilada una sola vez. Los valores
+    vienen por nombre de atributo (p. ej. year, que en la tabla es año).
+    """
+    columnas = inspect(modelo).columns
+    stmt = insert(modelo)
+    set_ = {}
+    for atributo in valores[0]:
+        if atributo == clave:
+            continue
+        columna = columnas[atributo]
+        nuevo = stmt.excluded[columna.key]
+        set_[columna.key] = nuevo if atributo in forzar else func.coalesce(nuevo, columna)
+    stmt = stmt.on_conflict_do_update(index_elements=[columnas[clave]], set_=set_).returning(
+        columnas[clave], columnas["id"]
+    )
+    parametros = [{columnas[a].key: v for a, v in fila.items()} for fila in valores]
+    return dict((await db.execute(stmt, parametros)).all())
+
+class ImportacionService:
+
+    @staticmethod
+    def formato_por_tipo(content_type: Optional[str]) -> Optional[str]:
+        tipo = (content_type or "").split(";")[0].strip().lower()
+        return _TIPOS_CONTENIDO.get(tipo)
+
+    @staticmethod
+    async def leer_filas(cuerpo: AsyncIterator[bytes], formato: str) -> AsyncIterator[Tuple[int, Any]]:
+        """Leer el archivo a medida que llega: (número de fila, dict o error de formato).
+
+        En CSV la primera línea es el encabezado y los campos vacíos valen None.
+        Las líneas en blanco se ignoran; un registro CSV no puede ocupar varias líneas.
+        """
+        decodificador = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+        encabezado: Optional[List[str]] = None
+        resto = ""
+        numero = 0
+
+        def procesar(lineas: List[str]):
+            nonlocal encabezado, numero
+            lineas = [l for l in lineas if l.strip()]
+            if formato == FORMATO_NDJSON:
+                for linea in lineas:
+                    numero += 1
+                    try:
+                        yield numero, orjson.loads(linea)
+                    except orjson.JSONDecodeError as e:
+                        yield numero, ValueError(f"JSON inválido: {e}")
+                return
+            for campos in csv.reader(lineas):
+                if encabezado is None:
+                    encabezado = [c.strip() for c in campos]
+                    desconocidas = set(encabezado) - set(FilaFlota.model_fields)
+                    if desconocidas:
+                        raise ValueError(f"Columnas desconocidas: {', '.join(sorted(desconocidas))}")
+                    if "imei" not in encabezado:
+                        raise ValueError("Falta la columna imei")
+                    continue
+                numero += 1
+                if len(campos) != len(encabezado):
+                    yield numero, ValueError(f"Se esperaban {len(encabezado)} columnas y hay {len(campos)}")
+                    continue
+                yield numero, {k: v.strip() or None for k, v in zip(encabezado, campos)}
+
+        async for trozo in cuerpo:
+            resto += decodificador.decode(trozo)
+            *lineas, resto = resto.split("\n")
+            for fila in procesar(lineas):
+                yield fila
+        resto += decodificador.decode(b"", final=True)
+        for fila in procesar([resto]):
+            yield fila
+
+    @staticmethod
+    async def importar_flota(db: AsyncSession, filas: AsyncIterator[Tuple[int, Any]], requiere_vehiculo: bool = False) -> Dict[str, Any]:
+        """Alta/actualización masiva de dispositivos y vehículos.
+
+        Valida cada fila a medida que se lee y guarda de a IMPORTACION_LOTE filas:
+        un upsert multi-fila por imei, otro por patente vinculando el vehículo al
+        dispositivo, y commit. Cada lote es una transacción; si falla, sus filas
+        quedan con error y se sigue con el siguiente.
+        """
+        reporte = {
+            "filas": 0, "dispositivos_creados": 0, "dispositivos_actualizados": 0,
+            "vehiculos_creados": 0, "vehiculos_actualizados": 0, "errores": 0, "resultados": [],
+        }
+        lote: List[Tuple[int, FilaFlota]] = []
+
+        async for numero, crudo in filas:
+            reporte["filas"] += 1
+            if isinstance(crudo, Exception):
+                ImportacionService._error(reporte, numero, None, str(crudo))
+                continue
+            try:
+                fila = FilaFlota.model_validate(crudo)
+            except ValidationError as e:
+                ImportacionService._error(reporte, numero, crudo if isinstance(crudo, dict) else None, _mensaje(e))
+                continue
+            if requiere_vehiculo and not fila.patente:
+                ImportacionService._error(reporte, numero, crudo, "Falta la patente")
+                continue
+            lote.append((numero, fila))
+            if len(lote) >= settings.IMPORTACION_LOTE:
+                await ImportacionService._guardar_lote(db, lote, reporte)
+                lote = []
+        if lote:
+            await ImportacionService._guardar_lote(db, lote, reporte)
+
+        reporte["resultados"].sort(key=lambda r: r["fila"])
+        logger.info(
+            f"Importación de flota: {reporte['filas']} filas | dispositivos {reporte['dispositivos_creados']} creados, "
+            f"{reporte['dispositivos_actualizados']} actualizados | vehículos {reporte['vehiculos_creados']} creados, "
+            f"{reporte['vehiculos_actualizados']} actualizados | {reporte['errores']} errores"
+        )
+        return reporte
+
+    @staticmethod
+    def _error(reporte: Dict[str, Any], numero: int, crudo: Optional[dict], mensaje: str) -> None:
+        reporte["errores"] += 1
+        reporte["resultados"].append({
+            "fila": numero,
+            "imei": crudo.get("imei") if crudo else None,
+            "patente": crudo.get("patente") if crudo else None,
+            "error": mensaje,
+        })
+
+    @staticmethod
+    async def _guardar_lote(db: AsyncSession, lote: List[Tuple[int, FilaFlota]], reporte: Dict[str, Any]) -> None:
+        # ON CONFLICT no admite la misma clave dos veces en una sentencia: gana la última fila
+        por_imei: Dict[str, Tuple[int, FilaFlota]] = {}
+        por_patente: Dict[str, Tuple[int, FilaFlota]] = {}
+        for numero, fila in lote:
+            anterior = por_imei.get(fila.imei)
+            if anterior:
+                ImportacionService._error(reporte, anterior[0], anterior[1].model_dump(), f"IMEI repetido; se usa la fila {numero}")
+            por_imei[fila.imei] = (numero, fila)
+        for numero, fila in sorted(por_imei.values(), key=lambda x: x[0]):
+            if fila.patente:
+                anterior = por_patente.get(fila.patente)
+                if anterior:
+                    ImportacionService._error(reporte, anterior[0], anterior[1].model_dump(), f"Patente repetida; se usa la fila {numero}")
+                    del por_imei[anterior[1].imei]
+                por_patente[fila.patente] = (numero, fila)
+        validas = sorted(por_imei.values(), key=lambda x: x[0])
+        con_vehiculo = [(n, f) for n, f in validas if f.patente]
+
+        try:
+            # Una consulta por lote para distinguir altas de actualizaciones y aplicar
+            # los valores por defecto solo a las altas
+            imeis_existentes = set((await db.execute(
+                select(Dispositivo.imei).where(Dispositivo.imei.in_([f.imei for _, f in validas]))
+            )).scalars())
+            asignados = dict((await db.execute(
+                select(Vehiculo.patente, Vehiculo.dispositivo_id).where(Vehiculo.patente.in_([f.patente for _, f in con_vehiculo]))
+            )).all()) if con_vehiculo else {}
+            patentes_existentes = set(asignados)
+
+            valores = []
+            for _, fila in validas:
+                datos = {columna: getattr(fila, campo) for campo, columna in CAMPOS_DISPOSITIVO.items()}
+                if fila.imei not in imeis_existentes:
+                    datos["modelo"] = datos["modelo"] or "CY06"
+                    datos["activo"] = True if datos["activo"] is None else datos["activo"]
+                valores.append(datos)
+            ids_dispositivo = await _upsert(db, Dispositivo, valores, "imei")
+
+            ids_vehiculo: Dict[str, int] = {}
+            if con_vehiculo:
+                valores = []
+                for _, fila in con_vehiculo:
+                    datos = {campo: getattr(fila, campo) for campo in CAMPOS_VEHICULO}
+                    datos["dispositivo_id"] = ids_dispositivo[fila.imei]
+                    if fila.patente not in patentes_existentes and datos["activo"] is None:
+                        datos["activo"] = True
+                    valores.append(datos)
+                ids_vehiculo = await _upsert(db, Vehiculo, valores, "patente", forzar=("dispositivo_id",))
+            # Tipo, estado o asignación pueden haber cambiado: que la grilla y los cursores relean
+            # los dispositivos del lote y los que tenían antes sus vehículos
+            await UltimaPosicionService.tocar(db, list(set(ids_dispositivo.values()) | set(asignados.values())))
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Error importando lote de {len(validas)} filas: {e}")
+            for numero, fila in validas:
+                ImportacionService._error(reporte, numero, fila.model_dump(), f"Error guardando el lote: {e}")
+            return
+
+        for numero, fila in validas:
+            dispositivo = "actualizado" if fila.imei in imeis_existentes else "creado"
+            reporte[f"dispositivos_{dispositivo}s"] += 1
+            resultado = {
+                "fila": numero, "imei": fila.imei, "patente": fila.patente,
+                "dispositivo": dispositivo, "dispositivo_id": ids_dispositivo[fila.imei],
+            }
+            if fila.patente:
+                vehiculo = "actualizado" if fila.patente in patentes_existentes else "creado"
+                reporte[f"vehiculos_{vehiculo}s"] += 1
+                resultado.update(vehiculo=vehiculo, vehiculo_id=ids_vehiculo[fila.patente])
+                ReglaService.invalidar_config(ids_dispositivo[fila.imei])
+            reporte["resultados"].append(resultado)
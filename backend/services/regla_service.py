@@ -0,0 +1,168 @@
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.dispositivo import Dispositivo
+from models.vehiculo import Vehiculo
+from models.evento import Evento
+from core.config import settings
+from core.database import AsyncSessionLocal
+from core.reglas import MotorReglas, PlanificadorVencimientos, SIN_SENAL
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+motor_reglas = MotorReglas(
+    settings.REGLAS_HISTERESIS_KMH,
+    settings.REGLAS_UMBRAL_DETENIDO_KMH,
+    settings.REGLAS_RALENTI_MIN,
+)
+planificador_senal = PlanificadorVencimientos()
+
+# dispositivo_id -> (expira_en, velocidad_maxima_permitida)
+_config_vehiculos: Dict[int, Tuple[float, Optional[float]]] = {}
+
+def _utc(valor: datetime) -> datetime:
+    return valor.replace(tzinfo=timezone.utc) if valor.tzinfo is None else valor
+
+class ReglaService:
+
+    @staticmethod
+    async def limite_velocidad(db: AsyncSession, dispositivo_id: int) -> Optional[float]:
+        """Velocidad máxima del vehículo del dispositivo, cacheada REGLAS_CONFIG_TTL segundos"""
+        ahora = time.monotonic()
+        entrada = _config_vehiculos.get(dispositivo_id)
+        if entrada is not None and entrada[0] > ahora:
+            return entrada[1]
+
+        result = await db.execute(
+            select(Vehiculo.velocidad_maxima_permitida).where(
+                Vehiculo.dispositivo_id == dispositivo_id,
+                Vehiculo.activo == True
+            ).limit(1)
+        )
+        limite = result.scalar_one_or_none()
+        _config_vehiculos[dispositivo_id] = (ahora + settings.REGLAS_CONFIG_TTL, limite)
+        return limite
+
+    @staticmethod
+    def invalidar_config(dispositivo_id: Optional[int] = None) -> None:
+        if dispositivo_id is None:
+            _config_vehiculos.clear()
+        else:
+            _config_vehiculos.pop(dispositivo_id, None)
+
+    @staticmethod
+    async def evaluar_fix(db: AsyncSession, dispositivo_id: int, lat: float, lng: float, velocidad: float, marca_tiempo: datetime) -> List[Evento]:
+        """Evaluar las reglas sobre un fix recibido y agregar los eventos a la sesión"""
+        marca_tiempo = _utc(marca_tiempo)
+        limite = await ReglaService.limite_velocidad(db, dispositivo_id)
+        planificador_senal.programar(
+            dispositivo_id, time.time() + settings.REGLAS_SIN_REPORTE_MIN * 60
+        )
+
+        eventos = [
+            Evento(
+                dispositivo_id=dispositivo_id,
+                tipo=tipo,
+                latitud=lat,
+                longitud=lng,
+                detalle={k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in detalle.items()} or None,
+                timestamp=marca_tiempo,
+            )
+            for tipo, detalle in motor_reglas.evaluar(dispositivo_id, velocidad, marca_tiempo, limite)
+        ]
+        if eventos:
+            db.add_all(eventos)
+        return eventos
+
+    @staticmethod
+    async def cargar_vencimientos(db: AsyncSession) -> None:
+        """Programar el vencimiento de cada dispositivo activo a partir de su last_seen.
+
+        Los ya vencidos al arrancar no se programan: cada reinicio (y cada
+        worker) volvería a avisar por equipos que dejaron de reportar hace rato.
+        """
+        plazo = settings.REGLAS_SIN_REPORTE_MIN * 60
+        ahora = time.time()
+        result = await db.execute(
+            select(Dispositivo.id, Dispositivo.last_seen).where(
+                Dispositivo.activo == True,
+                Dispositivo.last_seen.isnot(None)
+            )
+        )
+        for dispositivo_id, last_seen in result:
+            vence = _utc(last_seen).timestamp() + plazo
+            if vence > ahora:
+                planificador_senal.programar(dispositivo_id, vence)
+        logger.info(f"Vencimientos de reporte cargados: {len(planificador_senal)} dispositivos")
+
+    @staticmethod
+    async def revisar_sin_senal() -> int:
+        """Emitir sin_senal para los vencidos; confirma contra la base por si reportaron a otro worker.
+
+        El evento lleva como marca last_seen + plazo, la misma en todos los
+        workers: el índice único parcial uq_eventos_sin_senal deja insertar
+        uno solo por corte de reporte.
+        """
+        vencidos = planificador_senal.vencidos(time.time())
+        if not vencidos:
+            return 0
+
+        plazo = settings.REGLAS_SIN_REPORTE_MIN * 60
+        async with AsyncSessionLocal() as db:
+            try:
+                result = await db.execute(
+                    select(Dispositivo.id, Dispositivo.last_seen).where(Dispositivo.id.in_(vencidos))
+                )
+                filas = []
+                for dispositivo_id, last_seen in result:
+                    if last_seen is None:
+                        continue
+                    vence = _utc(last_seen).timestamp() + plazo
+                    if vence > time.time():
+                        planificador_senal.programar(dispositivo_id, vence)
+                        continue
+                    motor_reglas.marcar_sin_senal(dispositivo_id)
+                    filas.append({
+                        "dispositivo_id": dispositivo_id,
+                        "tipo": SIN_SENAL,
+                        "detalle": {"ultimo_reporte": _utc(last_seen).isoformat()},
+                        "timestamp": datetime.fromtimestamp(vence, timezone.utc),
+                    })
+                if not filas:
+                    return 0
+
+                stmt = insert(Evento).values(filas).on_conflict_do_nothing(
+                    index_elements=[Evento.dispositivo_id, Evento.timestamp],
+                    index_where=Evento.tipo == SIN_SENAL
+                ).returning(Evento.id)
+                emitidos = len((await db.execute(stmt)).all())
+                await db.commit()
+                if emitidos:
+                    logger.warning(f"📵 {emitidos} dispositivo(s) sin reportar hace más de {settings.REGLAS_SIN_REPORTE_MIN} min")
+                return emitidos
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Error revisando dispositivos sin señal: {e}")
+                return 0
+
+    @staticmethod
+    async def ejecutar_planificador() -> None:
+        """Tarea de fondo: duerme hasta el próximo vencimiento (máximo REGLAS_REVISION_SEG)"""
+        async with AsyncSessionLocal() as db:
+            await ReglaService.cargar_vencimientos(db)
+
+        while True:
+            proximo = planificador_senal.proximo()
+            espera = settings.REGLAS_REVISION_SEG
+            if proximo is not None:
+                espera = min(espera, max(0.0, proximo - time.time()))
+            await asyncio.sleep(espera)
+            try:
+                await ReglaService.revisar_sin_senal()
+            except Exception as e:
+                logger.error(f"Error en planificador de señal: {e}")
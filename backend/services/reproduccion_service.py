@@ -0,0 +1,122 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.ubicacion import Ubicacion
+from models.vehiculo import Vehiculo
+from core.config import settings
+from core.database import sesion_lectura
+from core.diferido import importar_diferido
+from core.reproduccion import AlmacenReproducciones, Pista, Reproduccion, codificar_id, decodificar_id
+from schemas.reproduccion_schema import ReproduccionCreate
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+np = importar_diferido("numpy")
+
+almacen_reproducciones = AlmacenReproducciones(
+    settings.REPRODUCCION_MAX_SESIONES, settings.REPRODUCCION_TTL_SEG
+)
+
+class ReproduccionService:
+
+    @staticmethod
+    async def preparar(db: AsyncSession, vehiculos_ids: List[int], fecha_inicio: datetime, fecha_fin: datetime, intervalo_seg: float) -> Optional[Tuple[Reproduccion, Dict[int, str]]]:
+        """Cargar con una sola consulta el historial de todos los vehículos y armar la reproducción"""
+        inicio = fecha_inicio.timestamp()
+        fin = fecha_fin.timestamp()
+        if fin <= inicio:
+            raise ValueError("fecha_fin debe ser posterior a fecha_inicio")
+        if fin - inicio > settings.REPRODUCCION_MAX_DIAS * 86400:
+            raise ValueError(f"El rango supera {settings.REPRODUCCION_MAX_DIAS} días")
+        if math.floor((fin - inicio) / intervalo_seg) + 1 > settings.REPRODUCCION_MAX_FRAMES:
+            raise ValueError(
+                f"La reproducción supera {settings.REPRODUCCION_MAX_FRAMES} frames; aumentar intervalo_seg"
+            )
+
+        result = await db.execute(
+            select(Vehiculo.dispositivo_id, Vehiculo.patente).where(Vehiculo.id.in_(vehiculos_ids))
+        )
+        patentes = {dispositivo_id: patente for dispositivo_id, patente in result}
+        if not patentes:
+            return None
+
+        stmt = select(
+            Ubicacion.dispositivo_id,
+            Ubicacion.timestamp,
+            Ubicacion.latitud,
+            Ubicacion.longitud,
+            Ubicacion.velocidad,
+            Ubicacion.rumbo,
+        ).where(
+            Ubicacion.dispositivo_id.in_(list(patentes)),
+            Ubicacion.timestamp >= fecha_inicio,
+            Ubicacion.timestamp <= fecha_fin,
+        ).order_by(Ubicacion.dispositivo_id, Ubicacion.timestamp)
+
+        # Tope de puntos leídos: el id viene del cliente y cualquier GET de frames puede rearmarla
+        limite = settings.REPRODUCCION_MAX_PUNTOS_LECTURA
+        filas = (await db.execute(stmt.limit(limite + 1))).all()
+        if len(filas) > limite:
+            raise ValueError(f"El rango supera {limite} puntos; reducir vehículos o fechas")
+        if not filas:
+            return None
+
+        dispositivos, marcas, lats, lngs, vels, rumbos = zip(*filas)
+        dispositivos = np.asarray(dispositivos)
+        ts = np.fromiter((m.timestamp() for m in marcas), dtype=np.float64, count=len(marcas))
+        lat = np.asarray(lats, dtype=np.float64)
+        lng = np.asarray(lngs, dtype=np.float64)
+        vel = np.asarray([v or 0.0 for v in vels], dtype=np.float64)
+        rumbo = np.asarray([r or 0.0 for r in rumbos], dtype=np.float64)
+
+        # Cortes donde cambia el dispositivo: una sola pasada sobre el resultado ordenado
+        cortes = np.flatnonzero(np.diff(dispositivos)) + 1
+        limites = np.concatenate(([0], cortes, [len(dispositivos)]))
+        pistas = {
+            int(dispositivos[a]): Pista(ts[a:b], lat[a:b], lng[a:b], vel[a:b], rumbo[a:b])
+            for a, b in zip(limites[:-1], limites[1:])
+        }
+
+        reproduccion = Reproduccion(
+            codificar_id(vehiculos_ids, inicio, fin, intervalo_seg),
+            pistas, inicio, fin, intervalo_seg, settings.REPRODUCCION_FRAMES_POR_BLOQUE
+        )
+        almacen_reproducciones.guardar(reproduccion)
+        logger.info(
+            f"Reproducción {reproduccion.id}: {len(pistas)} dispositivos, "
+            f"{len(filas)} puntos, {reproduccion.total_frames} frames"
+        )
+        return reproduccion, patentes
+
+    @staticmethod
+    async def obtener(id: str) -> Optional[Reproduccion]:
+        """La reproducción guardada en este worker o, si no está (otro worker, vencida), rearmada desde el id"""
+        reproduccion = almacen_reproducciones.obtener(id)
+        if reproduccion is not None:
+            return reproduccion
+
+        parametros = decodificar_id(id)
+        if parametros is None:
+            return None
+        vehiculos, inicio, fin, intervalo = parametros
+        try:
+            # Mismas validaciones que al crearla: el id viene del cliente
+            datos = ReproduccionCreate(
+                vehiculos=vehiculos,
+                fecha_inicio=datetime.fromtimestamp(inicio, timezone.utc),
+                fecha_fin=datetime.fromtimestamp(fin, timezone.utc),
+                intervalo_seg=intervalo,
+            )
+            async with sesion_lectura() as db:
+                preparada = await ReproduccionService.preparar(
+                    db, datos.vehiculos, datos.fecha_inicio, datos.fecha_fin, datos.intervalo_seg
+                )
+        except ValueError:
+            return None
+        if preparada is None:
+            return None
+        logger.info(f"Reproducción de {len(datos.vehiculos)} vehículos rearmada desde su id en este worker")
+        return preparada[0]
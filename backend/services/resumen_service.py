@@ -0,0 +1,326 @@
+from sqlalchemy import select, delete, func, and_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.ubicacion import Ubicacion
+from models.dispositivo import Dispositivo
+from models.vehiculo import Vehiculo
+from models.resumen import ResumenHorario, ResumenDiario
+from core.config import settings
+from core.database import AsyncSessionLocal
+from core.resumenes import Acumulado, CalculadorResumenes, inicio_dia, inicio_hora
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+calculador_resumenes = CalculadorResumenes(
+    settings.REGLAS_UMBRAL_DETENIDO_KMH,
+    settings.RESUMENES_MAX_HUECO_SEG,
+    settings.RESUMENES_ZONA_HORARIA,
+)
+
+COLUMNAS_PUNTO = (
+    Ubicacion.dispositivo_id,
+    Ubicacion.latitud,
+    Ubicacion.longitud,
+    Ubicacion.timestamp,
+    Ubicacion.velocidad,
+)
+
+def _punto(ubicacion: Ubicacion):
+    return (ubicacion.latitud, ubicacion.longitud, ubicacion.timestamp, ubicacion.velocidad)
+
+class ResumenService:
+
+    @staticmethod
+    async def _sumar(db: AsyncSession, modelo, fila: Dict) -> None:
+        """Upsert que suma el aporte de un fix a la fila del período"""
+        tabla = modelo.__table__
+        stmt = insert(tabla).values(**fila)
+        excluded = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[tabla.c.dispositivo_id, tabla.c.periodo],
+            set_={
+                "distancia_km": tabla.c.distancia_km + excluded.distancia_km,
+                "velocidad_maxima": func.greatest(tabla.c.velocidad_maxima, excluded.velocidad_maxima),
+                "segundos_movimiento": tabla.c.segundos_movimiento + excluded.segundos_movimiento,
+                "puntos": tabla.c.puntos + excluded.puntos,
+                "primer_fix": func.least(tabla.c.primer_fix, excluded.primer_fix),
+                "ultimo_fix": func.greatest(tabla.c.ultimo_fix, excluded.ultimo_fix),
+            },
+        )
+        await db.execute(stmt)
+
+    @staticmethod
+    async def _reemplazar(db: AsyncSession, modelo, fila: Dict) -> None:
+        tabla = modelo.__table__
+        stmt = insert(tabla).values(**fila)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[tabla.c.dispositivo_id, tabla.c.periodo],
+            set_={k: stmt.excluded[k] for k in fila if k not in ("dispositivo_id", "periodo")},
+        )
+        await db.execute(stmt)
+
+    @staticmethod
+    async def registrar_fix(db: AsyncSession, anterior: Optional[Ubicacion], ubicacion: Ubicacion) -> None:
+        """Sumar a la hora y al día del fix el delta contra el fix anterior (ingesta en orden)"""
+        aporte = calculador_resumenes.aporte(_punto(anterior) if anterior else None, _punto(ubicacion))
+        await ResumenService._sumar(
+            db, ResumenHorario, aporte.como_fila(ubicacion.dispositivo_id, inicio_hora(ubicacion.timestamp))
+        )
+        await ResumenService._sumar(
+            db, ResumenDiario,
+            aporte.como_fila(ubicacion.dispositivo_id, inicio_dia(ubicacion.timestamp, calculador_resumenes.zona))
+        )
+
+    @staticmethod
+    async def corregir(db: AsyncSession, dispositivo_id: int, marca_tiempo: datetime) -> None:
+        """Recalcular los períodos que toca un fix atrasado ya guardado.
+
+        El fix cambia el tramo que llega a él y el que sale de él hacia el
+        siguiente fix, así que se recalculan su hora y la del siguiente, y los
+        días que las contienen.
+        """
+        await ResumenService.corregir_lote(db, dispositivo_id, [marca_tiempo])
+
+    @staticmethod
+    async def corregir_lote(db: AsyncSession, dispositivo_id: int, marcas: Iterable[datetime]) -> None:
+        """corregir para varios fixes atrasados de un dispositivo, recalculando cada período una vez.
+
+        Solo el último fix de cada hora puede tener su siguiente en otra hora,
+        así que alcanza una consulta de "siguiente" por hora tocada.
+        """
+        ultimo_por_hora: Dict[datetime, datetime] = {}
+        for marca_tiempo in marcas:
+            hora = inicio_hora(marca_tiempo)
+            if hora not in ultimo_por_hora or marca_tiempo > ultimo_por_hora[hora]:
+                ultimo_por_hora[hora] = marca_tiempo
+
+        horas = set(ultimo_por_hora)
+        for ultimo in ultimo_por_hora.values():
+            siguiente = (await db.execute(
+                select(func.min(Ubicacion.timestamp)).where(
+                    Ubicacion.dispositivo_id == dispositivo_id,
+                    Ubicacion.timestamp > ultimo
+                )
+            )).scalar()
+            if siguiente is not None:
+                horas.add(inicio_hora(siguiente))
+
+        for hora in sorted(horas):
+            await ResumenService._recalcular_hora(db, dispositivo_id, hora)
+        for dia in {inicio_dia(hora, calculador_resumenes.zona) for hora in horas}:
+            await ResumenService._recalcular_dia(db, dispositivo_id, dia)
+        logger.info(f"Resúmenes corregidos por fixes atrasados: dispositivo {dispositivo_id}, {len(horas)} hora(s)")
+
+    @staticmethod
+    async def _recalcular_hora(db: AsyncSession, dispositivo_id: int, hora: datetime) -> None:
+        fin = hora + timedelta(hours=1)
+        previo = (await db.execute(
+            select(*COLUMNAS_PUNTO[1:]).where(
+                Ubicacion.dispositivo_id == dispositivo_id,
+                Ubicacion.timestamp < hora
+            ).order_by(Ubicacion.timestamp.desc()).limit(1)
+        )).first()
+        puntos = await db.execute(
+            select(*COLUMNAS_PUNTO).where(
+                Ubicacion.dispositivo_id == dispositivo_id,
+                Ubicacion.timestamp >= hora,
+                Ubicacion.timestamp < fin
+            ).order_by(Ubicacion.timestamp)
+        )
+        horarios = calculador_resumenes.acumular(
+            puntos, {dispositivo_id: tuple(previo)} if previo else None
+        )
+
+        acumulado = horarios.get((dispositivo_id, hora))
+        if acumulado is None:
+            await db.execute(delete(ResumenHorario).where(
+                ResumenHorario.dispositivo_id == dispositivo_id, ResumenHorario.periodo == hora
+            ))
+        else:
+            await ResumenService._reemplazar(db, ResumenHorario, acumulado.como_fila(dispositivo_id, hora))
+
+    @staticmethod
+    async def _recalcular_dia(db: AsyncSession, dispositivo_id: int, dia: datetime) -> None:
+        """El diario es la suma de sus horas, sin volver a leer ubicaciones"""
+        result = await db.execute(
+            select(
+                func.sum(ResumenHorario.distancia_km),
+                func.max(ResumenHorario.velocidad_maxima),
+                func.sum(ResumenHorario.segundos_movimiento),
+                func.sum(ResumenHorario.puntos),
+                func.min(ResumenHorario.primer_fix),
+                func.max(ResumenHorario.ultimo_fix),
+            ).where(
+                ResumenHorario.dispositivo_id == dispositivo_id,
+                ResumenHorario.periodo >= dia,
+                ResumenHorario.periodo < inicio_dia(dia, calculador_resumenes.zona, dias=1)
+            )
+        )
+        distancia, velocidad, segundos, puntos, primer, ultimo = result.one()
+        if not puntos:
+            await db.execute(delete(ResumenDiario).where(
+                ResumenDiario.dispositivo_id == dispositivo_id, ResumenDiario.periodo == dia
+            ))
+            return
+
+        acumulado = Acumulado()
+        acumulado.distancia_km = distancia
+        acumulado.velocidad_maxima = velocidad
+        acumulado.segundos_movimiento = segundos
+        acumulado.puntos = puntos
+        acumulado.primer_fix = primer
+        acumulado.ultimo_fix = ultimo
+        await ResumenService._reemplazar(db, ResumenDiario, acumulado.como_fila(dispositivo_id, dia))
+
+    @staticmethod
+    async def reconstruir(fecha_inicio: datetime, fecha_fin: datetime, dispositivos: Optional[List[int]] = None) -> Dict[str, int]:
+        """Backfill: recalcular los resúmenes del rango en lotes de dispositivos en paralelo.
+
+        El rango se amplía a días locales completos. Cada lote usa su propia
+        sesión y transacción, así un lote fallido no deshace los demás.
+        """
+        inicio, fin = calculador_resumenes.rango_dias(fecha_inicio, fecha_fin)
+
+        if not dispositivos:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(select(Dispositivo.id).order_by(Dispositivo.id))
+                dispositivos = list(result.scalars())
+
+        tamano = settings.RESUMENES_BACKFILL_LOTE
+        lotes = [dispositivos[i:i + tamano] for i in range(0, len(dispositivos), tamano)]
+        semaforo = asyncio.Semaphore(settings.RESUMENES_BACKFILL_PARALELO)
+
+        async def procesar(lote: List[int]) -> Dict[str, int]:
+            async with semaforo:
+                return await ResumenService._reconstruir_lote(lote, inicio, fin)
+
+        resultados = await asyncio.gather(*(procesar(lote) for lote in lotes), return_exceptions=True)
+
+        totales = {"dispositivos": len(dispositivos), "lotes": len(lotes), "lotes_fallidos": 0,
+                   "puntos": 0, "horas": 0, "dias": 0}
+        for resultado in resultados:
+            if isinstance(resultado, Exception):
+                totales["lotes_fallidos"] += 1
+                continue
+            for clave, valor in resultado.items():
+                totales[clave] += valor
+        logger.info(f"Backfill de resúmenes {inicio:%Y-%m-%d} a {fin:%Y-%m-%d}: {totales}")
+        return totales
+
+    @staticmethod
+    async def _reconstruir_lote(dispositivos: List[int], inicio: datetime, fin: datetime) -> Dict[str, int]:
+        async with AsyncSessionLocal() as db:
+            try:
+                # Último fix anterior al rango de cada dispositivo, para el primer tramo
+                previo = select(
+                    Ubicacion.dispositivo_id, func.max(Ubicacion.timestamp).label("marca_tiempo")
+                ).where(
+                    Ubicacion.dispositivo_id.in_(dispositivos),
+                    Ubicacion.timestamp < inicio
+                ).group_by(Ubicacion.dispositivo_id).subquery()
+                result = await db.execute(
+                    select(*COLUMNAS_PUNTO).join(previo, and_(
+                        Ubicacion.dispositivo_id == previo.c.dispositivo_id,
+                        Ubicacion.timestamp == previo.c.marca_tiempo
+                    ))
+                )
+                previos = {fila[0]: tuple(fila[1:]) for fila in result}
+
+                filas = (await db.execute(
+                    select(*COLUMNAS_PUNTO).where(
+                        Ubicacion.dispositivo_id.in_(dispositivos),
+                        Ubicacion.timestamp >= inicio,
+                        Ubicacion.timestamp < fin
+                    ).order_by(Ubicacion.dispositivo_id, Ubicacion.timestamp)
+                )).all()
+                horarios = calculador_resumenes.acumular(filas, previos)
+                diarios = calculador_resumenes.diarios(horarios)
+
+                for modelo in (ResumenHorario, ResumenDiario):
+                    await db.execute(delete(modelo).where(
+                        modelo.dispositivo_id.in_(dispositivos),
+                        modelo.periodo >= inicio,
+                        modelo.periodo < fin
+                    ))
+                if horarios:
+                    await db.execute(insert(ResumenHorario.__table__), [
+                        acumulado.como_fila(dispositivo_id, hora) for (dispositivo_id, hora), acumulado in horarios.items()
+                    ])
+                if diarios:
+                    await db.execute(insert(ResumenDiario.__table__), [
+                        acumulado.como_fila(dispositivo_id, dia) for (dispositivo_id, dia), acumulado in diarios.items()
+                    ])
+                await db.commit()
+                return {"puntos": len(filas), "horas": len(horarios), "dias": len(diarios)}
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Error reconstruyendo resúmenes de {len(dispositivos)} dispositivos: {e}")
+                raise
+
+    @staticmethod
+    async def obtener_reporte(db: AsyncSession, granularidad: str, fecha_inicio: datetime, fecha_fin: datetime, vehiculo_id: Optional[int] = None) -> List[Dict]:
+        """Filas por vehículo y período leídas solo de los resúmenes"""
+        modelo = ResumenHorario if granularidad == "hora" else ResumenDiario
+        stmt = select(
+            Vehiculo.id, Vehiculo.patente, modelo.dispositivo_id, modelo.periodo,
+            modelo.distancia_km, modelo.velocidad_maxima, modelo.segundos_movimiento,
+            modelo.puntos, modelo.primer_fix, modelo.ultimo_fix,
+        ).join(Vehiculo, Vehiculo.dispositivo_id == modelo.dispositivo_id).where(
+            modelo.periodo >= fecha_inicio,
+            modelo.periodo < fecha_fin
+        )
+        if vehiculo_id is not None:
+            stmt = stmt.where(Vehiculo.id == vehiculo_id)
+
+        result = await db.execute(stmt.order_by(Vehiculo.patente, modelo.periodo))
+        return [
+            {
+                "vehiculo_id": vid,
+                "vehiculo_patente": patente,
+                "dispositivo_id": dispositivo_id,
+                "periodo": periodo,
+                "distancia_km": round(distancia, 2),
+                "velocidad_maxima": velocidad,
+                "horas_movimiento": round(segundos / 3600, 2),
+                "puntos": puntos,
+                "primer_fix": primer,
+                "ultimo_fix": ultimo,
+            }
+            for vid, patente, dispositivo_id, periodo, distancia, velocidad, segundos, puntos, primer, ultimo in result
+        ]
+
+    @staticmethod
+    async def obtener_totales(db: AsyncSession, fecha_inicio: datetime, fecha_fin: datetime) -> List[Dict]:
+        """Totales de la flota por vehículo en el rango, sumando los resúmenes diarios"""
+        inicio, fin = calculador_resumenes.rango_dias(fecha_inicio, fecha_fin)
+        result = await db.execute(
+            select(
+                Vehiculo.id, Vehiculo.patente, ResumenDiario.dispositivo_id,
+                func.sum(ResumenDiario.distancia_km),
+                func.max(ResumenDiario.velocidad_maxima),
+                func.sum(ResumenDiario.segundos_movimiento),
+                func.sum(ResumenDiario.puntos),
+                func.count(),
+            ).join(Vehiculo, Vehiculo.dispositivo_id == ResumenDiario.dispositivo_id).where(
+                ResumenDiario.periodo >= inicio,
+                ResumenDiario.periodo < fin
+            ).group_by(Vehiculo.id, Vehiculo.patente, ResumenDiario.dispositivo_id)
+            .order_by(func.sum(ResumenDiario.distancia_km).desc())
+        )
+        return [
+            {
+                "vehiculo_id": vid,
+                "vehiculo_patente": patente,
+                "dispositivo_id": dispositivo_id,
+                "distancia_km": round(distancia or 0.0, 2),
+                "velocidad_maxima": velocidad,
+                "horas_movimiento": round((segundos or 0.0) / 3600, 2),
+                "puntos": puntos,
+                "dias_activos": dias,
+            }
+            for vid, patente, dispositivo_id, distancia, velocidad, segundos, puntos, dias in result
+        ]
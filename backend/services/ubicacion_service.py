@@ -1,33 +1,100 @@
-from sqlalchemy import select, and_, desc, func
+from sqlalchemy import select, desc, func, Row
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
+from sqlalchemy.dialects.postgresql import insert
 from models.ubicacion import Ubicacion
 from models.dispositivo import Dispositivo
 from models.vehiculo import Vehiculo
-from schemas.ubicacion_schema import UbicacionCreate, UbicacionResponse, UbicacionTracker, RutaResponse
-from datetime import datetime, timedelta, timezone
-from typing import List, Optional, Dict
+from schemas.ubicacion_schema import UbicacionCreate, UbicacionTracker, RutaResponse
+from core.config import settings
+from core.serializacion import compilar_mapeo
+from core.realtime import relay_posiciones
+from core.cache import cache_polling, cache_dias
+from core.resumenes import dia_cerrado, dia_local
+from core.reorden import VentanaReorden
+from services.ultima_posicion_service import UltimaPosicionService
+from services.geocerca_service import GeocercaService
+from services.regla_service import ReglaService
+from services.resumen_service import ResumenService
+from services.geometria_service import GeometriaService
+from services.filtro_service import FiltroService, filtro_gps
+from core.filtro_gps import RECHAZADO
+from datetime import datetime, timezone
+from typing import Any, List, Optional, Dict, Set, Tuple
+from itertools import groupby
+from zoneinfo import ZoneInfo
 import logging
 import math
 
 logger = logging.getLogger(__name__)
 
+ZONA = ZoneInfo(settings.RESUMENES_ZONA_HORARIA)
+
+# Columnas de UbicacionResponse, seleccionadas como tuplas sin hidratar el ORM
+COLUMNAS_UBICACION = (
+    Ubicacion.id,
+    Ubicacion.dispositivo_id,
+    Ubicacion.latitud,
+    Ubicacion.longitud,
+    Ubicacion.velocidad,
+    Ubicacion.rumbo.label("rumbo"),
+    Ubicacion.altitud,
+    Ubicacion.precision,
+    Ubicacion.timestamp.label("timestamp"),
+)
+CAMPOS_UBICACION = (
+    "id", "dispositivo_id", "latitud", "longitud", "velocidad",
+    "rumbo", "altitud", "precision", "timestamp",
+)
+
+mapear_ubicacion = compilar_mapeo(CAMPOS_UBICACION)
+
+# Resultado de la ingesta de un fix
+CREADO = "creado"
+ATRASADO = "atrasado"
+DUPLICADO = "duplicado"
+OMITIDO = "omitido"
+DESCARTADO = "descartado"
+
+# Ordena los fixes concurrentes de cada dispositivo antes de procesarlos
+ventana_reorden = VentanaReorden(settings.REORDEN_ESPERA_SEG)
+
+def _utc(valor: datetime) -> datetime:
+    """Los equipos GT06 reportan en UTC sin zona: se fija para que la clave natural sea estable"""
+    return valor.replace(tzinfo=timezone.utc) if valor.tzinfo is None else valor
+
 class UbicacionService:
     
+    @staticmethod
+    async def insertar_ubicacion(db: AsyncSession, data: Dict[str, Any]) -> Optional[Ubicacion]:
+        """INSERT ... ON CONFLICT DO NOTHING sobre la clave natural; None si el fix ya existía"""
+        stmt = insert(Ubicacion).values(**data).on_conflict_do_nothing(
+            index_elements=[Ubicacion.dispositivo_id, Ubicacion.timestamp]
+        ).returning(Ubicacion)
+        return (await db.execute(stmt)).scalar_one_or_none()
+    
+    @staticmethod
+    async def buscar_por_clave(db: AsyncSession, dispositivo_id: int, marca_tiempo: datetime) -> Optional[Ubicacion]:
+        result = await db.execute(
+            select(Ubicacion).where(
+                Ubicacion.dispositivo_id == dispositivo_id,
+                Ubicacion.timestamp == marca_tiempo
+            )
+        )
+        return result.scalar_one_or_none()
+    
     @staticmethod
     async def crear_ubicacion(db: AsyncSession, ubicacion_data: UbicacionCreate) -> Ubicacion:
-        """Crear una nueva ubicación"""
+        """Crear una nueva ubicación; si ya existe (mismo dispositivo y marca de tiempo) devuelve la existente"""
         try:
             data = ubicacion_data.model_dump()
+            data["timestamp"] = _utc(data.get("timestamp") or datetime.now(timezone.utc))
 
-            if not data.get("timestamp"):
-                data["timestamp"] = datetime.now(timezone.utc)
-
-            nueva_ubicacion = Ubicacion(**data)
-
-            db.add(nueva_ubicacion)
+            nueva_ubicacion = await UbicacionService.insertar_ubicacion(db, data)
             await db.commit()
-            await db.refresh(nueva_ubicacion)
+            if nueva_ubicacion is None:
+                logger.info(f"Ubicación duplicada ignorada para dispositivo: {data['dispositivo_id']}")
+                return await UbicacionService.buscar_por_clave(db, data["dispositivo_id"], data["timestamp"])
             logger.info(f"Ubicación creada para dispositivo: {nueva_ubicacion.dispositivo_id}")
             return nueva_ubicacion
         except Exception as e:
@@ -36,60 +103,30 @@ class UbicacionService:
             raise
     
     @staticmethod
-    async def procesar_datos_tracker(db: AsyncSession, datos_tracker: UbicacionTracker) -> Ubicacion:
-        """Procesar datos del tracker y crear ubicación"""
+    async def procesar_datos_tracker(db: AsyncSession, datos_tracker: UbicacionTracker) -> Tuple[Ubicacion, str]:
+        """Procesar datos del tracker y crear ubicación.
+
+        Devuelve la ubicación y el resultado: CREADO, ATRASADO (guardado por el
+        camino de datos atrasados), DUPLICADO (el fix ya estaba guardado, p. ej.
+        por un reintento), OMITIDO (vehículo detenido, no se guarda) o
+        DESCARTADO (salto imposible según el filtro GPS).
+        """
         try:
-            stmt = select(Dispositivo).where(Dispositivo.imei == datos_tracker.device_id)
-            result = await db.execute(stmt)
-            dispositivo = result.scalar_one_or_none()
-            
-            if not dispositivo:
-                logger.warning(f"⚠️ IMEI desconocido intentando reportar: {datos_tracker.device_id}")
-                raise ValueError(f"Dispositivo {datos_tracker.device_id} no encontrado")
-            
-            dispositivo.last_seen = datos_tracker.timestamp or datetime.now(timezone.utc)
-            
-            stmt_last = select(Ubicacion).where(
-                Ubicacion.dispositivo_id == dispositivo.id
-            ).order_by(desc(Ubicacion.timestamp)).limit(1)
-            
-            last_location = (await db.execute(stmt_last)).scalar_one_or_none()
-            
-            guardar_nuevo = True
-            
-            if last_location:
-                distancia_km = UbicacionService._calcular_distancia_puntos(
-                    last_location.latitud, last_location.longitud,
-                    datos_tracker.lat, datos_tracker.lng
-                )
-                tiempo_diff_seg = (datos_tracker.timestamp - last_location.timestamp).total_seconds()
-                
-                if distancia_km < 0.03 and tiempo_diff_seg < 300:
-                    
-                    if datos_tracker.speed == 0 and last_location.velocidad > 0:
-                        guardar_nuevo = True
-                        logger.info(f"🛑 Vehículo {dispositivo.imei} se detuvo. Guardando evento.")
-                    else:
-                        guardar_nuevo = False
+            marca_tiempo = _utc(datos_tracker.timestamp or datetime.now(timezone.utc))
+            if ventana_reorden.ocupado(datos_tracker.device_id):
+                # Va a esperar turno: la conexión vuelve al pool en vez de quedar ociosa en transacción
+                await db.commit()
 
-            if guardar_nuevo:
-                ubicacion_data = UbicacionCreate(
-                    dispositivo_id=dispositivo.id,
-                    latitud=datos_tracker.lat,
-                    longitud=datos_tracker.lng,
-                    velocidad=datos_tracker.speed or 0.0,
-                    rumbo=datos_tracker.course,
-                    altitud=datos_tracker.altitude,
-                    precision=datos_tracker.accuracy,
-                    timestamp=datos_tracker.timestamp
-                )
-                nueva_ubicacion = await UbicacionService.crear_ubicacion(db, ubicacion_data)
+            async with ventana_reorden.turno(datos_tracker.device_id, marca_tiempo):
+                stmt = select(Dispositivo).where(Dispositivo.imei == datos_tracker.device_id)
+                result = await db.execute(stmt)
+                dispositivo = result.scalar_one_or_none()
                 
-                await db.commit() 
-                return nueva_ubicacion
-            else:
-                await db.commit()
-                return last_location
+                if not dispositivo:
+                    logger.warning(f"⚠️ IMEI desconocido intentando reportar: {datos_tracker.device_id}")
+                    raise ValueError(f"Dispositivo {datos_tracker.device_id} no encontrado")
+                
+                return await UbicacionService._procesar_en_turno(db, dispositivo, datos_tracker, marca_tiempo)
 
         except Exception as e:
             logger.error(f"Error procesando datos del tracker: {e}")
@@ -97,22 +134,224 @@ class UbicacionService:
             raise
     
     @staticmethod
-    async def obtener_ubicacion_actual(db: AsyncSession, dispositivo_id: str) -> Optional[Ubicacion]:
-        """Obtener la ubicación más reciente de un dispositivo"""
+    async def _procesar_en_turno(db: AsyncSession, dispositivo: Dispositivo, datos_tracker: UbicacionTracker, marca_tiempo: datetime) -> Tuple[Ubicacion, str]:
+        stmt_last = select(Ubicacion).where(
+            Ubicacion.dispositivo_id == dispositivo.id
+        ).order_by(desc(Ubicacion.timestamp)).limit(1)
+        
+        last_location = (await db.execute(stmt_last)).scalar_one_or_none()
+        
+        ubicacion_data = UbicacionCreate(
+            dispositivo_id=dispositivo.id,
+            latitud=datos_tracker.lat,
+            longitud=datos_tracker.lng,
+            velocidad=datos_tracker.speed or 0.0,
+            rumbo=datos_tracker.course,
+            altitud=datos_tracker.altitude,
+            precision=datos_tracker.accuracy,
+            secuencia=datos_tracker.sequence,
+            timestamp=marca_tiempo
+        )
+        
+        # Más viejo que lo ya procesado: sin dedup contra el último, reglas ni difusión en vivo
+        if last_location is not None and marca_tiempo < _utc(last_location.timestamp):
+            dispositivo_id = dispositivo.id
+            nuevas, descartados = await UbicacionService.guardar_atrasados(db, dispositivo_id, [ubicacion_data.model_dump()])
+            await db.commit()
+            if descartados:
+                return last_location, DESCARTADO
+            if not nuevas:
+                return await UbicacionService.buscar_por_clave(db, dispositivo_id, marca_tiempo), DUPLICADO
+            return nuevas[0], ATRASADO
+        
+        # Reintento del último fix guardado: se responde sin pasar por el filtro ni las reglas,
+        # que ya avanzaron su estado con él
+        if last_location is not None and marca_tiempo == _utc(last_location.timestamp):
+            logger.info(f"♻️ Fix duplicado ignorado | {datos_tracker.device_id} {marca_tiempo.isoformat()}")
+            return last_location, DUPLICADO
+        
+        dispositivo.last_seen = marca_tiempo
+        
+        decision, lat, lng = filtro_gps.evaluar(
+            dispositivo.id, datos_tracker.lat, datos_tracker.lng, marca_tiempo, datos_tracker.speed,
+            (last_location.latitud, last_location.longitud, _utc(last_location.timestamp), last_location.velocidad)
+            if last_location else None
+        )
+        if decision == RECHAZADO:
+            # Salto imposible: el equipo reportó, pero el punto no se guarda ni dispara reglas
+            await db.commit()
+            UltimaPosicionService.marcar_visto(dispositivo.id, dispositivo.last_seen)
+            return last_location, DESCARTADO
+        ubicacion_data.latitud, ubicacion_data.longitud = lat, lng
+        
+        guardar_nuevo = True
+        
+        if last_location:
+            distancia_km = UbicacionService._calcular_distancia_puntos(
+                last_location.latitud, last_location.longitud,
+                lat, lng
+            )
+            tiempo_diff_seg = (marca_tiempo - _utc(last_location.timestamp)).total_seconds()
+            
+            if distancia_km < 0.03 and tiempo_diff_seg < 300:
+                
+                if datos_tracker.speed == 0 and last_location.velocidad > 0:
+                    guardar_nuevo = True
+                    logger.info(f"🛑 Vehículo {dispositivo.imei} se detuvo. Guardando evento.")
+                else:
+                    guardar_nuevo = False
+
+        if guardar_nuevo:
+            nueva_ubicacion = await UbicacionService.insertar_ubicacion(db, ubicacion_data.model_dump())
+            if nueva_ubicacion is None:
+                # Otro worker guardó el mismo fix: se descarta todo lo de este pedido
+                dispositivo_id = dispositivo.id
+                await db.rollback()
+                logger.info(f"♻️ Fix duplicado ignorado | {datos_tracker.device_id} {marca_tiempo.isoformat()}")
+                existente = await UbicacionService.buscar_por_clave(db, dispositivo_id, marca_tiempo)
+                return existente, DUPLICADO
+        
+        # Después del insert, para que un duplicado no avance el estado de las reglas
+        await ReglaService.evaluar_fix(
+            db, dispositivo.id, lat, lng,
+            datos_tracker.speed, dispositivo.last_seen
+        )
+        
+        if guardar_nuevo:
+            version = await UltimaPosicionService.actualizar(db, nueva_ubicacion)
+            await GeocercaService.evaluar_fix(db, nueva_ubicacion)
+            await ResumenService.registrar_fix(db, last_location, nueva_ubicacion)
+            
+            await db.commit() 
+            logger.info(f"Ubicación creada para dispositivo: {nueva_ubicacion.dispositivo_id}")
+            # Sin versión nueva la última posición guardada es más reciente: la grilla no se mueve
+            if version is not None:
+                UltimaPosicionService.actualizar_grilla(nueva_ubicacion, dispositivo.imei)
+            await UbicacionService._invalidar_cache(dispositivo.id, nueva_ubicacion.timestamp)
+            UbicacionService._publicar_en_vivo(nueva_ubicacion, dispositivo.imei)
+            return nueva_ubicacion, CREADO
+        else:
+            await db.commit()
+            UltimaPosicionService.marcar_visto(dispositivo.id, dispositivo.last_seen)
+            return last_location, OMITIDO
+    
+    @staticmethod
+    async def guardar_atrasados(db: AsyncSession, dispositivo_id: int, filas: List[Dict[str, Any]]) -> Tuple[List[Ubicacion], Set[datetime]]:
+        """Camino de datos atrasados: un INSERT multi-fila idempotente y una corrección de resúmenes.
+
+        Antes se descartan los saltos imposibles respecto de los puntos guardados
+        vecinos. No hace el commit (lo hace quien llama); devuelve las filas
+        nuevas y las marcas de tiempo descartadas.
+        """
+        descartados = await FiltroService.saltos_atrasados(db, dispositivo_id, filas)
+        filas = [f for f in filas if f["timestamp"] not in descartados]
+        if not filas:
+            return [], descartados
+        stmt = insert(Ubicacion).values(filas).on_conflict_do_nothing(
+            index_elements=[Ubicacion.dispositivo_id, Ubicacion.timestamp]
+        ).returning(Ubicacion)
+        nuevas = list((await db.execute(stmt)).scalars())
+        ventana_reorden.atrasados += len(nuevas)
+        if nuevas:
+            marcas = [_utc(u.timestamp) for u in nuevas]
+            await ResumenService.corregir_lote(db, dispositivo_id, marcas)
+            for dia in {dia_local(m, ZONA) for m in marcas}:
+                if dia_cerrado(dia, ZONA, settings.DIA_CERRADO_GRACIA_MIN):
+                    await cache_dias.invalidar(dispositivo_id, dia)
+            logger.info(f"⏪ {len(nuevas)} fix(es) atrasado(s) guardado(s) | dispositivo {dispositivo_id}")
+        return nuevas, descartados
+    
+    @staticmethod
+    async def procesar_lote_tracker(db: AsyncSession, lote: List[UbicacionTracker]) -> List[Dict[str, Any]]:
+        """Ingesta de un lote: se ordena por dispositivo y tiempo; los fixes más viejos que el
+        último guardado de su dispositivo van juntos por el camino de atrasados"""
+        ahora = datetime.now(timezone.utc)
+        marcas = [_utc(d.timestamp or ahora) for d in lote]
+        orden = sorted(range(len(lote)), key=lambda i: (lote[i].device_id, marcas[i]))
+        resultados: List[Optional[Dict[str, Any]]] = [None] * len(lote)
+
+        imeis = {d.device_id for d in lote}
+        dispositivos = dict((await db.execute(
+            select(Dispositivo.imei, Dispositivo.id).where(Dispositivo.imei.in_(imeis))
+        )).all())
+        ultimos = dict((await db.execute(
+            select(Ubicacion.dispositivo_id, func.max(Ubicacion.timestamp)).where(
+                Ubicacion.dispositivo_id.in_(list(dispositivos.values()))
+            ).group_by(Ubicacion.dispositivo_id)
+        )).all()) if dispositivos else {}
+
+        for imei, grupo in groupby(orden, key=lambda i: lote[i].device_id):
+            indices = list(grupo)
+            dispositivo_id = dispositivos.get(imei)
+            if dispositivo_id is None:
+                for i in indices:
+                    resultados[i] = {"indice": i, "resultado": "error", "detalle": f"Dispositivo {imei} no encontrado"}
+                continue
+
+            ultimo = ultimos.get(dispositivo_id)
+            atrasados = [i for i in indices if ultimo is not None and marcas[i] < _utc(ultimo)]
+            if atrasados:
+                filas = {}
+                for i in atrasados:
+                    d = lote[i]
+                    filas[marcas[i]] = UbicacionCreate(
+                        dispositivo_id=dispositivo_id, latitud=d.lat, longitud=d.lng,
+                        velocidad=d.speed or 0.0, rumbo=d.course, altitud=d.altitude,
+                        precision=d.accuracy, secuencia=d.sequence, timestamp=marcas[i]
+                    ).model_dump()
+                try:
+                    if ventana_reorden.ocupado(imei):
+                        await db.commit()
+                    async with ventana_reorden.turno(imei, marcas[atrasados[0]]):
+                        nuevas, descartados = await UbicacionService.guardar_atrasados(db, dispositivo_id, list(filas.values()))
+                        await db.commit()
+                    ids = {_utc(u.timestamp): u.id for u in nuevas}
+                    for i in atrasados:
+                        if marcas[i] in descartados:
+                            resultados[i] = {"indice": i, "resultado": DESCARTADO, "id": None}
+                            continue
+                        creado = marcas[i] in ids
+                        resultados[i] = {"indice": i, "resultado": ATRASADO if creado else DUPLICADO, "id": ids.get(marcas[i])}
+                        ids.pop(marcas[i], None)
+                except Exception as e:
+                    await db.rollback()
+                    logger.error(f"Error guardando fixes atrasados del dispositivo {dispositivo_id}: {e}")
+                    for i in atrasados:
+                        resultados[i] = {"indice": i, "resultado": "error", "detalle": str(e)}
+
+            for i in indices:
+                if resultados[i] is not None:
+                    continue
+                try:
+                    ubicacion, resultado = await UbicacionService.procesar_datos_tracker(db, lote[i])
+                    resultados[i] = {"indice": i, "resultado": resultado, "id": ubicacion.id if ubicacion else None}
+                except Exception as e:
+                    resultados[i] = {"indice": i, "resultado": "error", "detalle": str(e)}
+
+        return resultados
+    
+    @staticmethod
+    async def obtener_ubicacion_actual(db: AsyncSession, dispositivo_id: str) -> Optional[Row]:
+        """Obtener la ubicación más reciente de un dispositivo (fila de columnas)"""
         dispositivo_id_int = int(dispositivo_id)
 
-        stmt = select(Ubicacion).where(
+        stmt = select(*COLUMNAS_UBICACION).where(
             Ubicacion.dispositivo_id == dispositivo_id_int
         ).order_by(desc(Ubicacion.timestamp)).limit(1)
         result = await db.execute(stmt)
-        return result.scalar_one_or_none()
+        return result.first()
     
     @staticmethod
-    async def obtener_ubicaciones_por_dispositivo(db: AsyncSession, dispositivo_id: str, fecha_inicio: Optional[datetime] = None, fecha_fin: Optional[datetime] = None, limit: int = 1000) -> List[Ubicacion]:
-        """Obtener ubicaciones de un dispositivo en un rango de fechas"""
+    async def obtener_ultima_ubicacion(db: AsyncSession, dispositivo_id: str) -> Optional[Row]:
+        """Alias de obtener_ubicacion_actual usado por /ultima-ubicacion"""
+        return await UbicacionService.obtener_ubicacion_actual(db, dispositivo_id)
+    
+    @staticmethod
+    async def obtener_ubicaciones_por_dispositivo(db: AsyncSession, dispositivo_id: str, fecha_inicio: Optional[datetime] = None, fecha_fin: Optional[datetime] = None, limit: int = 1000) -> List[Row]:
+        """Obtener ubicaciones de un dispositivo en un rango de fechas (filas de columnas)"""
         dispositivo_id_int = int(dispositivo_id)
         
-        stmt = select(Ubicacion).where(Ubicacion.dispositivo_id == dispositivo_id_int)
+        stmt = select(*COLUMNAS_UBICACION).where(Ubicacion.dispositivo_id == dispositivo_id_int)
         
         if fecha_inicio:
             stmt = stmt.where(Ubicacion.timestamp >= fecha_inicio)
@@ -121,25 +360,39 @@ class UbicacionService:
         
         stmt = stmt.order_by(desc(Ubicacion.timestamp)).limit(limit)
         result = await db.execute(stmt)
-        return result.scalars().all()
+        return result.all()
+    
+    @staticmethod
+    async def huella_dia(db: AsyncSession, dispositivo_id: int, inicio: datetime, fin: datetime) -> tuple:
+        """(cantidad, id máximo) de los fixes del rango: cambia si llega un fix atrasado"""
+        result = await db.execute(
+            select(func.count(), func.max(Ubicacion.id)).where(
+                Ubicacion.dispositivo_id == dispositivo_id,
+                Ubicacion.timestamp >= inicio,
+                Ubicacion.timestamp < fin
+            )
+        )
+        return tuple(result.one())
+    
+    @staticmethod
+    async def dispositivo_de_vehiculo(db: AsyncSession, vehiculo_id: int) -> Optional[int]:
+        result = await db.execute(select(Vehiculo.dispositivo_id).where(Vehiculo.id == vehiculo_id))
+        return result.scalar_one_or_none()
     
     @staticmethod
     async def obtener_recorrido_vehiculo(db: AsyncSession, vehiculo_id: str, fecha_inicio: Optional[datetime] = None, fecha_fin: Optional[datetime] = None) -> Optional[RutaResponse]:
         """Obtener el recorrido completo de un vehículo"""
         try:
             vehiculo_stmt = select(Vehiculo).options(
-                selectinload(Vehiculo.dispositivos)
-            ).where(Vehiculo.id == vehiculo_id)
+                selectinload(Vehiculo.dispositivo)
+            ).where(Vehiculo.id == int(vehiculo_id))
             vehiculo_result = await db.execute(vehiculo_stmt)
             vehiculo = vehiculo_result.scalar_one_or_none()
             
-            if not vehiculo or not vehiculo.dispositivos:
-                return None
-            
-            dispositivos_ids = [d.id for d in vehiculo.dispositivos if d.activo]
-            if not dispositivos_ids:
+            if not vehiculo or not vehiculo.dispositivo or not vehiculo.dispositivo.activo:
                 return None
             
+            dispositivos_ids = [vehiculo.dispositivo.id]
             stmt = select(Ubicacion).where(Ubicacion.dispositivo_id.in_(dispositivos_ids))
             
             if fecha_inicio:
@@ -167,50 +420,109 @@ class UbicacionService:
             raise
     
     @staticmethod
-    async def obtener_ubicaciones_tiempo_real(db: AsyncSession, minutos_atras: int = 5) -> List[Dict]:
-        """Obtener ubicaciones recientes para monitoreo en tiempo real"""
-        try:
-            tiempo_limite = datetime.now(timezone.utc) - timedelta(minutes=minutos_atras)
-            
-            subquery = select(
-                Ubicacion.dispositivo_id,
-                func.max(Ubicacion.timestamp).label('max_timestamp')
+    async def obtener_recorridos_vehiculos(db: AsyncSession, vehiculos_ids: List[int], fecha_inicio: datetime, fecha_fin: datetime, tolerancia_m: Optional[float] = None) -> Dict[str, Any]:
+        """Recorridos de varios vehículos con una sola consulta ordenada por dispositivo y tiempo"""
+        result = await db.execute(
+            select(Vehiculo.id, Vehiculo.patente, Vehiculo.dispositivo_id).join(
+                Dispositivo, Dispositivo.id == Vehiculo.dispositivo_id
             ).where(
-                Ubicacion.timestamp >= tiempo_limite
-            ).group_by(Ubicacion.dispositivo_id).subquery()
-            
-            stmt = select(
-                Ubicacion,
-                Dispositivo.imei,
-                Vehiculo.patente
-            ).select_from(
-                Ubicacion.join(
-                    subquery,
-                    and_(
-                        Ubicacion.dispositivo_id == subquery.c.dispositivo_id,
-                        Ubicacion.timestamp == subquery.c.max_timestamp
+                Vehiculo.id.in_(vehiculos_ids),
+                Dispositivo.activo == True
+            )
+        )
+        vehiculos_por_dispositivo: Dict[int, List[tuple]] = {}
+        for vehiculo_id, patente, dispositivo_id in result:
+            vehiculos_por_dispositivo.setdefault(dispositivo_id, []).append((vehiculo_id, patente))
+
+        recorridos = []
+        total_puntos = 0
+        if vehiculos_por_dispositivo:
+            limite = settings.RECORRIDOS_MAX_PUNTOS_LECTURA
+            stmt = select(*COLUMNAS_UBICACION).where(
+                Ubicacion.dispositivo_id.in_(list(vehiculos_por_dispositivo)),
+                Ubicacion.timestamp >= fecha_inicio,
+                Ubicacion.timestamp <= fecha_fin
+            ).order_by(Ubicacion.dispositivo_id, Ubicacion.timestamp).limit(limite + 1)
+            filas = (await db.execute(stmt)).all()
+            if len(filas) > limite:
+                raise ValueError(
+                    f"El rango supera {limite} puntos; reducir vehículos o fechas"
+                )
+
+            # Una pasada: las filas vienen agrupadas por dispositivo
+            for dispositivo_id, grupo in groupby(filas, key=lambda f: f.dispositivo_id):
+                puntos = list(grupo)
+                distancia = UbicacionService._calcular_distancia_recorrido(puntos)
+                tiempo = UbicacionService._calcular_tiempo_recorrido(puntos)
+                devueltos = puntos
+                if tolerancia_m:
+                    indices = GeometriaService.simplificar(
+                        [(p.latitud, p.longitud) for p in puntos], tolerancia_m
                     )
-                ).join(Dispositivo).outerjoin(Vehiculo)
-            ).where(Dispositivo.activo == True)
-            
-            result = await db.execute(stmt)
-            ubicaciones_tiempo_real = []
-            
-            for ubicacion, imei, patente in result:
-                ubicacion_data = UbicacionResponse.model_validate(ubicacion).model_dump()
-                
-                ubicaciones_tiempo_real.append({
-                    "ubicacion": ubicacion_data, 
-                    "dispositivo_imei": imei,
-                    "vehiculo_patente": patente
-                })
-            
-            return ubicaciones_tiempo_real
-            
+                    devueltos = [puntos[i] for i in indices]
+                total_puntos += len(devueltos) * len(vehiculos_por_dispositivo[dispositivo_id])
+                if total_puntos > settings.RECORRIDOS_MAX_PUNTOS:
+                    raise ValueError(
+                        f"La respuesta supera {settings.RECORRIDOS_MAX_PUNTOS} puntos; "
+                        f"usar tolerancia_m o reducir el rango"
+                    )
+
+                ubicaciones = [mapear_ubicacion(p) for p in devueltos]
+                velocidad_maxima = max((p.velocidad or 0.0 for p in puntos), default=None)
+                for vehiculo_id, patente in vehiculos_por_dispositivo[dispositivo_id]:
+                    recorridos.append({
+                        "vehiculo_id": vehiculo_id,
+                        "vehiculo_patente": patente,
+                        "dispositivo_id": dispositivo_id,
+                        "ubicaciones": ubicaciones,
+                        "total_puntos": len(puntos),
+                        "puntos_devueltos": len(devueltos),
+                        "distancia_total": distancia,
+                        "tiempo_total": tiempo,
+                        "velocidad_maxima": velocidad_maxima,
+                        "velocidad_promedio": round(distancia / (tiempo / 60), 1) if distancia and tiempo else None,
+                    })
+
+        con_datos = {r["vehiculo_id"] for r in recorridos}
+        return {
+            "recorridos": recorridos,
+            "total_puntos": total_puntos,
+            "vehiculos_sin_datos": [v for v in vehiculos_ids if v not in con_datos],
+        }
+
+    @staticmethod
+    async def obtener_ubicaciones_tiempo_real(db: AsyncSession, minutos_atras: int = 5, desde: Optional[str] = None) -> Dict:
+        """Obtener ubicaciones recientes para monitoreo en tiempo real"""
+        try:
+            return await UltimaPosicionService.obtener_flota(db, minutos_atras, desde)
         except Exception as e:
             logger.error(f"Error obteniendo ubicaciones en tiempo real: {e}")
             raise
     
+    @staticmethod
+    async def _invalidar_cache(dispositivo_id: int, marca_tiempo: Optional[datetime] = None) -> None:
+        """Descartar las respuestas de polling que el nuevo fix deja viejas.
+
+        /tiempo-real no se invalida: con ingesta continua no llegaría a
+        acertar nunca, y su cursor trae en la próxima consulta lo que una
+        respuesta de hasta MICROCACHE_TTL segundos no tenga.
+        """
+        cache_polling.invalidar(("ultima", dispositivo_id))
+        # Un fix atrasado que cae en un día cerrado cambia sus recorridos cacheados
+        if marca_tiempo is not None:
+            dia = dia_local(marca_tiempo, ZONA)
+            if dia_cerrado(dia, ZONA, settings.DIA_CERRADO_GRACIA_MIN):
+                await cache_dias.invalidar(dispositivo_id, dia)
+    
+    @staticmethod
+    def _publicar_en_vivo(ubicacion: Ubicacion, imei: str) -> None:
+        """Enviar el fix aceptado a los suscriptores del WebSocket de todos los workers"""
+        fila = tuple(getattr(ubicacion, campo) for campo in CAMPOS_UBICACION)
+        relay_posiciones.publicar(
+            ubicacion.dispositivo_id, ubicacion.latitud, ubicacion.longitud,
+            {"ubicacion": mapear_ubicacion(fila), "dispositivo_imei": imei}
+        )
+    
     @staticmethod
     def _calcular_distancia_recorrido(ubicaciones: List[Ubicacion]) -> Optional[float]:
         """Calcular distancia total del recorrido usando fórmula de Haversine"""
@@ -0,0 +1,373 @@
+from sqlalchemy import select, text, func, update, literal_column, BigInteger
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.ubicacion import Ubicacion
+from models.dispositivo import Dispositivo
+from models.vehiculo import Vehiculo
+from models.ultima_posicion import UltimaPosicion
+from core.config import settings
+from core.espacial import GrillaEspacial
+from core.serializacion import compilar_mapeo
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, List, Optional, Dict, NamedTuple, Tuple
+import bisect
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+# xid de la transacción en curso (64 bits, no se repite) y xmin del snapshot
+# actual: toda transacción con xid menor a ese horizonte ya terminó
+XID_ACTUAL = literal_column("pg_current_xact_id()::text::bigint", BigInteger)
+HORIZONTE = literal_column("pg_snapshot_xmin(pg_current_snapshot())::text::bigint", BigInteger)
+
+COLUMNAS_FLOTA = (
+    UltimaPosicion.ubicacion_id.label("id"),
+    UltimaPosicion.dispositivo_id,
+    UltimaPosicion.latitud,
+    UltimaPosicion.longitud,
+    UltimaPosicion.velocidad,
+    UltimaPosicion.rumbo.label("rumbo"),
+    UltimaPosicion.altitud,
+    UltimaPosicion.precision,
+    UltimaPosicion.timestamp.label("timestamp"),
+    Dispositivo.imei,
+    Vehiculo.patente,
+)
+
+# Mismo formato que devolvía /tiempo-real con el group-by sobre ubicaciones
+mapear_flota = compilar_mapeo((
+    ("ubicacion", (
+        "id", "dispositivo_id", "latitud", "longitud", "velocidad",
+        "rumbo", "altitud", "precision", "timestamp",
+    )),
+    "dispositivo_imei",
+    "vehiculo_patente",
+))
+
+class CursorFlota(NamedTuple):
+    """Hasta dónde vio la flota un cliente de /tiempo-real ("horizonte-corte").
+
+    Las versiones son xids y se confirman en cualquier orden, así que el
+    cursor no es la mayor versión vista sino el horizonte del snapshot con que
+    se leyó: lo que todavía no se vio tiene version >= horizonte. `corte` es
+    el borde de la ventana en ese momento (epoch, redondeado hacia abajo) y
+    sirve para avisar qué dispositivos quedaron afuera desde entonces.
+    """
+    horizonte: int
+    corte: int
+
+    def __str__(self) -> str:
+        return f"{self.horizonte}-{self.corte}"
+
+    @classmethod
+    def leer(cls, texto: str) -> Optional["CursorFlota"]:
+        """None si el texto no es un cursor (p. ej. uno numérico de la versión anterior)"""
+        try:
+            horizonte, corte = texto.split("-")
+            return cls(int(horizonte), int(corte))
+        except ValueError:
+            return None
+
+class FotoFlota(NamedTuple):
+    """Lectura de la flota para un `minutos_atras`, compartida por todos los cursores.
+
+    `filas` son (version, posición) de la ventana; `previas` son (epoch,
+    dispositivo_id) de los activos que ya están fuera de ella, ordenadas, para
+    resolver `fuera` de cualquier cursor sin volver a la base.
+    """
+    horizonte: int
+    corte: int
+    filas: List[Tuple[int, Dict[str, Any]]]
+    previas: List[Tuple[float, int]]
+
+class EstadoGrilla:
+    """Cursor de versión hasta el que la grilla en memoria está sincronizada"""
+
+    def __init__(self):
+        self.cursor = 0
+        self.verificado_en = 0.0
+
+# Últimas posiciones de la flota activa indexadas por celda (viewport, cercanía)
+grilla_flota = GrillaEspacial(settings.VIEWPORT_ZOOM_MAX)
+estado_grilla = EstadoGrilla()
+
+class UltimaPosicionService:
+
+    @staticmethod
+    async def actualizar(db: AsyncSession, ubicacion: Ubicacion) -> Optional[int]:
+        """Upsert de la última posición del dispositivo; devuelve la nueva versión.
+
+        Solo reemplaza si el fix no es más viejo que el guardado, así un fix
+        atrasado no retrocede la posición; en ese caso devuelve None.
+        """
+        stmt = insert(UltimaPosicion.__table__).values(
+            dispositivo_id=ubicacion.dispositivo_id,
+            ubicacion_id=ubicacion.id,
+            latitud=ubicacion.latitud,
+            longitud=ubicacion.longitud,
+            velocidad=ubicacion.velocidad,
+            direccion=ubicacion.rumbo,
+            altitud=ubicacion.altitud,
+            precision=ubicacion.precision,
+            marca_tiempo=ubicacion.timestamp,
+            version=XID_ACTUAL,
+        )
+        excluded = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UltimaPosicion.dispositivo_id],
+            set_={
+                "ubicacion_id": excluded.ubicacion_id,
+                "latitud": excluded.latitud,
+                "longitud": excluded.longitud,
+                "velocidad": excluded.velocidad,
+                "direccion": excluded.direccion,
+                "altitud": excluded.altitud,
+                "precision": excluded.precision,
+                "marca_tiempo": excluded.marca_tiempo,
+                "version": excluded.version,
+            },
+            where=UltimaPosicion.timestamp <= excluded.marca_tiempo,
+        ).returning(UltimaPosicion.version)
+
+        result = await db.execute(stmt)
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    async def tocar(db: AsyncSession, dispositivos) -> None:
+        """Dar versión nueva a las filas de estos dispositivos sin cambiar la posición.
+
+        Para cambios fuera de la ingesta (tipo o estado del vehículo, baja del
+        dispositivo): la grilla de cada worker y los cursores de /tiempo-real
+        vuelven a leer la fila con los datos nuevos. `dispositivos` es una
+        lista de ids o un select que los devuelve; va en la transacción del cambio.
+        """
+        tabla = UltimaPosicion.__table__
+        await db.execute(
+            update(tabla).where(tabla.c.dispositivo_id.in_(dispositivos)).values(version=XID_ACTUAL)
+        )
+
+    @staticmethod
+    async def horizonte(db: AsyncSession) -> int:
+        """xmin del snapshot: toda versión todavía invisible es mayor o igual"""
+        result = await db.execute(select(HORIZONTE))
+        return result.scalar_one()
+
+    @staticmethod
+    async def version_flota(db: AsyncSession, minutos_atras: int = 5) -> str:
+        """Huella barata de la ventana: cantidad de dispositivos y suma de sus versiones.
+
+        Un upsert cambia la versión de su fila y un dispositivo que sale de la
+        ventana (o se desactiva) cambia la cantidad, así que la huella cambia
+        con el contenido de /tiempo-real aunque los xids se confirmen en
+        cualquier orden. No se leen las posiciones.
+        """
+        tiempo_limite = datetime.now(timezone.utc) - timedelta(minutes=minutos_atras)
+        result = await db.execute(
+            select(func.count(), func.coalesce(func.sum(UltimaPosicion.version), 0))
+            .join(Dispositivo, Dispositivo.id == UltimaPosicion.dispositivo_id)
+            .where(
+                Dispositivo.activo == True,
+                UltimaPosicion.timestamp >= tiempo_limite
+            )
+        )
+        cantidad, suma = result.one()
+        return f"{cantidad}.{suma}"
+
+    @staticmethod
+    async def leer_flota(db: AsyncSession, minutos_atras: int = 5) -> FotoFlota:
+        """Últimas posiciones de la flota activa, con lo necesario para responder a cualquier cursor"""
+        # Se lee antes que las filas: un horizonte más viejo solo repite alguna
+        horizonte = await UltimaPosicionService.horizonte(db)
+        tiempo_limite = datetime.now(timezone.utc) - timedelta(minutes=minutos_atras)
+
+        stmt = select(*COLUMNAS_FLOTA, UltimaPosicion.version).select_from(
+            UltimaPosicion.__table__.join(
+                Dispositivo.__table__, Dispositivo.id == UltimaPosicion.dispositivo_id
+            ).outerjoin(
+                Vehiculo.__table__, Vehiculo.dispositivo_id == Dispositivo.id
+            )
+        ).where(Dispositivo.activo == True)
+
+        filas = []
+        previas = []
+        for fila in await db.execute(stmt):
+            marca = fila.timestamp
+            if marca.tzinfo is None:
+                marca = marca.replace(tzinfo=timezone.utc)
+            if marca >= tiempo_limite:
+                filas.append((fila.version, mapear_flota(fila)))
+            else:
+                previas.append((marca.timestamp(), fila.dispositivo_id))
+        previas.sort()
+
+        return FotoFlota(horizonte, math.floor(tiempo_limite.timestamp()), filas, previas)
+
+    @staticmethod
+    def flota_desde(foto: FotoFlota, desde: Optional[str] = None) -> Dict:
+        """Respuesta de /tiempo-real para un cursor a partir de una FotoFlota.
+
+        Devuelve el cursor para la próxima consulta, las posiciones y, en un
+        delta, los dispositivos que salieron de la ventana desde el cursor. Un
+        cursor ilegible responde la ventana completa con `completo` en True.
+        """
+        cursor = CursorFlota.leer(desde) if desde is not None else None
+        if cursor is None:
+            ubicaciones = [posicion for _, posicion in foto.filas]
+            fuera: List[int] = []
+        else:
+            ubicaciones = [posicion for version, posicion in foto.filas if version >= cursor.horizonte]
+            desde_indice = bisect.bisect_left(foto.previas, (cursor.corte, -1))
+            fuera = [dispositivo_id for _, dispositivo_id in foto.previas[desde_indice:]]
+
+        return {
+            "cursor": str(CursorFlota(foto.horizonte, foto.corte)),
+            "ubicaciones": ubicaciones,
+            "fuera": fuera,
+            "completo": desde is not None and cursor is None,
+        }
+
+    @staticmethod
+    async def obtener_flota(db: AsyncSession, minutos_atras: int = 5, desde: Optional[str] = None) -> Dict:
+        """Últimas posiciones de la flota activa, opcionalmente solo lo cambiado desde un cursor"""
+        foto = await UltimaPosicionService.leer_flota(db, minutos_atras)
+        return UltimaPosicionService.flota_desde(foto, desde)
+
+    @staticmethod
+    def actualizar_grilla(ubicacion: Ubicacion, imei: str) -> None:
+        """Mover el dispositivo en la grilla en memoria; O(niveles)"""
+        datos = dict(grilla_flota.datos.get(ubicacion.dispositivo_id, {}))
+        datos.update({
+            "dispositivo_id": ubicacion.dispositivo_id,
+            "dispositivo_imei": imei,
+            "lat": ubicacion.latitud,
+            "lng": ubicacion.longitud,
+            "velocidad": ubicacion.velocidad,
+            "rumbo": ubicacion.rumbo,
+            "timestamp": ubicacion.timestamp,
+            "last_seen": ubicacion.timestamp,
+        })
+        grilla_flota.actualizar(ubicacion.dispositivo_id, ubicacion.latitud, ubicacion.longitud, datos)
+
+    @staticmethod
+    def marcar_visto(dispositivo_id: int, last_seen: datetime) -> None:
+        """Refrescar last_seen en la grilla cuando el fix no se guarda (vehículo quieto)"""
+        datos = grilla_flota.datos.get(dispositivo_id)
+        if datos is not None:
+            datos["last_seen"] = last_seen
+
+    @staticmethod
+    def visto_desde(max_minutos: int) -> Callable[[Dict], bool]:
+        """Filtro de la grilla: dispositivos que reportaron en los últimos `max_minutos`"""
+        limite = datetime.now(timezone.utc) - timedelta(minutes=max_minutos)
+
+        def filtro(datos: Dict) -> bool:
+            visto = datos.get("last_seen") or datos.get("timestamp")
+            if visto is not None and visto.tzinfo is None:
+                visto = visto.replace(tzinfo=timezone.utc)
+            return visto is not None and visto >= limite
+
+        return filtro
+
+    @staticmethod
+    def cercanos(lat: float, lng: float, k: int, tipo_vehiculo: Optional[str] = None, max_minutos: Optional[int] = None, radio_max_km: Optional[float] = None) -> List[Dict]:
+        """k vehículos activos más cercanos a un punto según la grilla en memoria"""
+        reciente = UltimaPosicionService.visto_desde(max_minutos) if max_minutos is not None else None
+
+        def filtro(datos: Dict) -> bool:
+            if datos.get("vehiculo_id") is None or not datos.get("vehiculo_activo", True):
+                return False
+            if tipo_vehiculo is not None and datos.get("tipo_vehiculo") != tipo_vehiculo:
+                return False
+            return reciente is None or reciente(datos)
+
+        resultado = grilla_flota.cercanos(
+            lat, lng, k, filtro, settings.CERCANOS_ZOOM, radio_max_km
+        )
+        return [
+            {**grilla_flota.datos[id], "distancia_km": round(distancia, 3)}
+            for distancia, id in resultado
+        ]
+
+    @staticmethod
+    async def sincronizar_grilla(db: AsyncSession) -> None:
+        """Traer a la grilla los cambios de otros workers (solo versiones nuevas)"""
+        if (time.monotonic() - estado_grilla.verificado_en) < settings.FLOTA_VERSION_TTL:
+            return
+
+        horizonte = await UltimaPosicionService.horizonte(db)
+
+        stmt = select(
+            UltimaPosicion.dispositivo_id,
+            UltimaPosicion.latitud,
+            UltimaPosicion.longitud,
+            UltimaPosicion.velocidad,
+            UltimaPosicion.rumbo,
+            UltimaPosicion.timestamp,
+            UltimaPosicion.version,
+            Dispositivo.imei,
+            Dispositivo.activo,
+            Dispositivo.last_seen,
+            Vehiculo.id.label("vehiculo_id"),
+            Vehiculo.patente,
+            Vehiculo.tipo_vehiculo,
+            Vehiculo.activo.label("vehiculo_activo"),
+        ).select_from(
+            UltimaPosicion.__table__.join(
+                Dispositivo.__table__, Dispositivo.id == UltimaPosicion.dispositivo_id
+            ).outerjoin(
+                Vehiculo.__table__, Vehiculo.dispositivo_id == Dispositivo.id
+            )
+        ).where(UltimaPosicion.version >= estado_grilla.cursor)
+
+        result = await db.execute(stmt)
+        for fila in result:
+            if not fila.activo:
+                grilla_flota.eliminar(fila.dispositivo_id)
+                continue
+            grilla_flota.actualizar(fila.dispositivo_id, fila.latitud, fila.longitud, {
+                "dispositivo_id": fila.dispositivo_id,
+                "dispositivo_imei": fila.imei,
+                "vehiculo_id": fila.vehiculo_id,
+                "vehiculo_patente": fila.patente,
+                "tipo_vehiculo": fila.tipo_vehiculo,
+                "vehiculo_activo": fila.vehiculo_activo,
+                "last_seen": fila.last_seen,
+                "lat": fila.latitud,
+                "lng": fila.longitud,
+                "velocidad": fila.velocidad,
+                "rumbo": fila.rumbo,
+                "timestamp": fila.timestamp,
+            })
+
+        # Como en CursorFlota: una versión confirmada tarde sigue por encima del horizonte
+        estado_grilla.cursor = horizonte
+        estado_grilla.verificado_en = time.monotonic()
+
+    @staticmethod
+    async def reconstruir(db: AsyncSession) -> None:
+        """Poblar la tabla desde ubicaciones (una fila por dispositivo, la más reciente)"""
+        await db.execute(text("""
+            INSERT INTO ultimas_posiciones (
+                dispositivo_id, ubicacion_id, latitud, longitud, velocidad,
+                direccion, altitud, precision, marca_tiempo, version
+            )
+            SELECT
+                u.dispositivo_id, u.id, u.latitud, u.longitud, u.velocidad,
+                u.direccion, u.altitud, u.precision, u.marca_tiempo,
+                pg_current_xact_id()::text::bigint
+            FROM (
+                SELECT DISTINCT ON (dispositivo_id) *
+                FROM ubicaciones
+                ORDER BY dispositivo_id, marca_tiempo DESC
+            ) u
+            ON CONFLICT (dispositivo_id) DO NOTHING
+        """))
+        await db.commit()
+        logger.info("Tabla ultimas_posiciones reconstruida desde ubicaciones")
+
+    @staticmethod
+    async def esta_vacia(db: AsyncSession) -> bool:
+        result = await db.execute(select(UltimaPosicion.dispositivo_id).limit(1))
+        return result.first() is None
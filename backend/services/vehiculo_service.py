@@ -3,6 +3,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from models.vehiculo import Vehiculo
 from schemas.vehiculo_schema import VehiculoCreate, VehiculoUpdate
+from services.ultima_posicion_service import UltimaPosicionService
 from typing import List, Optional
 import logging
 
@@ -16,6 +17,7 @@ class VehiculoService:
         try:
             nuevo_vehiculo = Vehiculo(**vehiculo_data.model_dump())
             db.add(nuevo_vehiculo)
+            await UltimaPosicionService.tocar(db, [nuevo_vehiculo.dispositivo_id])
             await db.commit()
             await db.refresh(nuevo_vehiculo)
             logger.info(f"Vehículo creado: {nuevo_vehiculo.patente}")
@@ -66,8 +68,12 @@ class VehiculoService:
             if not update_data:
                 return await VehiculoService.obtener_vehiculo_por_id(db, vehiculo_id)
             
+            # El dispositivo anterior y el nuevo, por si cambia la asignación
+            dispositivo = select(Vehiculo.dispositivo_id).where(Vehiculo.id == vehiculo_id)
+            await UltimaPosicionService.tocar(db, dispositivo)
             stmt = update(Vehiculo).where(Vehiculo.id == vehiculo_id).values(**update_data)
             await db.execute(stmt)
+            await UltimaPosicionService.tocar(db, dispositivo)
             await db.commit()
             
             return await VehiculoService.obtener_vehiculo_por_id(db, vehiculo_id)
@@ -82,6 +88,7 @@ class VehiculoService:
         try:
             stmt = update(Vehiculo).where(Vehiculo.id == vehiculo_id).values(activo=False)
             result = await db.execute(stmt)
+            await UltimaPosicionService.tocar(db, select(Vehiculo.dispositivo_id).where(Vehiculo.id == vehiculo_id))
             await db.commit()
             return result.rowcount > 0
         except Exception as e:
@@ -0,0 +1,119 @@
+"""Backend de tracking falso para pruebas de carga del tracker_server.
+
+Acepta los mismos endpoints que el backend real (fix suelto, lote y alarma)
+sin base de datos y registra cuándo llega cada fix, para medir la latencia
+de punta a punta sin que el backend sea el cuello de botella. Con --latencia
+y --prob-429 se puede simular un backend lento o saturado.
+
+    python backend_falso.py --puerto 8099
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, List, Tuple
+
+from aiohttp import web
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+class BackendFalso:
+
+    def __init__(self, latencia_ms: float = 0.0, prob_429: float = 0.0, retry_after: int = 1):
+        self.latencia_ms = latencia_ms
+        self.prob_429 = prob_429
+        self.retry_after = retry_after
+        # (device_id, sequence, hora de llegada)
+        self.arribos: List[Tuple[str, int, float]] = []
+        self.vistos: Dict[Tuple[str, int], int] = {}
+        self.alarmas = 0
+        self.lotes = 0
+        self.rechazados_429 = 0
+
+    async def _demorar(self) -> None:
+        if self.latencia_ms:
+            await asyncio.sleep(random.expovariate(1 / self.latencia_ms) / 1000)
+
+    def _saturado(self) -> bool:
+        if self.prob_429 and random.random() < self.prob_429:
+            self.rechazados_429 += 1
+            return True
+        return False
+
+    def _respuesta_429(self) -> web.Response:
+        return web.json_response({"detail": "Backend saturado"}, status=429, headers={"Retry-After": str(self.retry_after)})
+
+    def _registrar(self, fix: dict) -> bool:
+        """True si el fix es nuevo"""
+        clave = (fix.get("device_id"), fix.get("sequence"))
+        self.arribos.append((clave[0], clave[1], time.time()))
+        self.vistos[clave] = self.vistos.get(clave, 0) + 1
+        return self.vistos[clave] == 1
+
+    async def recibir(self, request: web.Request) -> web.Response:
+        await self._demorar()
+        if self._saturado():
+            return self._respuesta_429()
+        fix = await request.json()
+        resultado = "creado" if self._registrar(fix) else "duplicado"
+        return web.json_response({"status": "ok"}, status=201, headers={"X-Resultado": resultado})
+
+    async def recibir_lote(self, request: web.Request) -> web.Response:
+        await self._demorar()
+        if self._saturado():
+            return self._respuesta_429()
+        lote = await request.json()
+        self.lotes += 1
+        creados = sum(self._registrar(fix) for fix in lote)
+        return web.json_response({"creados": creados, "duplicados": len(lote) - creados, "errores": 0})
+
+    async def recibir_alarma(self, request: web.Request) -> web.Response:
+        await request.json()
+        self.alarmas += 1
+        return web.json_response({"status": "ok"}, status=201)
+
+    async def ver_arribos(self, request: web.Request) -> web.Response:
+        """Arribos desde el índice `desde`, para que el medidor los lea de a partes"""
+        desde = int(request.query.get("desde", 0))
+        return web.json_response({"total": len(self.arribos), "arribos": self.arribos[desde:]})
+
+    async def ver_estadisticas(self, request: web.Request) -> web.Response:
+        return web.json_response(self.estadisticas())
+
+    def estadisticas(self) -> dict:
+        return {
+            "arribos": len(self.arribos),
+            "unicos": len(self.vistos),
+            "duplicados": len(self.arribos) - len(self.vistos),
+            "lotes": self.lotes,
+            "alarmas": self.alarmas,
+            "rechazados_429": self.rechazados_429,
+        }
+
+    def aplicacion(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.add_routes([
+            web.post("/api/v1/tracker/data", self.recibir),
+            web.post("/api/v1/tracker/data/lote", self.recibir_lote),
+            web.post("/api/v1/tracker/alarma", self.recibir_alarma),
+            web.get("/arribos", self.ver_arribos),
+            web.get("/estadisticas", self.ver_estadisticas),
+        ])
+        return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backend de tracking falso")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8099)
+    parser.add_argument("--latencia-ms", type=float, default=0.0, help="Latencia media por request (exponencial)")
+    parser.add_argument("--prob-429", type=float, default=0.0, help="Probabilidad de responder 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+
+    backend = BackendFalso(args.latencia_ms, args.prob_429, args.retry_after)
+    web.run_app(backend.aplicacion(), host=args.host, port=args.puerto, access_log=None, print=None)
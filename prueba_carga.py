@@ -0,0 +1,212 @@
+"""Prueba de carga de punta a punta del tracker_server.
+
+Levanta el backend falso y el tracker_server como procesos aparte, conecta
+N equipos simulados y, al terminar, cruza la hora de envío de cada posición
+con su llegada al backend:
+
+- paquetes/seg recibidos por el servidor y fixes/seg entregados al backend
+- latencia de punta a punta (p50/p90/p99/máx)
+- pérdida (fixes enviados que nunca llegaron) y duplicados
+- ACKs recibidos contra los esperados (login y heartbeat)
+
+    python prueba_carga.py --dispositivos 10000 --intervalo 10 --duracion 120 --prob-partir 0.1 --prob-agrupar 0.1
+
+Con --sin-servidor se mide un tracker_server ya levantado (--host/--puerto) que
+apunte al backend falso.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import aiohttp
+
+from tracker_sim import Simulador
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+RAIZ = Path(__file__).resolve().parent
+
+def _subir_limite_archivos(necesarios: int) -> None:
+    """Cada equipo es un socket en el simulador y otro en el servidor"""
+    try:
+        import resource
+    except ImportError:
+        return
+    blando, duro = resource.getrlimit(resource.RLIMIT_NOFILE)
+    objetivo = necesarios if duro == resource.RLIM_INFINITY else min(necesarios, duro)
+    if blando < objetivo:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (objetivo, duro))
+    if objetivo < necesarios:
+        logger.warning(f"El límite de archivos abiertos ({duro}) no alcanza para {necesarios} sockets")
+
+def _percentil(valores: List[float], p: float) -> Optional[float]:
+    if not valores:
+        return None
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+async def _esperar_puerto(host: str, puerto: int, limite: float = 15.0) -> None:
+    fin = time.monotonic() + limite
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, puerto)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > fin:
+                raise RuntimeError(f"Nada escucha en {host}:{puerto}")
+            await asyncio.sleep(0.2)
+
+def _lanzar(entorno_extra: dict, *comando: str, cwd: Path = RAIZ) -> subprocess.Popen:
+    entorno = {**os.environ, **entorno_extra}
+    return subprocess.Popen([sys.executable, *comando], cwd=cwd, env=entorno)
+
+async def _leer_arribos(url: str) -> list:
+    arribos = []
+    async with aiohttp.ClientSession() as sesion:
+        while True:
+            async with sesion.get(f"{url}/arribos", params={"desde": len(arribos)}) as respuesta:
+                datos = await respuesta.json()
+            arribos.extend(datos["arribos"])
+            if len(arribos) >= datos["total"]:
+                return arribos
+
+async def _esperar_drenaje(url: str, enviados: int, limite: float) -> None:
+    """Esperar a que el backend deje de recibir (o reciba todo)"""
+    anterior, quietos = -1, 0
+    fin = time.monotonic() + limite
+    async with aiohttp.ClientSession() as sesion:
+        while time.monotonic() < fin:
+            async with sesion.get(f"{url}/estadisticas") as respuesta:
+                unicos = (await respuesta.json())["unicos"]
+            if unicos >= enviados:
+                return
+            quietos = quietos + 1 if unicos == anterior else 0
+            if quietos >= 6:
+                return
+            anterior = unicos
+            await asyncio.sleep(0.5)
+
+async def ejecutar(args) -> dict:
+    _subir_limite_archivos(2 * args.dispositivos + 1024)
+    url_backend = f"http://{args.host}:{args.puerto_backend}"
+    procesos: List[subprocess.Popen] = []
+    try:
+        procesos.append(_lanzar({}, "backend_falso.py", "--host", args.host,
+                                "--puerto", str(args.puerto_backend),
+                                "--latencia-ms", str(args.latencia_backend_ms),
+                                "--prob-429", str(args.prob_429)))
+        await _esperar_puerto(args.host, args.puerto_backend)
+        if not args.sin_servidor:
+            procesos.append(_lanzar({
+                "TCP_HOST": args.host,
+                "TCP_PORT": str(args.puerto),
+                "BACKEND_URL_TRACKING": f"{url_backend}/api/v1/tracker/data",
+                "BACKEND_URL_TRACKING_LOTE": f"{url_backend}/api/v1/tracker/data/lote",
+                "BACKEND_URL_ALARMAS": f"{url_backend}/api/v1/tracker/alarma",
+                "LOG_LEVEL": "WARNING",
+            }, "main.py", cwd=RAIZ / "tracker_server"))
+        await _esperar_puerto(args.host, args.puerto)
+
+        simulador = Simulador(
+            args.host, args.puerto, args.dispositivos, args.intervalo, args.heartbeat_cada,
+            args.prob_partir, args.prob_agrupar, args.conexiones_por_seg, args.tls, args.semilla
+        )
+        logger.info(f"🚀 {args.dispositivos} equipos, un fix cada {args.intervalo}s durante {args.duracion}s")
+        inicio = time.time()
+        await simulador.ejecutar(args.duracion)
+        fin_envio = time.time()
+        await _esperar_drenaje(url_backend, len(simulador.enviados), args.espera_drenaje)
+        arribos = await _leer_arribos(url_backend)
+    finally:
+        for proceso in procesos:
+            proceso.terminate()
+        for proceso in procesos:
+            try:
+                proceso.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proceso.kill()
+
+    latencias = []
+    vistos = set()
+    duplicados = 0
+    for device_id, sequence, llegada in arribos:
+        clave = (device_id, sequence)
+        if clave in vistos:
+            duplicados += 1
+            continue
+        vistos.add(clave)
+        enviado = simulador.enviados.get(clave)
+        if enviado is not None:
+            latencias.append((llegada - enviado) * 1000)
+    latencias.sort()
+
+    duracion = fin_envio - inicio
+    estadisticas = simulador.estadisticas()
+    paquetes = sum(estadisticas["paquetes"].values())
+    enviados = len(simulador.enviados)
+    entregados = len(vistos & simulador.enviados.keys())
+    acks_esperados = estadisticas["paquetes"]["login"] + estadisticas["paquetes"]["heartbeat"]
+    return {
+        "dispositivos": args.dispositivos,
+        "duracion_seg": round(duracion, 1),
+        "simulador": estadisticas,
+        "paquetes_por_seg": round(paquetes / duracion, 1),
+        "fixes_enviados": enviados,
+        "fixes_entregados": entregados,
+        "fixes_por_seg": round(entregados / duracion, 1),
+        "perdida_pct": round(100 * (enviados - entregados) / enviados, 3) if enviados else 0.0,
+        "duplicados": duplicados,
+        "acks_pct": round(100 * estadisticas["acks"] / acks_esperados, 2) if acks_esperados else None,
+        "latencia_ms": {
+            f"p{p}": round(_percentil(latencias, p), 1) if latencias else None for p in (50, 90, 99)
+        } | {"max": round(latencias[-1], 1) if latencias else None},
+    }
+
+def _mostrar(reporte: dict) -> None:
+    latencia = reporte["latencia_ms"]
+    print(f"\n{'=' * 60}")
+    print(f"Equipos: {reporte['dispositivos']} | duración {reporte['duracion_seg']}s")
+    print(f"Paquetes/seg: {reporte['paquetes_por_seg']} | fixes entregados/seg: {reporte['fixes_por_seg']}")
+    print(f"Fixes: {reporte['fixes_enviados']} enviados, {reporte['fixes_entregados']} entregados "
+          f"({reporte['perdida_pct']}% pérdida), {reporte['duplicados']} duplicados")
+    print(f"Latencia (ms): p50 {latencia['p50']} | p90 {latencia['p90']} | p99 {latencia['p99']} | máx {latencia['max']}")
+    print(f"ACKs: {reporte['acks_pct']}% | simulador: {reporte['simulador']}")
+    print('=' * 60)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga del tracker_server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=5099, help="Puerto del tracker_server")
+    parser.add_argument("--puerto-backend", type=int, default=8099)
+    parser.add_argument("--sin-servidor", action="store_true", help="No levantar el tracker_server; usar uno existente")
+    parser.add_argument("--dispositivos", type=int, default=1000)
+    parser.add_argument("--intervalo", type=float, default=10.0)
+    parser.add_argument("--heartbeat-cada", type=int, default=6)
+    parser.add_argument("--prob-partir", type=float, default=0.05)
+    parser.add_argument("--prob-agrupar", type=float, default=0.05)
+    parser.add_argument("--conexiones-por-seg", type=float, default=500.0)
+    parser.add_argument("--duracion", type=float, default=60.0)
+    parser.add_argument("--espera-drenaje", type=float, default=60.0, help="Segundos máximos esperando al backend al final")
+    parser.add_argument("--latencia-backend-ms", type=float, default=0.0)
+    parser.add_argument("--prob-429", type=float, default=0.0)
+    parser.add_argument("--tls", action="store_true")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Imprimir el reporte como JSON")
+    args = parser.parse_args()
+
+    reporte = asyncio.run(ejecutar(args))
+    if args.json:
+        print(json.dumps(reporte, indent=2, ensure_ascii=False))
+    else:
+        _mostrar(reporte)
@@ -11,8 +11,24 @@ class Settings(BaseSettings):
     
     # Configuración del backend
     BACKEND_URL_TRACKING: str = os.getenv("BACKEND_URL_TRACKING", "https://sistemalogistico-tracking.onrender.com:8002/api/v1/tracker/data")
+    BACKEND_URL_TRACKING_LOTE: str = os.getenv("BACKEND_URL_TRACKING_LOTE", BACKEND_URL_TRACKING.rstrip("/") + "/lote")
     API_KEY: str = os.getenv("API_KEY", "")
+    BACKEND_URL_ALARMAS: str = os.getenv("BACKEND_URL_ALARMAS", BACKEND_URL_TRACKING.rstrip("/").rsplit("/", 1)[0] + "/alarma")
     BACKEND_TIMEOUT: int = int(os.getenv("BACKEND_TIMEOUT", 5))
+    BACKEND_MAX_CONEXIONES: int = int(os.getenv("BACKEND_MAX_CONEXIONES", 20))
+    
+    # Reintentos y buffer local cuando el backend está saturado o caído
+    BACKOFF_BASE_SEG: float = float(os.getenv("BACKOFF_BASE_SEG", 1))
+    BACKOFF_MAX_SEG: float = float(os.getenv("BACKOFF_MAX_SEG", 60))
+    BUFFER_MAX_FIXES: int = int(os.getenv("BUFFER_MAX_FIXES", 50000))
+    LOTE_REENVIO: int = int(os.getenv("LOTE_REENVIO", 200))
+    
+    # Carril prioritario de alarmas: conexiones propias y reintentos rápidos
+    ALARMAS_MAX_CONEXIONES: int = int(os.getenv("ALARMAS_MAX_CONEXIONES", 4))
+    ALARMAS_TIMEOUT_SEG: float = float(os.getenv("ALARMAS_TIMEOUT_SEG", 2))
+    ALARMAS_REINTENTOS: int = int(os.getenv("ALARMAS_REINTENTOS", 4))
+    ALARMAS_BACKOFF_BASE_SEG: float = float(os.getenv("ALARMAS_BACKOFF_BASE_SEG", 0.05))
+    ALARMAS_BACKOFF_MAX_SEG: float = float(os.getenv("ALARMAS_BACKOFF_MAX_SEG", 2))
     
     # Dispositivos permitidos
     ALLOWED_DEVICES: list = [
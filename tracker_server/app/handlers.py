@@ -1,13 +1,239 @@
 import asyncio
 import aiohttp
 import logging
+import random
+import time
+from collections import deque
 from datetime import datetime, timezone
+from typing import List, Optional
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Respuestas que piden esperar: el backend está saturado o no disponible
+ESTADOS_REINTENTABLES = {429, 502, 503, 504}
+
+def _retry_after(response) -> Optional[float]:
+    valor = response.headers.get("Retry-After")
+    try:
+        return float(valor) if valor else None
+    except ValueError:
+        return None
+
+def _headers() -> dict:
+    headers = {"Content-Type": "application/json"}
+    if settings.API_KEY and settings.API_KEY.strip():
+        headers["Authorization"] = f"Bearer {settings.API_KEY.strip()}"
+    return headers
+
+def _percentil(valores: List[float], p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))]
+
+class Reenviador:
+    """Envío de fixes al backend con backoff adaptativo y buffer local.
+
+    Si el backend responde 429/5xx o no contesta, el fix queda en un buffer en
+    memoria y una tarea lo reenvía por lotes cuando termina la espera. La
+    espera es exponencial con jitter y nunca menor al Retry-After del backend.
+    Mientras haya fixes en el buffer los nuevos se encolan detrás, para no
+    alterar el orden. Reenviar es seguro: la ingesta del backend es idempotente.
+    """
+
+    def __init__(self):
+        self.buffer = deque(maxlen=settings.BUFFER_MAX_FIXES)
+        self.fallos = 0
+        self.pausa_hasta = 0.0
+        self.descartados = 0
+        self._sesion: Optional[aiohttp.ClientSession] = None
+        self._tarea: Optional[asyncio.Task] = None
+
+    def _cliente(self) -> aiohttp.ClientSession:
+        if self._sesion is None or self._sesion.closed:
+            self._sesion = aiohttp.ClientSession(
+                headers=_headers(),
+                connector=aiohttp.TCPConnector(limit=settings.BACKEND_MAX_CONEXIONES),
+                timeout=aiohttp.ClientTimeout(total=settings.BACKEND_TIMEOUT)
+            )
+        return self._sesion
+
+    def _esperar(self, retry_after: Optional[float] = None) -> float:
+        """Programa la próxima tentativa: backoff exponencial con jitter completo"""
+        self.fallos += 1
+        tope = min(settings.BACKOFF_MAX_SEG, settings.BACKOFF_BASE_SEG * 2 ** (self.fallos - 1))
+        espera = random.uniform(0, tope)
+        if retry_after is not None:
+            espera = max(espera, retry_after + random.uniform(0, settings.BACKOFF_BASE_SEG))
+        self.pausa_hasta = time.monotonic() + espera
+        return espera
+
+    def _encolar(self, payloads: List[dict]) -> None:
+        if len(self.buffer) + len(payloads) > self.buffer.maxlen:
+            self.descartados += len(self.buffer) + len(payloads) - self.buffer.maxlen
+            logger.warning(f"Buffer lleno: se descartan los fixes más viejos ({self.descartados} en total)")
+        self.buffer.extend(payloads)
+        if self._tarea is None or self._tarea.done():
+            self._tarea = asyncio.create_task(self._vaciar())
+
+    async def enviar(self, payload: dict) -> bool:
+        if self.buffer or time.monotonic() < self.pausa_hasta:
+            self._encolar([payload])
+            return False
+
+        try:
+            async with self._cliente().post(settings.BACKEND_URL_TRACKING, json=payload) as response:
+                if response.status in (200, 201):
+                    self.fallos = 0
+                    logger.info(f"Datos enviados correctamente ({response.headers.get('X-Resultado', 'creado')})")
+                    return True
+
+                error = await response.text()
+                if response.status in ESTADOS_REINTENTABLES or response.status >= 500:
+                    espera = self._esperar(_retry_after(response))
+                    logger.warning(f"Backend respondió {response.status}; fix al buffer, reintento en {espera:.1f}s")
+                    self._encolar([payload])
+                else:
+                    logger.error(f"Fix rechazado. Status: {response.status}. Error: {error}")
+                return False
+
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            espera = self._esperar()
+            logger.error(f"Sin respuesta del backend ({type(e).__name__}); fix al buffer, reintento en {espera:.1f}s")
+            self._encolar([payload])
+            return False
+
+    async def _vaciar(self) -> None:
+        """Reenvía el buffer por lotes respetando la pausa vigente"""
+        while self.buffer:
+            demora = self.pausa_hasta - time.monotonic()
+            if demora > 0:
+                await asyncio.sleep(demora)
+
+            lote = [self.buffer.popleft() for _ in range(min(settings.LOTE_REENVIO, len(self.buffer)))]
+            try:
+                async with self._cliente().post(settings.BACKEND_URL_TRACKING_LOTE, json=lote) as response:
+                    if response.status == 200:
+                        resumen = await response.json()
+                        self.fallos = 0
+                        logger.info(
+                            f"Buffer: lote de {len(lote)} reenviado | creados {resumen.get('creados')}, "
+                            f"duplicados {resumen.get('duplicados')}, errores {resumen.get('errores')}"
+                        )
+                    elif response.status in ESTADOS_REINTENTABLES or response.status >= 500:
+                        espera = self._esperar(_retry_after(response))
+                        logger.warning(f"Buffer: backend respondió {response.status}, reintento en {espera:.1f}s ({len(self.buffer) + len(lote)} pendientes)")
+                        self.buffer.extendleft(reversed(lote))
+                    else:
+                        # Un lote inválido no se reintenta para no bloquear el resto
+                        logger.error(f"Buffer: lote de {len(lote)} rechazado. Status: {response.status}. Error: {await response.text()}")
+            except Exception as e:
+                espera = self._esperar()
+                logger.error(f"Buffer: error reenviando ({type(e).__name__}: {e}), reintento en {espera:.1f}s")
+                self.buffer.extendleft(reversed(lote))
+
+class CanalAlarmas:
+    """Carril prioritario para alarmas (SOS, corte de energía, etc.).
+
+    Usa su propia sesión HTTP con conexiones reservadas, de modo que un backlog
+    de GPS no las ocupa, y no pasa por el buffer del Reenviador. Reintenta
+    rápido (decenas de ms) y, si el backend sigue sin responder, la alarma
+    queda pendiente y se reintenta sin descartarla. La latencia desde que llega
+    el paquete hasta que el backend confirma se mide aparte.
+    """
+
+    def __init__(self):
+        self.pendientes = deque()
+        self.latencias = deque(maxlen=1000)
+        self.enviadas = 0
+        self.reintentos = 0
+        self._sesion: Optional[aiohttp.ClientSession] = None
+        self._tareas = set()
+        self._reintentador: Optional[asyncio.Task] = None
+
+    def _cliente(self) -> aiohttp.ClientSession:
+        if self._sesion is None or self._sesion.closed:
+            self._sesion = aiohttp.ClientSession(
+                headers=_headers(),
+                connector=aiohttp.TCPConnector(limit=settings.ALARMAS_MAX_CONEXIONES),
+                timeout=aiohttp.ClientTimeout(total=settings.ALARMAS_TIMEOUT_SEG)
+            )
+        return self._sesion
+
+    def despachar(self, alarma: dict, recibido: float) -> None:
+        """Envía en una tarea propia y vuelve de inmediato a leer el socket"""
+        tarea = asyncio.create_task(self.enviar(alarma, recibido))
+        self._tareas.add(tarea)
+        tarea.add_done_callback(self._tareas.discard)
+
+    async def _post(self, payload: dict) -> Optional[bool]:
+        """True entregada, False rechazada (no se reintenta), None reintentable"""
+        try:
+            async with self._cliente().post(settings.BACKEND_URL_ALARMAS, json=payload) as response:
+                if response.status in (200, 201):
+                    return True
+                if response.status in ESTADOS_REINTENTABLES or response.status >= 500:
+                    return None
+                logger.error(f"🚨 Alarma rechazada. Status: {response.status}. Error: {await response.text()}")
+                return False
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            logger.error(f"🚨 Alarma sin respuesta del backend ({type(e).__name__})")
+            return None
+
+    def _entregada(self, alarma: dict, recibido: float) -> None:
+        latencia_ms = (time.monotonic() - recibido) * 1000
+        self.latencias.append(latencia_ms)
+        self.enviadas += 1
+        logger.warning(
+            f"🚨 Alarma {alarma.get('tipo')} de {alarma.get('device_id')} entregada en {latencia_ms:.0f} ms "
+            f"(p99 {self.estadisticas()['latencia_p99_ms']} ms)"
+        )
+
+    async def enviar(self, alarma: dict, recibido: float) -> bool:
+        payload = {
+            **{k: v for k, v in alarma.items() if k != 'serial'},
+            "recibido_en": datetime.now(timezone.utc).isoformat(),
+        }
+        for intento in range(settings.ALARMAS_REINTENTOS):
+            resultado = await self._post(payload)
+            if resultado is not None:
+                if resultado:
+                    self._entregada(alarma, recibido)
+                return resultado
+            self.reintentos += 1
+            await asyncio.sleep(settings.ALARMAS_BACKOFF_BASE_SEG * 2 ** intento * random.uniform(0.5, 1.0))
+
+        self.pendientes.append((payload, alarma, recibido))
+        if self._reintentador is None or self._reintentador.done():
+            self._reintentador = asyncio.create_task(self._reintentar_pendientes())
+        return False
+
+    async def _reintentar_pendientes(self) -> None:
+        while self.pendientes:
+            await asyncio.sleep(settings.ALARMAS_BACKOFF_MAX_SEG * random.uniform(0.5, 1.0))
+            payload, alarma, recibido = self.pendientes[0]
+            resultado = await self._post(payload)
+            if resultado is None:
+                self.reintentos += 1
+                continue
+            self.pendientes.popleft()
+            if resultado:
+                self._entregada(alarma, recibido)
+
+    def estadisticas(self) -> dict:
+        latencias = list(self.latencias)
+        return {
+            "enviadas": self.enviadas,
+            "reintentos": self.reintentos,
+            "pendientes": len(self.pendientes),
+            "latencia_p50_ms": round(_percentil(latencias, 0.5), 1) if latencias else None,
+            "latencia_p99_ms": round(_percentil(latencias, 0.99), 1) if latencias else None,
+        }
+
+reenviador = Reenviador()
+canal_alarmas = CanalAlarmas()
+
 async def send_to_backend(data: dict) -> bool:
-    """Envía datos al backend"""
+    """Envía datos al backend; si no puede, quedan en el buffer de reenvío"""
     if not data or 'lat' not in data or 'lng' not in data:
         logger.debug("Datos incompletos ignorados")
         return False
@@ -21,47 +247,15 @@ async def send_to_backend(data: dict) -> bool:
             "course": data.get("course", 0),
             "altitude": data.get("altitude", 0),
             "accuracy": data.get("accuracy", 5),
+            "sequence": data.get("serial"),
             "timestamp": data.get("timestamp", datetime.now(timezone.utc).isoformat())
         }
-
-        headers = {
-            "Content-Type": "application/json"
-        }
-        
-        if settings.API_KEY and settings.API_KEY.strip():
-            headers["Authorization"] = f"Bearer {settings.API_KEY.strip()}"
-
-        async with aiohttp.ClientSession() as session:
-            for attempt in range(3):
-                try:
-                    async with session.post(
-                        settings.BACKEND_URL_TRACKING,
-                        json=payload,
-                        headers=headers,
-                        timeout=aiohttp.ClientTimeout(total=settings.BACKEND_TIMEOUT)
-                    ) as response:
-                        
-                        if response.status == 201:
-                            logger.info("Datos enviados correctamente")
-                            return True
-                            
-                        error = await response.text()
-                        logger.error(f"Intento {attempt+1} fallido. Status: {response.status}. Error: {error}")
-                        
-                        if 400 <= response.status < 500:
-                            break
-
-                except asyncio.TimeoutError:
-                    logger.error(f"Timeout en intento {attempt+1}")
-                except Exception as e:
-                    logger.error(f"Error en intento {attempt+1}: {str(e)}")
-                
-                if attempt < 2:
-                    await asyncio.sleep(1)
-        
-        logger.error(f"Fallo después de 3 intentos.")
-        return False
+        return await reenviador.enviar(payload)
 
     except Exception as e:
         logger.error(f"Error inesperado: {str(e)}")
-        return False
\ No newline at end of file
+        return False
+
+def send_alarm(alarma: dict, recibido: float) -> None:
+    """Envía una alarma por el carril prioritario; recibido es time.monotonic() al leer el paquete"""
+    canal_alarmas.despachar(alarma, recibido)
@@ -1,9 +1,33 @@
 import struct
 import logging
 from datetime import datetime
+from typing import List
 
 logger = logging.getLogger("ProtocolParser")
 
+# Código de alarma del paquete 0x16/0x26 (byte de alarma tras el estado del terminal)
+ALARMAS_GT06 = {
+    0x01: "sos",
+    0x02: "corte_energia",
+    0x03: "vibracion",
+    0x04: "entrada_geocerca",
+    0x05: "salida_geocerca",
+    0x06: "exceso_velocidad",
+    0x09: "movimiento",
+    0x0E: "bateria_baja",
+    0x13: "desarme",
+}
+
+# Largo máximo razonable de un paquete; más que esto sin poder armar uno es basura
+MAX_PAQUETE = 1024
+
+# Subprotocolos del paquete de información 0x94 (cabecera 0x7979)
+INFORMACION_GT06 = {
+    0x00: "voltaje_externo",
+    0x04: "sincronizacion_estado",
+    0x05: "estado_puerta",
+}
+
 class GT06ProtocolParser:
     
     @staticmethod
@@ -21,6 +45,40 @@ class GT06ProtocolParser:
             crc &= 0xFFFF
         return struct.pack('>H', crc)
 
+    @staticmethod
+    def extraer_paquetes(buffer: bytearray) -> List[bytes]:
+        """Separa los paquetes completos acumulados en el buffer (los quita de él).
+
+        TCP no respeta los límites de cada write del equipo: una lectura puede
+        traer varios paquetes juntos o uno partido. 0x7878 lleva el largo en 1
+        byte y 0x7979 en 2; el largo cuenta desde el protocolo hasta el CRC. Si
+        un paquete no termina en 0D0A se descarta un byte y se resincroniza.
+        """
+        paquetes = []
+        while True:
+            inicio = min((i for i in (buffer.find(b'\x78\x78'), buffer.find(b'\x79\x79')) if i >= 0), default=-1)
+            if inicio < 0:
+                # Conservar un posible inicio de cabecera partido
+                del buffer[:max(len(buffer) - 1, 0)]
+                return paquetes
+            del buffer[:inicio]
+
+            largo_cabecera = 3 if buffer[0] == 0x78 else 4
+            if len(buffer) < largo_cabecera:
+                return paquetes
+            largo = buffer[2] if largo_cabecera == 3 else int.from_bytes(buffer[2:4], 'big')
+            total = largo_cabecera + largo + 2
+            if len(buffer) < total:
+                if len(buffer) > MAX_PAQUETE:
+                    del buffer[:2]
+                    continue
+                return paquetes
+            if buffer[total - 2:total] != b'\x0d\x0a':
+                del buffer[:1]
+                continue
+            paquetes.append(bytes(buffer[:total]))
+            del buffer[:total]
+
     @staticmethod
     def parse_login(data: bytes) -> dict:
         if len(data) < 14:
@@ -48,14 +106,9 @@ class GT06ProtocolParser:
             raw_lat = struct.unpack('>i', data[11:15])[0]
             raw_lng = struct.unpack('>i', data[15:19])[0]
             
-            def convert_coord(raw):
-                val = raw / 30000.0
-                deg = int(val / 60)
-                mins = val % 60
-                return deg + (mins / 60)
-
-            lat = convert_coord(raw_lat)
-            lng = convert_coord(raw_lng)
+            # raw = minutos * 30000, con signo (negativo al sur / oeste)
+            lat = raw_lat / 30000.0 / 60
+            lng = raw_lng / 30000.0 / 60
             
             speed = data[19]
             
@@ -75,6 +128,40 @@ class GT06ProtocolParser:
             logger.error(f"Error parseando bytes GPS: {data.hex()}")
             raise e
 
+    @staticmethod
+    def parse_alarm(data: bytes) -> dict:
+        """Alarma estructurada: 0x16/0x26 (con posición) o paquetes largos 0x7979 (0x94 y otros)"""
+        if data[0:2] == b'\x79\x79':
+            protocol = data[4]
+            contenido = data[6:-6] if len(data) > 12 else b''
+            if protocol == 0x94:
+                subprotocolo = data[5]
+                alarma = {
+                    'tipo': INFORMACION_GT06.get(subprotocolo, 'informacion'),
+                    'codigo': subprotocolo,
+                    'detalle': {'protocolo': protocol, 'contenido': contenido.hex()},
+                }
+                if subprotocolo == 0x00 and len(contenido) >= 2:
+                    alarma['detalle']['voltaje'] = int.from_bytes(contenido[:2], 'big') / 100
+                return alarma
+            return {'tipo': 'desconocida', 'codigo': protocol, 'detalle': {'protocolo': protocol, 'contenido': data[5:-6].hex()}}
+
+        protocol = data[3]
+        alarma = GT06ProtocolParser.parse_gps(data)
+        codigo = data[34] if len(data) >= 40 else None
+        alarma.update({
+            'tipo': ALARMAS_GT06.get(codigo, 'alarma') if codigo is not None else 'alarma',
+            'codigo': codigo,
+            'detalle': {'protocolo': protocol},
+        })
+        if len(data) >= 40:
+            alarma['detalle'].update({
+                'estado_terminal': data[31],
+                'nivel_bateria': data[32],
+                'senal_gsm': data[33],
+            })
+        return alarma
+
     @staticmethod
     def create_ack(serial_number: int) -> bytes:
         """
@@ -1,10 +1,11 @@
 import asyncio
 import logging
 import struct
+import time
 from datetime import datetime, timezone
 from app.config import settings
 from app.protocol import GT06ProtocolParser
-from app.handlers import send_to_backend
+from app.handlers import send_to_backend, send_alarm
 
 logging.basicConfig(
     level=getattr(logging, settings.LOG_LEVEL.upper(), logging.INFO),
@@ -21,11 +22,12 @@ class GT06Server:
     async def handle_client(self, reader, writer):
         peername = writer.get_extra_info('peername')
         logger.info(f"🟢 NUEVA CONEXIÓN: {peername}")
+        buffer = bytearray()
 
         try:
             while True:
                 try:
-                    data = await asyncio.wait_for(reader.read(1024), timeout=300.0)
+                    data = await asyncio.wait_for(reader.read(settings.BUFFER_SIZE), timeout=300.0)
                 except asyncio.TimeoutError:
                     logger.warning(f"⏰ Timeout con {peername}")
                     break
@@ -34,72 +36,13 @@ class GT06Server:
                     logger.info(f"🔴 Desconectado: {peername}")
                     break
 
-                if len(data) < 5:
-                    continue
-                
-                header = data[0:2]
-                if header not in [b'\x78\x78', b'\x79\x79']:
-                    logger.debug(f"⚠️ Header desconocido: {header.hex()}")
-                    continue
-
-                try:
-                    protocol = 0
-                    if header == b'\x78\x78':
-                        protocol = data[3]
-                    else:
-                        protocol = data[4]
-
-                    device_id = self.sessions.get(writer)
-
-                    if protocol == 0x01:
-                        packet = self.parser.parse_login(data)
-                        device_id = packet['device_id']
-                        self.sessions[writer] = device_id
-                        
-                        logger.info(f"✅ Login OK | ID: {device_id}")
-                        
-                        serial = struct.unpack('>H', data[-6:-4])[0]
-                        ack = self.parser.create_ack(serial)
-                        writer.write(ack)
-                        await writer.drain()
-
-                    elif protocol == 0x22: 
-                        if not device_id:
-                            logger.warning("⚠️ Datos GPS recibidos sin Login previo")
-                            continue
-                            
-                        packet = self.parser.parse_gps(data)
-                        packet['device_id'] = device_id
-                        
-                        logger.info(f"📍 GPS | ID: {device_id} | Lat: {packet['lat']}, Lng: {packet['lng']}")
-                        
-                        await send_to_backend(packet)
-
-                    elif protocol == 0x13: 
-                        logger.info(f"💓 Heartbeat | ID: {device_id or 'Desconocido'}")
-                        serial = struct.unpack('>H', data[-6:-4])[0]
-                        ack = self.parser.create_ack(serial)
-                        writer.write(ack)
-                        await writer.drain()
-                    
-                    elif protocol == 0x12:
-                        logger.info(f"📡 LBS (Sin GPS) | ID: {device_id or 'Desconocido'}")
-                        serial = struct.unpack('>H', data[-6:-4])[0]
-                        ack = self.parser.create_ack(serial)
-                        writer.write(ack)
-                        await writer.drain()
-
-                    elif protocol == 0x94 or header == b'\x79\x79':
-                        logger.warning(f"🔔 ALARMA Recibida | ID: {device_id or 'Desconocido'}")
-                        if len(data) > 6:
-                            serial = struct.unpack('>H', data[-6:-4])[0]
-                            ack = self.parser.create_ack(serial)
-                            writer.write(ack)
-                            await writer.drain()
-
-                except Exception as e:
-                    logger.error(f"💥 Error procesando paquete: {str(e)}")
-                    continue
+                # Una lectura puede traer varios paquetes o parte de uno
+                buffer += data
+                for paquete in self.parser.extraer_paquetes(buffer):
+                    try:
+                        await self.procesar_paquete(paquete, writer)
+                    except Exception as e:
+                        logger.error(f"💥 Error procesando paquete: {str(e)}")
 
         except Exception as e:
             logger.error(f"Error general: {str(e)}")
@@ -108,6 +51,71 @@ class GT06Server:
                 del self.sessions[writer]
             writer.close()
 
+    async def procesar_paquete(self, data: bytes, writer):
+        header = data[0:2]
+        if header == b'\x78\x78':
+            protocol = data[3]
+        else:
+            protocol = data[4]
+
+        device_id = self.sessions.get(writer)
+
+        if protocol == 0x01:
+            packet = self.parser.parse_login(data)
+            device_id = packet['device_id']
+            self.sessions[writer] = device_id
+            
+            logger.info(f"✅ Login OK | ID: {device_id}")
+            
+            serial = struct.unpack('>H', data[-6:-4])[0]
+            ack = self.parser.create_ack(serial)
+            writer.write(ack)
+            await writer.drain()
+
+        elif protocol == 0x22: 
+            if not device_id:
+                logger.warning("⚠️ Datos GPS recibidos sin Login previo")
+                return
+                
+            packet = self.parser.parse_gps(data)
+            packet['device_id'] = device_id
+            packet['serial'] = struct.unpack('>H', data[-6:-4])[0]
+            
+            logger.info(f"📍 GPS | ID: {device_id} | Lat: {packet['lat']}, Lng: {packet['lng']}")
+            
+            await send_to_backend(packet)
+
+        elif protocol == 0x13: 
+            logger.info(f"💓 Heartbeat | ID: {device_id or 'Desconocido'}")
+            serial = struct.unpack('>H', data[-6:-4])[0]
+            ack = self.parser.create_ack(serial)
+            writer.write(ack)
+            await writer.drain()
+        
+        elif protocol == 0x12:
+            logger.info(f"📡 LBS (Sin GPS) | ID: {device_id or 'Desconocido'}")
+            serial = struct.unpack('>H', data[-6:-4])[0]
+            ack = self.parser.create_ack(serial)
+            writer.write(ack)
+            await writer.drain()
+
+        elif protocol in (0x16, 0x26, 0x94) or header == b'\x79\x79':
+            recibido = time.monotonic()
+            logger.warning(f"🔔 ALARMA Recibida | ID: {device_id or 'Desconocido'}")
+            if len(data) > 6:
+                serial = struct.unpack('>H', data[-6:-4])[0]
+                ack = self.parser.create_ack(serial)
+                writer.write(ack)
+                await writer.drain()
+
+            if not device_id:
+                logger.warning("⚠️ Alarma recibida sin Login previo")
+                return
+            alarma = self.parser.parse_alarm(data)
+            alarma['device_id'] = device_id
+            # Carril prioritario: no espera detrás del buffer de GPS
+            send_alarm(alarma, recibido)
+
     async def run(self):
         logger.info(f"🚀 Iniciando servidor TCP en {settings.TCP_HOST}:{settings.TCP_PORT}")
         server = await asyncio.start_server(
@@ -1,12 +1,23 @@
-import socket
-import threading
-import time
+"""Simulador de equipos GT06 sobre asyncio.
+
+Cada dispositivo virtual es una corrutina con su propia conexión TCP: hace
+login, reporta posiciones siguiendo una ruta plausible y manda heartbeats.
+Una sola instancia maneja decenas de miles de equipos.
+
+    python tracker_sim.py --host 127.0.0.1 --puerto 5023 --dispositivos 10000 --intervalo 10
+
+Para medir el sistema completo (tracker_server + backend falso) usar prueba_carga.py.
+"""
+import argparse
+import asyncio
 import logging
 import math
-from datetime import datetime, timezone
 import random
-import struct
 import ssl
+import struct
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
 
 logging.basicConfig(
     level=logging.INFO,
@@ -14,168 +25,302 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Dispositivos reales
-DISPOSITIVOS = [
-    {
-        "imei": "36377367",
-        "patente": "AA123CV"
-    },
-    {
-        "imei": "31313131",
-        "patente": "AB256FG"
-    },
-    {
-        "imei": "38393939",
-        "patente": "AG845FR"
-    }
-]
-
-# Ruta Rosario -> Cordoba
-RUTA = [(-32.716774, -60.727609), (-31.466840, -64.101087)]
-
-def crear_paquete_login(imei: str) -> bytes:
-    """Crea paquete de login con formato correcto"""
-    device_id = imei[:8].ljust(8, '0')[:8]
-    if len(device_id) != 8:
-        raise ValueError("El imei debe tener al menos 8 caracteres")
-    
-    return (
-        bytes.fromhex("7878") +         # Header
-        bytes([0x11]) +                 # Length
-        bytes([0x01]) +                 # Protocol
-        device_id.encode('ascii') +     # Device ID
-        bytes.fromhex("000000000000") + # Datos fijos
-        bytes.fromhex("0D0A")           # End
-    )
+# Zona de partida de las rutas (entre Rosario y Córdoba)
+ZONA = ((-33.2, -64.3), (-31.3, -60.6))
+RADIO_TIERRA_M = 6371000.0
+
+# Tabla del CRC-ITU (X.25) que usa GT06
+_TABLA_CRC = []
+for _i in range(256):
+    _crc = _i << 8
+    for _ in range(8):
+        _crc = ((_crc << 1) ^ 0x1021) if _crc & 0x8000 else _crc << 1
+    _TABLA_CRC.append(_crc & 0xFFFF)
 
-def crear_paquete_gps(imei: str, lat: float, lng: float, speed: float, course: float) -> bytes:
-    """Crea paquete GPS con formato compatible"""
-    now = datetime.now(timezone.utc)
-    device_id = imei[:8].ljust(8, '0')[:8]
-    
-    # Convertir coordenadas
-    lat_int = int(lat * 1000000)
-    lng_int = int(lng * 1000000)
-    
-    # Construir paquete
-    return (
-        bytes.fromhex("7878") +
-        bytes([0x22]) +                           # Length
-        bytes([0x22]) +                           # Protocol
-        device_id.encode('ascii') +               # Device ID
-        bytes([now.year - 2000]) +                # Year
-        bytes([now.month]) +                      # Month
-        bytes([now.day]) +                        # Day
-        bytes([now.hour]) +                       # Hour
-        bytes([now.minute]) +                     # Minute
-        bytes([now.second]) +                     # Second
-        lat_int.to_bytes(4, 'big', signed=True) + # Latitude
-        lng_int.to_bytes(4, 'big', signed=True) + # Longitude
-        bytes([min(int(speed), 255)]) +           # Speed
-        struct.pack('>H', int(course) % 360) +    # Course
-        bytes([0x80]) +                           # Flags (alta precision)
-        bytes([0, 0]) +                           # Altitude
-        bytes([5]) +                              # Accuracy
-        bytes.fromhex("0000") +                   # Checksum (simulado)
-        bytes.fromhex("0D0A")                     # End
+def crc_itu(data: bytes) -> int:
+    crc = 0xFFFF
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ _TABLA_CRC[((crc >> 8) ^ byte) & 0xFF]
+    return crc
+
+def _empaquetar(protocolo: int, contenido: bytes, serial: int) -> bytes:
+    """78 78 | largo | protocolo | contenido | serial | CRC | 0D 0A"""
+    cuerpo = bytes([len(contenido) + 5, protocolo]) + contenido + struct.pack('>H', serial)
+    return b'\x78\x78' + cuerpo + struct.pack('>H', crc_itu(cuerpo)) + b'\x0d\x0a'
+
+def id_terminal(imei: str) -> str:
+    """Como lo informa el servidor: los 8 bytes BCD del login en hexadecimal"""
+    return imei.zfill(16)
+
+def paquete_login(imei: str, serial: int) -> bytes:
+    return _empaquetar(0x01, bytes.fromhex(id_terminal(imei)), serial)
+
+def paquete_heartbeat(serial: int) -> bytes:
+    # Estado del terminal, voltaje, señal GSM, alarma/idioma
+    return _empaquetar(0x13, bytes([0x46, 0x06, 0x04, 0x00, 0x02]), serial)
+
+def paquete_gps(lat: float, lng: float, velocidad: float, rumbo: float, serial: int, marca: Optional[datetime] = None) -> bytes:
+    """Paquete 0x22 con la codificación que espera parse_gps: minutos * 30000, con signo"""
+    marca = marca or datetime.now(timezone.utc)
+    contenido = (
+        bytes([marca.year - 2000, marca.month, marca.day, marca.hour, marca.minute, marca.second])
+        + bytes([0xC9])                                      # largo info GPS + satélites
+        + struct.pack('>i', round(lat * 60 * 30000))
+        + struct.pack('>i', round(lng * 60 * 30000))
+        + bytes([min(int(velocidad), 255)])
+        + struct.pack('>H', 0x1000 | (int(rumbo) % 360))     # posicionado + rumbo
+        + bytes.fromhex("02D2" "07" "1F40" "00A1B2")         # MCC, MNC, LAC, Cell ID
+        + bytes([0x01, 0x00, 0x00])                          # ACC, modo de subida, tiempo real
     )
+    return _empaquetar(0x22, contenido, serial)
+
+class Ruta:
+    """Movimiento plausible: acelera y frena suave, dobla en esquinas y se detiene a ratos"""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        (lat_min, lng_min), (lat_max, lng_max) = ZONA
+        self.lat = rng.uniform(lat_min, lat_max)
+        self.lng = rng.uniform(lng_min, lng_max)
+        self.rumbo = rng.uniform(0, 360)
+        self.velocidad = 0.0                       # km/h
+        self.crucero = rng.uniform(40, 110)
+        self.detenido_hasta = 0.0
+
+    def avanzar(self, dt: float) -> None:
+        ahora = time.monotonic()
+        if ahora < self.detenido_hasta:
+            self.velocidad = 0.0
+            return
+        if self.velocidad > 5 and self.rng.random() < 0.01:
+            # Semáforo, entrega o descanso
+            self.detenido_hasta = ahora + self.rng.uniform(30, 600)
+            self.velocidad = 0.0
+            return
+
+        # Aceleración acotada (< 2.5 m/s²) hacia la velocidad crucero
+        maximo = 2.5 * 3.6 * dt
+        self.velocidad += max(-maximo, min(maximo, self.crucero - self.velocidad + self.rng.gauss(0, 5)))
+        self.velocidad = max(0.0, self.velocidad)
+        if self.rng.random() < 0.05:
+            self.rumbo = (self.rumbo + self.rng.choice((-90, 90))) % 360
+            self.crucero = self.rng.uniform(40, 110)
+        else:
+            self.rumbo = (self.rumbo + self.rng.gauss(0, 3)) % 360
+
+        distancia = self.velocidad / 3.6 * dt
+        rumbo = math.radians(self.rumbo)
+        self.lat += math.degrees(distancia * math.cos(rumbo) / RADIO_TIERRA_M)
+        self.lng += math.degrees(distancia * math.sin(rumbo) / (RADIO_TIERRA_M * math.cos(math.radians(self.lat))))
+
+class Simulador:
+    """Conjunto de equipos virtuales contra un servidor GT06.
 
-def simular_vehiculo(imei: str, patente: str, host: str, port: int):
-    """Simula un vehiculo enviando datos realistas"""
-    
+    - intervalo: segundos entre posiciones (con ±10% de jitter).
+    - heartbeat_cada: un heartbeat cada tantas posiciones.
+    - prob_partir: probabilidad de mandar un paquete en dos writes.
+    - prob_agrupar: probabilidad de retener una posición y mandarla junto con
+      la siguiente en un solo write (como un equipo que vacía su memoria).
+
+    Guarda la hora de envío de cada posición, por (id de terminal, serial),
+    para medir la latencia de punta a punta.
+    """
+
+    def __init__(self, host: str, puerto: int, dispositivos: int, intervalo: float = 10.0,
+                 heartbeat_cada: int = 6, prob_partir: float = 0.0, prob_agrupar: float = 0.0,
+                 conexiones_por_seg: float = 500.0, tls: bool = False, semilla: int = 1,
+                 primer_imei: int = 860000000000000):
+        self.host = host
+        self.puerto = puerto
+        self.dispositivos = dispositivos
+        self.intervalo = intervalo
+        self.heartbeat_cada = heartbeat_cada
+        self.prob_partir = prob_partir
+        self.prob_agrupar = prob_agrupar
+        self.conexiones_por_seg = conexiones_por_seg
+        self.ssl = ssl.create_default_context() if tls else None
+        self.semilla = semilla
+        self.primer_imei = primer_imei
+
+        self.enviados: Dict[Tuple[str, int], float] = {}
+        self.paquetes = {"login": 0, "gps": 0, "heartbeat": 0}
+        self.writes = 0
+        self.partidos = 0
+        self.agrupados = 0
+        self.acks = 0
+        self.conectados = 0
+        self.max_conectados = 0
+        self.errores_conexion = 0
+        self.desconexiones = 0
+        self._fin = asyncio.Event()
+
+    def detener(self) -> None:
+        self._fin.set()
+
+    async def ejecutar(self, duracion: Optional[float] = None) -> None:
+        tareas = [asyncio.create_task(self._dispositivo(i)) for i in range(self.dispositivos)]
+        try:
+            if duracion is None:
+                await self._fin.wait()
+            else:
+                try:
+                    await asyncio.wait_for(self._fin.wait(), duracion)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._fin.set()
+            for tarea in tareas:
+                tarea.cancel()
+            await asyncio.gather(*tareas, return_exceptions=True)
+
+    async def _esperar(self, segundos: float) -> bool:
+        """Dormir; False si el simulador se detuvo mientras tanto"""
+        try:
+            await asyncio.wait_for(self._fin.wait(), segundos)
+            return False
+        except asyncio.TimeoutError:
+            return True
+
+    async def _leer_acks(self, reader: asyncio.StreamReader) -> None:
+        while True:
+            datos = await reader.read(4096)
+            if not datos:
+                return
+            self.acks += datos.count(b'\x78\x78\x05')
+
+    async def _escribir(self, writer: asyncio.StreamWriter, terminal: str, paquetes: List[Tuple[str, int, bytes]], rng: random.Random) -> None:
+        ahora = time.time()
+        for tipo, serial, _ in paquetes:
+            self.paquetes[tipo] += 1
+            if tipo == "gps":
+                self.enviados[(terminal, serial)] = ahora
+
+        if len(paquetes) > 1:
+            self.agrupados += 1
+            bloques = [b"".join(p for _, _, p in paquetes)]
+        else:
+            bloques = [paquetes[0][2]]
+
+        for bloque in bloques:
+            if rng.random() < self.prob_partir:
+                corte = rng.randint(1, len(bloque) - 1)
+                writer.write(bloque[:corte])
+                await writer.drain()
+                await asyncio.sleep(rng.uniform(0.002, 0.02))
+                writer.write(bloque[corte:])
+                self.partidos += 1
+                self.writes += 2
+            else:
+                writer.write(bloque)
+                self.writes += 1
+        await writer.drain()
+
+    async def _dispositivo(self, indice: int) -> None:
+        rng = random.Random(self.semilla * 1_000_003 + indice)
+        imei = str(self.primer_imei + indice)
+        terminal = id_terminal(imei)
+        ruta = Ruta(rng)
+        serial = 0
+
+        # Rampa de conexiones para no desbordar el backlog del servidor
+        if not await self._esperar(indice / self.conexiones_por_seg):
+            return
+
+        espera_reconexion = 1.0
+        while not self._fin.is_set():
+            try:
+                reader, writer = await asyncio.open_connection(
+                    self.host, self.puerto, ssl=self.ssl,
+                    server_hostname=self.host if self.ssl else None
+                )
+            except OSError:
+                self.errores_conexion += 1
+                if not await self._esperar(espera_reconexion * rng.uniform(0.5, 1.5)):
+                    return
+                espera_reconexion = min(espera_reconexion * 2, 30.0)
+                continue
+
+            espera_reconexion = 1.0
+            self.conectados += 1
+            self.max_conectados = max(self.max_conectados, self.conectados)
+            lector = asyncio.create_task(self._leer_acks(reader))
+            try:
+                serial = (serial + 1) & 0xFFFF
+                await self._escribir(writer, terminal, [("login", serial, paquete_login(imei, serial))], rng)
+                # Desfasar los reportes de los distintos equipos
+                if not await self._esperar(rng.uniform(0, self.intervalo)):
+                    return
+
+                retenidos: List[Tuple[str, int, bytes]] = []
+                reportes = 0
+                ultimo = time.monotonic()
+                while not self._fin.is_set():
+                    ahora = time.monotonic()
+                    ruta.avanzar(ahora - ultimo)
+                    ultimo = ahora
+                    serial = (serial + 1) & 0xFFFF
+                    paquetes = retenidos + [("gps", serial, paquete_gps(ruta.lat, ruta.lng, ruta.velocidad, ruta.rumbo, serial))]
+                    reportes += 1
+                    if self.heartbeat_cada and reportes % self.heartbeat_cada == 0:
+                        serial = (serial + 1) & 0xFFFF
+                        paquetes.append(("heartbeat", serial, paquete_heartbeat(serial)))
+
+                    if not retenidos and rng.random() < self.prob_agrupar:
+                        retenidos = paquetes
+                    else:
+                        retenidos = []
+                        await self._escribir(writer, terminal, paquetes, rng)
+
+                    if not await self._esperar(self.intervalo * rng.uniform(0.9, 1.1)):
+                        return
+            except (ConnectionError, OSError):
+                self.desconexiones += 1
+            finally:
+                self.conectados -= 1
+                lector.cancel()
+                writer.close()
+
+    def estadisticas(self) -> dict:
+        return {
+            "paquetes": dict(self.paquetes),
+            "writes": self.writes,
+            "partidos": self.partidos,
+            "agrupados": self.agrupados,
+            "acks": self.acks,
+            "conectados": self.conectados,
+            "max_conectados": self.max_conectados,
+            "errores_conexion": self.errores_conexion,
+            "desconexiones": self.desconexiones,
+        }
+
+async def _principal(args) -> None:
+    simulador = Simulador(
+        args.host, args.puerto, args.dispositivos, args.intervalo, args.heartbeat_cada,
+        args.prob_partir, args.prob_agrupar, args.conexiones_por_seg, args.tls, args.semilla
+    )
+    tarea = asyncio.create_task(simulador.ejecutar(args.duracion))
     try:
-        # 1. Configuración SSL
-        context = ssl.create_default_context()
-        
-        # OJO: Si te da error de certificado (SSL: CERTIFICATE_VERIFY_FAILED),
-        # descomenta estas dos lineas para pruebas:
-        # context.check_hostname = False
-        # context.verify_mode = ssl.CERT_NONE
-
-        # 2. Socket crudo
-        raw_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        
-        # 3. Envolver y Conectar
-        with context.wrap_socket(raw_socket, server_hostname=host) as s:
-            s.connect((host, port))
-            
-            # Enviar login
-            login_pkt = crear_paquete_login(imei)
-            s.sendall(login_pkt)
-            logger.info(f"✅ {patente}: Conectado a la nube y Login enviado")
-            
-            # Inicializar posición
-            lat, lng = RUTA[0]
-            lat += random.uniform(-0.01, 0.01)
-            lng += random.uniform(-0.01, 0.01)
-            
-            while True:
-                last_lat, last_lng = lat, lng
-                
-                # Movimiento hacia el destino
-                destino_lat, destino_lng = RUTA[1]
-                lat += (destino_lat - lat) * random.uniform(0.0001, 0.001)
-                lng += (destino_lng - lng) * random.uniform(0.0001, 0.001)
-                
-                # Cálculos
-                distancia_recorrida_km = haversine(last_lng, last_lat, lng, lat)
-                speed = min(90, (distancia_recorrida_km * 3600 / 10))
-                course = math.degrees(math.atan2(lng - last_lng, lat - last_lat)) % 360
-                
-                # Enviar paquete GPS
-                gps_pkt = crear_paquete_gps(imei, lat, lng, speed, course)
-                s.sendall(gps_pkt)
-                logger.info(f"📡 {patente}: Enviado -> Pos {lat:.4f},{lng:.4f} | Vel: {speed:.1f}")
-                
-                time.sleep(10)
-                
-    except Exception as e:
-        logger.error(f"❌ Error con {patente}: {e}")
-        # Pequeña pausa para no saturar la CPU si falla en bucle
-        time.sleep(5)
-
-def haversine(lon1, lat1, lon2, lat2):
-    """Calcula la distancia en km entre dos puntos geográficos"""
-    from math import radians, sin, cos, sqrt, asin
-    
-    # Convertir grados a radianes
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-    
-    # Diferencias
-    dlon = lon2 - lon1 
-    dlat = lat2 - lat1 
-    
-    # Fórmula Haversine
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a)) 
-    r = 6371  # Radio de la Tierra en km
-    return c * r
+        while not tarea.done():
+            await asyncio.wait({tarea}, timeout=10)
+            logger.info(f"📡 {simulador.estadisticas()}")
+    finally:
+        simulador.detener()
+        await tarea
 
 if __name__ == "__main__":
-    HOST_NUBE = "sistema-tracking-tcp.fly.dev" 
-    PUERTO_NUBE = 443
-
-    threads = []
-    
-    logger.info(f"🚀 Iniciando simulación hacia {HOST_NUBE}:{PUERTO_NUBE}")
-
-    for dispositivo in DISPOSITIVOS:
-        thread = threading.Thread(
-            target=simular_vehiculo,
-            args=(
-                dispositivo["imei"],
-                dispositivo["patente"],
-                HOST_NUBE,    # <--- Usamos la IP de la nube
-                PUERTO_NUBE   # <--- Puerto 5023
-            ),
-            daemon=True
-        )
-        thread.start()
-        threads.append(thread)
-        time.sleep(0.5) # Pequeña pausa para no saturar el inicio
-    
+    parser = argparse.ArgumentParser(description="Simulador de equipos GT06")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=5023)
+    parser.add_argument("--dispositivos", type=int, default=100)
+    parser.add_argument("--intervalo", type=float, default=10.0, help="Segundos entre posiciones")
+    parser.add_argument("--heartbeat-cada", type=int, default=6, help="Un heartbeat cada N posiciones (0 = ninguno)")
+    parser.add_argument("--prob-partir", type=float, default=0.0, help="Probabilidad de partir un paquete en dos writes")
+    parser.add_argument("--prob-agrupar", type=float, default=0.0, help="Probabilidad de juntar dos reportes en un write")
+    parser.add_argument("--conexiones-por-seg", type=float, default=500.0)
+    parser.add_argument("--duracion", type=float, default=None, help="Segundos; sin valor corre hasta Ctrl+C")
+    parser.add_argument("--tls", action="store_true", help="Conectar por TLS (p. ej. el servidor publicado en el puerto 443)")
+    parser.add_argument("--semilla", type=int, default=1)
     try:
-        while True:
-            time.sleep(1)
+        asyncio.run(_principal(parser.parse_args()))
     except KeyboardInterrupt:
-        logger.info("\nDeteniendo simulaciones...")
\ No newline at end of file
+        logger.info("Deteniendo simulación...")